@@ -6,20 +6,24 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'pyrekordbox-0.4.4'))
 
 from pyrekordbox import Rekordbox6Database
-
-# The corrupted IDs
-corrupted_ids = [
-    '429fb816-f40b-4e08-b33f-8100bb0f6c9e',
-    '9520eaab-6ad4-463d-bf1e-afe368915c2d',
-    '95411043-4554-4374-8436-8782d157ee23',
-    'c17580c3-612b-468e-843e-be46c87b48f2',
-    'e06ecc1e-07f1-478b-a649-2c698ac8948a'
-]
+from rekordbox_bridge import RekordboxBridge
 
 try:
     print("Opening Rekordbox database...")
     db = Rekordbox6Database()
     
+    # Locate unreadable playlist entries with the bridge's corruption scanner
+    bridge = RekordboxBridge()
+    bridge.db = db
+    report = bridge.scan_corruption(["djmdSongPlaylist"])
+    if not report["success"]:
+        raise RuntimeError(report["error"])
+    corrupted_ids = [
+        row["values"].get("ID", f"rowid {row['rowid']}")
+        for table in report["tables"]
+        for row in table["rows"]
+    ]
+    
     print(f"\nLooking up {len(corrupted_ids)} corrupted playlist entries:\n")
     print("=" * 80)
     
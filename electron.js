@@ -2000,20 +2000,38 @@ ipcMain.handle('search-missing-tracks-in-folder', async (_, folderPath, requests
   return results;
 });
 
-ipcMain.handle('get-anlz-data', async (_, trackPath, dbPath) => {
+// Replace {encoding: 'file'} array descriptors written by the bridge with the raw
+// bytes, so waveform arrays cross IPC as a Buffer instead of a JSON int list.
+async function loadFileArrays(value) {
+  if (!value || typeof value !== 'object') return value;
+  if (value.encoding === 'file' && value.path) {
+    const data = await fs.readFile(value.path);
+    await fs.unlink(value.path).catch(() => {});
+    // The bridge writes each call's arrays into its own directory; drop it once empty
+    await fs.rmdir(path.dirname(value.path)).catch(() => {});
+    return { encoding: 'raw', dtype: value.dtype, shape: value.shape, data };
+  }
+  for (const key of Object.keys(value)) {
+    value[key] = await loadFileArrays(value[key]);
+  }
+  return value;
+}
+
+ipcMain.handle('get-anlz-data', async (_, trackPath, dbPath, encoding) => {
   try {
     const pythonPath = process.platform === 'darwin' ? 'python3' : 'python';
     const bridgePath = getRekordboxBridgePath();
     const tempFile = path.join(os.tmpdir(), `bonk_anlz_${Date.now()}.json`);
     await fs.writeFile(tempFile, JSON.stringify({
       track_path: trackPath,
-      db_path: dbPath || null
+      db_path: dbPath || null,
+      encoding: encoding || 'json'
     }));
     const command = `${pythonPath} "${bridgePath}" get-anlz-data "@${tempFile}"`;
     const { stdout, stderr } = await execAsync(command, { maxBuffer: 4 * 1024 * 1024 });
     await fs.unlink(tempFile).catch(() => {});
     if (stderr) console.warn('get-anlz-data stderr:', stderr);
-    return JSON.parse(stdout);
+    return await loadFileArrays(JSON.parse(stdout));
   } catch (e) {
     return { success: false, error: e.message, waveform: null, cues: [], duration_ms: null };
   }
@@ -27,7 +27,7 @@ contextBridge.exposeInMainWorld('electronAPI', {
   // Audio playback handler
   readAudioFile: (filePath) => ipcRenderer.invoke('read-audio-file', filePath),
   transcodeForAudition: (filePath) => ipcRenderer.invoke('transcode-for-audition', filePath),
-  getAnlzData: (trackPath, dbPath) => ipcRenderer.invoke('get-anlz-data', trackPath, dbPath),
+  getAnlzData: (trackPath, dbPath, encoding) => ipcRenderer.invoke('get-anlz-data', trackPath, dbPath, encoding),
   // Rust audio player handlers
   rustAudioInit: () => ipcRenderer.invoke('rust-audio-init'),
   rustAudioLoad: (filePath) => ipcRenderer.invoke('rust-audio-load', filePath),
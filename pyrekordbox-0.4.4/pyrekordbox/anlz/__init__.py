@@ -2,14 +2,16 @@
 # Author: Dylan Jones
 # Date:   2023-02-01
 
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterator, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from . import structs
-from .file import AnlzFile
+from .file import AnlzFile, get_tag_data, splice_tags, write_atomic
 
-RE_ANLZ = re.compile("ANLZ[0-9]{4}.(DAT|EXT|2EX)")
+RE_ANLZ = re.compile(r"ANLZ[0-9]{4}\.(DAT|EXT|2EX)$")
 
 
 def is_anlz_file(path: Union[str, Path]) -> bool:
@@ -69,6 +71,82 @@ def get_anlz_paths(root: Union[str, Path]) -> Dict[str, Union[Path, None]]:
     return paths
 
 
+def _scan_anlz_tree(root: str) -> Dict[str, Dict[str, str]]:
+    """Walks a directory tree with `os.scandir` and collects the ANLZ file paths.
+
+    The directory entries returned by `os.scandir` already contain the file type,
+    so no additional `stat` calls are needed for each file.
+    """
+    index: Dict[str, Dict[str, str]] = dict()
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        files: Dict[str, str] = dict()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif RE_ANLZ.match(entry.name) and entry.is_file():
+                        files[os.path.splitext(entry.name)[1][1:].upper()] = entry.path
+        except OSError:
+            continue
+        if files:
+            index[directory] = files
+    return index
+
+
+def index_anlz_dirs(
+    root_dir: Union[str, Path], max_workers: Optional[int] = None
+) -> Dict[Path, Dict[str, Path]]:
+    """Indexes all ANLZ directories and the containing file paths in a single pass.
+
+    The sub-trees of the root directory (for example the ``Pxxx`` directories in
+    ``share/PIONEER/USBANLZ``) are walked in parallel threads using `os.scandir`.
+
+    Parameters
+    ----------
+    root_dir : str or Path
+        The path of the root directory.
+    max_workers : int, optional
+        The maximal number of threads used for walking the sub-trees.
+
+    Returns
+    -------
+    index : dict[Path, dict[str, Path]]
+        The ANLZ directories (sorted) mapped to the existing ANLZ file paths, with the
+        type of the ANLZ file as keys ("DAT", "EXT", "2EX").
+
+    Examples
+    --------
+    >>> index = index_anlz_dirs("share/PIONEER/USBANLZ")
+    >>> index[Path("share/PIONEER/USBANLZ/P016/0000875E")]["DAT"]
+    share/PIONEER/USBANLZ/P016/0000875E/ANLZ0000.DAT
+    """
+    root = os.fspath(root_dir)
+    index: Dict[str, Dict[str, str]] = dict()
+    subtrees: List[str] = list()
+    files: Dict[str, str] = dict()
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subtrees.append(entry.path)
+            elif RE_ANLZ.match(entry.name) and entry.is_file():
+                files[os.path.splitext(entry.name)[1][1:].upper()] = entry.path
+    if files:
+        index[root] = files
+
+    if subtrees:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for result in executor.map(_scan_anlz_tree, subtrees):
+                index.update(result)
+
+    return {
+        Path(directory): {k: Path(path) for k, path in paths.items()}
+        for directory, paths in sorted(index.items())
+    }
+
+
 def walk_anlz_dirs(root_dir: Union[str, Path]) -> Iterator[Path]:
     """Finds all ANLZ directory paths recursively.
 
@@ -82,10 +160,10 @@ def walk_anlz_dirs(root_dir: Union[str, Path]) -> Iterator[Path]:
     anlz_dir : str
         The path of a directory containing ANLZ files
     """
-    for path in Path(root_dir).rglob("*"):
-        if path.is_dir():
-            if any(is_anlz_file(f) for f in path.iterdir()):
-                yield path
+    root_dir = Path(root_dir)
+    for path in index_anlz_dirs(root_dir):
+        if path != root_dir:
+            yield path
 
 
 def walk_anlz_paths(root_dir: Union[str, Path]) -> Iterator[Tuple[Path, Dict[str, Path]]]:
@@ -105,9 +183,9 @@ def walk_anlz_paths(root_dir: Union[str, Path]) -> Iterator[Tuple[Path, Dict[str
     """
     root_dir = Path(root_dir)
     assert root_dir.exists()
-    for anlz_dir in walk_anlz_dirs(root_dir):
-        files = {k: path for k, path in get_anlz_paths(anlz_dir).items() if path}
-        yield anlz_dir, files
+    for anlz_dir, files in index_anlz_dirs(root_dir).items():
+        if anlz_dir != root_dir:
+            yield anlz_dir, files
 
 
 def read_anlz_files(root: Union[str, Path] = "") -> Dict[Path, AnlzFile]:
@@ -3,11 +3,16 @@
 # Date:   2023-02-01
 
 import logging
+import os
+import tempfile
 from collections import abc
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Iterator, List, Union
+from typing import Any, Dict, Iterator, List, Sequence, Tuple, Union
 
-from construct import Int16ub, Struct
+import numpy as np
+import numpy.typing as npt
+from construct import Int16ub, Int32ub, Struct
 
 from . import structs
 from .tags import TAGS, AbstractAnlzTag, StructNotInitializedError
@@ -15,6 +20,146 @@ from .tags import TAGS, AbstractAnlzTag, StructNotInitializedError
 logger = logging.getLogger(__name__)
 
 XOR_MASK = bytearray.fromhex("CB E1 EE FA E5 EE AD EE E9 D2 E9 EB E1 E9 F3 E8 E9 F4 E1")
+_XOR_MASK_ARRAY = np.frombuffer(XOR_MASK, dtype=np.uint8)
+
+
+@lru_cache(maxsize=64)
+def _pssi_xor_mask(size: int, len_entries: int) -> npt.NDArray[np.uint8]:
+    """Returns the tiled XOR mask for a garbled PSSI tag.
+
+    The mask repeats `XOR_MASK` over `size` bytes and adds `len_entries` to each
+    byte (modulo 256). Masks are cached since the size only depends on the number
+    of entries.
+    """
+    mask = np.resize(_XOR_MASK_ARRAY, size) + np.uint8(len_entries & 0xFF)
+    mask.flags.writeable = False
+    return mask
+
+
+def unmask_pssi(tag_data: bytes, len_tag: int) -> bytes:
+    """Removes the XOR mask of a garbled (exported) PSSI tag.
+
+    All bytes after byte 17 (`len_entries`) are XOR-masked with a pattern that is
+    generated by adding the value of `len_entries` to each byte of `XOR_MASK`.
+
+    Parameters
+    ----------
+    tag_data : bytes
+        The binary data starting at the PSSI tag.
+    len_tag : int
+        The length of the tag in bytes.
+
+    Returns
+    -------
+    data : bytes
+        The unmasked data of the tag (`len_tag` bytes).
+    """
+    len_entries = Int16ub.parse(tag_data[16:18])
+    data = np.frombuffer(tag_data, dtype=np.uint8, count=len_tag)
+    out = data.copy()
+    masked = out[18:]
+    np.bitwise_xor(masked, _pssi_xor_mask(len(masked), len_entries), out=masked)
+    return out.tobytes()
+
+
+def write_atomic(path: Union[str, Path], data: bytes) -> None:
+    """Writes data to a file through a temporary file and an atomic rename.
+
+    The temporary file is created in the directory of `path` and flushed to disk
+    before it replaces the target, so a crash never leaves a truncated file.
+
+    Parameters
+    ----------
+    path : str or Path
+        The path of the file to write.
+    data : bytes
+        The new contents of the file.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _iter_tag_spans(data: bytes) -> Iterator[Tuple[str, int, int]]:
+    """Yields the type and the start and end offsets of the tags in a raw analysis file."""
+    file_header = structs.AnlzFileHeader.parse(data)
+    i = file_header.len_header
+    while i < file_header.len_file:
+        tag_type = data[i : i + 4].decode("ascii")
+        len_tag = Int32ub.parse(data[i + 8 : i + 12])
+        yield tag_type, i, i + len_tag
+        i += len_tag
+
+
+def get_tag_data(data: bytes, tag_type: str) -> List[bytes]:
+    """Returns the binary data of all tags of a type in a raw Rekordbox analysis file.
+
+    Only the tag headers are read, which is much cheaper than parsing the whole file
+    with :class:`AnlzFile` when a single tag is needed.
+
+    Parameters
+    ----------
+    data : bytes
+        The binary contents of a Rekordbox analysis file.
+    tag_type : str
+        The four-letter type of the tags, for example 'PPTH'.
+
+    Returns
+    -------
+    tags : list[bytes]
+        The binary data of the tags, in file order.
+    """
+    return [data[start:end] for kind, start, end in _iter_tag_spans(data) if kind == tag_type]
+
+
+def splice_tags(data: bytes, tags: Dict[str, Sequence[bytes]]) -> bytes:
+    """Replaces the binary data of tags in a raw Rekordbox analysis file.
+
+    All other bytes of the file, including tags that are not supported by the
+    parser, are kept as they are. Only `len_file` of the file header is updated.
+
+    Parameters
+    ----------
+    data : bytes
+        The binary contents of a Rekordbox analysis file.
+    tags : dict[str, Sequence[bytes]]
+        The new binary data of the tags by tag type. The n-th item replaces the
+        n-th tag of that type in the file.
+
+    Returns
+    -------
+    data : bytes
+        The binary contents with the replaced tags.
+    """
+    file_header = structs.AnlzFileHeader.parse(data)
+    chunks = [bytearray(data[: file_header.len_header])]
+    counts: Dict[str, int] = dict()
+    for tag_type, start, end in _iter_tag_spans(data):
+        n = counts.get(tag_type, 0)
+        counts[tag_type] = n + 1
+        if tag_type in tags and n < len(tags[tag_type]):
+            chunks.append(bytearray(tags[tag_type][n]))
+        else:
+            chunks.append(bytearray(data[start:end]))
+    for tag_type, items in tags.items():
+        if len(items) != counts.get(tag_type, 0):
+            raise ValueError(
+                f"Got {len(items)} '{tag_type}' tags, file contains {counts.get(tag_type, 0)}"
+            )
+    len_file = sum(len(chunk) for chunk in chunks)
+    chunks[0][8:12] = Int32ub.build(len_file)
+    return b"".join(chunks) + data[file_header.len_file :]
 
 
 class BuildFileLengthError(Exception):
@@ -126,18 +271,8 @@ class AnlzFile(abc.Mapping):  # type: ignore[type-arg]
                     logger.debug("PSSI is not garbled!")
                 else:
                     logger.debug("PSSI is garbled! (raw_mood=%s)", mood)
-                    len_entries = Int16ub.parse(tag_data[16:18])
-
-                    # Copy only this tag's data so we don't mutate the remainder of file slice
-                    mutable_tag_data = bytearray(tag_data[:len_tag])
-
-                    for x in range(len(mutable_tag_data) - 18):
-                        mask = XOR_MASK[x % len(XOR_MASK)] + len_entries
-                        if mask > 255:
-                            mask -= 256
-                        mutable_tag_data[18 + x] ^= mask
-
-                    tag_data = bytes(mutable_tag_data)
+                    # Only this tag's data is unmasked, the remainder of the file is untouched
+                    tag_data = unmask_pssi(tag_data, len_tag)
 
             try:
                 # Parse the struct
@@ -191,11 +326,11 @@ class AnlzFile(abc.Mapping):  # type: ignore[type-arg]
         return data
 
     def save(self, path: Union[str, Path] = "") -> None:
+        """Builds the file and writes it atomically (see :func:`write_atomic`)."""
         path = path or self._path
 
         data = self.build()
-        with open(path, "wb") as fh:
-            fh.write(data)
+        write_atomic(path, data)
 
     def get_tag(self, key: str) -> AbstractAnlzTag:
         return self.__getitem__(key)[0]
@@ -65,7 +65,7 @@ AnlzCuePointStatus = Enum(Int32ub, disabled=0, enabled=4)
 AnlzTagCueObjectType = Enum(Int32ub, memory=0, hotcue=1)
 
 AnlzCuePoint = Struct(
-    "type" / Const("PCPT", PaddedString(4, encoding="ascii")),
+    Const("PCPT", PaddedString(4, encoding="ascii")),  # unnamed: "type" is the cue type
     "len_header" / Int32ub,
     "len_entry" / Int32ub,
     "hot_cue" / Int32ub,  # 0 for memory
@@ -94,7 +94,7 @@ PCOB = Struct(
 # Extended (nxs2) Cue List Tag (PCO2)
 
 AnlzCuePoint2 = Struct(
-    "type" / Const("PCP2", PaddedString(4, encoding="ascii")),
+    Const("PCP2", PaddedString(4, encoding="ascii")),  # unnamed: "type" is the cue type
     "len_header" / Int32ub,
     "len_entry" / Int32ub,
     "hot_cue" / Int32ub,  # 0 for memory
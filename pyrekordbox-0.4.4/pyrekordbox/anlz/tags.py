@@ -118,13 +118,9 @@ class AbstractAnlzTag(ABC):
 
 
 def _parse_wf_preview(tag: structs.AnlzTag) -> Tuple[npt.NDArray[np.int8], npt.NDArray[np.int8]]:
-    n = len(tag.entries)
-    wf = np.zeros(n, dtype=np.int8)
-    col = np.zeros(n, dtype=np.int8)
-    for i in range(n):
-        data = tag.entries[i]
-        wf[i] = data & 0x1F
-        col[i] = data >> 5
+    data = np.asarray(tag.entries, dtype=np.uint8)
+    wf = (data & 0x1F).astype(np.int8)
+    col = (data >> 5).astype(np.int8)
     return wf, col
 
 
@@ -482,14 +478,12 @@ class PWV5AnlzTag(AbstractAnlzTag):
         hmask = 0x7C  # 000 000 000 11111 00
 
         n = self.content.len_entries
-        heights = np.zeros(n, dtype=np.int64)
-        colors = np.zeros((n, 3), dtype=np.int64)
-        for i, x in enumerate(self.content.entries):
-            red = (x & rmask) >> 12
-            green = (x & gmask) >> 10
-            blue = (x & bmask) >> 7
-            heights[i] = (x & hmask) >> 2
-            colors[i] = red, green, blue
+        x = np.asarray(self.content.entries, dtype=np.int64).reshape(n)
+        heights = (x & hmask) >> 2
+        colors = np.empty((n, 3), dtype=np.int64)
+        colors[:, 0] = (x & rmask) >> 12
+        colors[:, 1] = (x & gmask) >> 10
+        colors[:, 2] = (x & bmask) >> 7
         # Normalize heights to 1:
         heights = heights / 31
         return heights, colors
@@ -4,13 +4,18 @@
 
 import datetime
 import logging
+import os
 import secrets
+import tempfile
+import time
 from pathlib import Path
 from types import TracebackType
-from typing import Any, Callable, Dict, List, Optional, Type, TypeVar, Union
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Type, TypeVar, Union
 from uuid import uuid4
 
-from sqlalchemy import MetaData, create_engine, event, or_, select
+import numpy as np
+from sqlalchemy import MetaData, Text, create_engine, event, or_, select, type_coerce
+from sqlalchemy.ext.associationproxy import AssociationProxyInstance
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Query, Session
 from sqlalchemy.sql.sqltypes import DateTime, String
@@ -21,7 +26,7 @@ from ..utils import deobfuscate, get_rekordbox_pid
 from . import tables
 from .aux_files import MasterPlaylistXml
 from .registry import RekordboxAgentRegistry
-from .smartlist import SmartList
+from .smartlist import PROPERTY_COLUMN_MAP, SmartList, snapshot_column_kind
 from .tables import DjmdContent, DjmdPlaylist, DjmdSongPlaylist, FileType, PlaylistType
 
 try:
@@ -150,6 +155,7 @@ class Rekordbox6Database:
             url = f"sqlite+pysqlcipher://:{key}@/{db_path}?"
             engine = create_engine(url, module=sqlite3)
         else:
+            key = ""
             engine = create_engine(f"sqlite:///{db_path}")
 
         if not db_dir:
@@ -159,6 +165,7 @@ class Rekordbox6Database:
             raise FileNotFoundError(f"Database directory '{db_directory}' does not exist!")
 
         self.engine = engine
+        self._key = key
         self.session: Optional[Session] = None
 
         self.registry = RekordboxAgentRegistry(self)
@@ -546,6 +553,76 @@ class Rekordbox6Database:
         result_list.sort(key=lambda x: x.ID)
         return result_list
 
+    def _related_values(self, table: Type[tables.Base], name: str) -> Tuple[str, Dict[str, Any]]:
+        # Resolve an association proxy to its foreign key column and a `{ID: value}` map
+        proxy = getattr(table, name)
+        prop = table.__mapper__.relationships[proxy.target_collection]  # type: ignore
+        fk = next(iter(prop.local_columns)).name
+        target = prop.mapper.class_
+        if isinstance(getattr(target, proxy.value_attr), AssociationProxyInstance):
+            fk2, values = self._related_values(target, proxy.value_attr)
+            rows = self.query(target.ID, getattr(target, fk2)).all()
+            return fk, {id_: values.get(x) for id_, x in rows}
+        return fk, dict(self.query(target.ID, getattr(target, proxy.value_attr)).all())
+
+    def get_content_snapshot(self) -> Dict[str, Any]:
+        """Returns a columnar in-memory snapshot of the ``DjmdContent`` table.
+
+        The snapshot contains the content IDs and all columns used by smart playlist
+        conditions. It is used to evaluate compiled smart playlists (see
+        :meth:`SmartList.compile`) without querying the database. Numeric columns are
+        stored as float arrays (NaN for NULL), text columns and related names (e.g.
+        `ArtistName`) as object arrays with the raw database values (None for NULL)
+        and `MyTagIDs` as object array of frozensets.
+
+        Returns
+        -------
+        snapshot : dict[str, np.ndarray]
+            The column arrays by column name, all in the order of the `ID` array.
+        """
+        names = sorted(set(PROPERTY_COLUMN_MAP.values()))
+        columns = DjmdContent.__table__.columns
+        direct = [n for n in names if snapshot_column_kind(n) in ("numeric", "text")]
+        related = {
+            n: self._related_values(DjmdContent, n)
+            for n in names
+            if snapshot_column_kind(n) == "related"
+        }
+        fks = sorted({fk for fk, _ in related.values()})
+
+        selected = [columns["ID"]] + [type_coerce(columns[n], Text) for n in direct]
+        selected += [columns[fk] for fk in fks]
+        rows = self.session.execute(select(*selected)).all()  # type: ignore[union-attr]
+        values = list(zip(*rows)) if rows else [()] * len(selected)
+
+        snapshot: Dict[str, Any] = dict()
+        snapshot["ID"] = np.array(values[0], dtype=object)
+        for i, name in enumerate(direct, start=1):
+            # Columns declared as text in the table model may have numeric affinity
+            numeric = snapshot_column_kind(name) == "numeric" or all(
+                v is None or isinstance(v, (int, float)) for v in values[i]
+            )
+            if numeric:
+                col = [np.nan if v is None or v == "" else float(v) for v in values[i]]
+                snapshot[name] = np.array(col, dtype=np.float64)
+            else:
+                snapshot[name] = np.array(values[i], dtype=object)
+        fk_values = dict(zip(fks, values[len(direct) + 1 :]))
+        for name, (fk, mapping) in related.items():
+            col = [mapping.get(v) if v is not None else None for v in fk_values[fk]]
+            snapshot[name] = np.array(col, dtype=object)
+
+        if "MyTagIDs" in names:
+            tags: Dict[str, Set[str]] = dict()
+            query = self.query(tables.DjmdSongMyTag.ContentID, tables.DjmdSongMyTag.MyTagID)
+            for content_id, tag_id in query.all():
+                tags.setdefault(content_id, set()).add(str(tag_id))
+            empty: frozenset[str] = frozenset()
+            col = [frozenset(tags[cid]) if cid in tags else empty for cid in snapshot["ID"]]
+            snapshot["MyTagIDs"] = np.empty(len(col), dtype=object)
+            snapshot["MyTagIDs"][:] = col
+        return snapshot
+
     def get_cue(self, **kwargs: Any) -> Any:
         """Creates a filtered query for the ``DjmdCue`` table."""
         query = self.query(tables.DjmdCue).filter_by(**kwargs)
@@ -2288,14 +2365,47 @@ class Rekordbox6Database:
         with open(file, "w") as fp:
             json.dump(data, fp, indent=indent, sort_keys=sort_keys, default=json_serial)
 
-    def copy_unlocked(self, output_file: PathLike) -> None:
-        src_engine = self.engine
+    def copy_unlocked(
+        self,
+        output_file: PathLike,
+        tables: Optional[List[str]] = None,
+        batch_size: int = 10000,
+        indexes: bool = True,
+        progress: Optional[Callable[[str, int, int], None]] = None,
+    ) -> None:
+        """Writes an unencrypted copy of the database with generic column types.
+
+        The copy is attached to a connection of the database and each table is copied
+        with ``INSERT ... SELECT`` in batches of rowid ranges, one transaction per
+        table, so rows never pass through Python. Indexes are created after all rows
+        are loaded. Tables already in `output_file` are dropped first.
+
+        Parameters
+        ----------
+        output_file : str or Path
+            The SQLite file to write.
+        tables : list of str, optional
+            The names of the tables to copy. By default all tables are copied.
+        batch_size : int, optional
+            The size of the rowid range copied per batch.
+        indexes : bool, optional
+            If False, the indexes of the copied tables are not created.
+        progress : Callable, optional
+            Called after each batch that copied rows, and once per table when it is
+            done, as ``progress(table_name, copied_rows, total_rows)``.
+
+        Examples
+        --------
+        Write a plain copy of the tracks and playlists for analysis:
+
+        >>> db = Rekordbox6Database()
+        >>> db.copy_unlocked("tracks.db", tables=["djmdContent", "djmdSongPlaylist"])
+        """
+        from sqlalchemy.schema import CreateIndex, CreateTable
+
         src_metadata = MetaData()
         exclude_tables = ("sqlite_master", "sqlite_sequence", "sqlite_temp_master")
 
-        dst_engine = create_engine(f"sqlite:///{output_file}")
-        dst_metadata = MetaData()
-
         @event.listens_for(src_metadata, "column_reflect")
         def genericize_datatypes(inspector, tablename, column_dict):  # type: ignore # noqa: ANN202
             type_ = column_dict["type"].as_generic(allow_nulltype=True)
@@ -2303,37 +2413,179 @@ class Rekordbox6Database:
                 type_ = String
             column_dict["type"] = type_
 
-        src_conn = src_engine.connect()
-        dst_conn = dst_engine.connect()
-        dst_metadata.reflect(bind=dst_engine)
-        # drop all tables in target database
-        for table in reversed(dst_metadata.sorted_tables):
-            if table.name not in exclude_tables:
-                print("dropping table =", table.name)
-                table.drop(bind=dst_engine)
-        # Delete all data in target database
-        for table in reversed(dst_metadata.sorted_tables):
-            table.delete()
-        dst_metadata.clear()
-        dst_metadata.reflect(bind=dst_engine)
-        src_metadata.reflect(bind=src_engine)
-        # create all tables in target database
-        for table in src_metadata.sorted_tables:
-            if table.name not in exclude_tables:
-                table.create(bind=dst_engine)
-        # refresh metadata before you can copy data
-        dst_metadata.clear()
+        src_metadata.reflect(bind=self.engine)
+        names = [t.name for t in src_metadata.sorted_tables if t.name not in exclude_tables]
+        if tables is not None:
+            unknown = set(tables) - set(names)
+            if unknown:
+                raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+            names = [name for name in names if name in tables]
+
+        # Replace all tables in target database
+        dst_engine = create_engine(f"sqlite:///{output_file}")
+        dialect = dst_engine.dialect
+        quote = dialect.identifier_preparer.quote
+        dst_metadata = MetaData()
         dst_metadata.reflect(bind=dst_engine)
-        # Copy all data from src to target
-        print("Copying data...")
-        string = "\rCopying table {name}: Inserting row {row}"
-        index = 0
-        for table in dst_metadata.sorted_tables:
-            src_table = src_metadata.tables[table.name]
-            stmt = table.insert()
-            for index, row in enumerate(src_conn.execute(src_table.select())):
-                print(string.format(name=table.name, row=index), end="", flush=True)
-                dst_conn.execute(stmt.values(row))
-            print(f"\rCopying table {table.name}: Inserted {index} rows", flush=True)
-
-        dst_conn.commit()
+        dst_metadata.drop_all(bind=dst_engine)
+        dst = dst_engine.raw_connection()
+        try:
+            for name in names:
+                dst.execute(str(CreateTable(src_metadata.tables[name]).compile(dialect=dialect)))
+            dst.commit()
+        finally:
+            dst.close()
+
+        with self.engine.connect() as conn:
+            src = conn.connection.dbapi_connection
+            cur = src.cursor()
+            # An empty key keeps the attached copy unencrypted
+            cur.execute("ATTACH DATABASE ? AS copy KEY ''", (str(output_file),))
+            try:
+                for name in names:
+                    table = quote(name)
+                    columns = ", ".join(quote(c.name) for c in src_metadata.tables[name].columns)
+                    insert = (
+                        f"INSERT INTO copy.{table} ({columns}) SELECT {columns} FROM main.{table} "
+                        f"WHERE rowid BETWEEN ? AND ?"
+                    )
+                    total = cur.execute(f"SELECT count(*) FROM main.{table}").fetchone()[0]
+                    low, high = cur.execute(
+                        f"SELECT min(rowid), max(rowid) FROM main.{table}"
+                    ).fetchone()
+                    copied = 0
+                    if not src.in_transaction:
+                        cur.execute("BEGIN")
+                    start = low
+                    while low is not None and start <= high:
+                        cur.execute(insert, (start, start + batch_size - 1))
+                        copied += cur.rowcount
+                        if progress is not None and 0 < cur.rowcount and copied < total:
+                            progress(name, copied, total)
+                        start += batch_size
+                    src.commit()
+                    if progress is not None:
+                        progress(name, copied, total)
+                    logger.info("Copied table %s: %s rows", name, copied)
+            finally:
+                if src.in_transaction:
+                    src.rollback()
+                cur.execute("DETACH DATABASE copy")
+                cur.close()
+
+        if indexes:
+            dst = dst_engine.raw_connection()
+            try:
+                for name in names:
+                    for index in src_metadata.tables[name].indexes:
+                        dst.execute(str(CreateIndex(index).compile(dialect=dialect)))
+                dst.commit()
+            finally:
+                dst.close()
+        dst_engine.dispose()
+
+    def backup(
+        self,
+        output_file: PathLike,
+        key: Optional[str] = None,
+        pages: int = 256,
+        progress: Optional[Callable[[int, int], None]] = None,
+        sleep: float = 0.0,
+    ) -> None:
+        """Writes a consistent copy of the database using SQLite's online backup API.
+
+        Pages are copied in steps of `pages`, and the source is only locked while a
+        step runs, so other connections (e.g. Rekordbox) can keep working in between.
+        If the database is written to during the backup, SQLite restarts the copy,
+        so the result is always a consistent snapshot of the committed data.
+
+        Parameters
+        ----------
+        output_file : str or Path
+            The file to write. An existing file is overwritten.
+        key : str, optional
+            The encryption of the copy. By default the copy uses the same key as the
+            database. An empty string writes an unencrypted copy, any other value
+            re-encrypts the copy with that key (requires an unlocked database).
+        pages : int, optional
+            The number of pages copied per step.
+        progress : Callable, optional
+            Called after each step as ``progress(copied, total)`` with page counts.
+        sleep : float, optional
+            The time in seconds to wait between steps, which gives other connections
+            a chance to write.
+
+        Examples
+        --------
+        Write an unencrypted copy for analysis:
+
+        >>> db = Rekordbox6Database()
+        >>> db.backup("master_plain.db", key="")
+        """
+        import sqlite3 as sqlite3_std
+
+        output_file = Path(output_file)
+        if key and not self._key:
+            raise ValueError("Can't encrypt a copy of an unencrypted database")
+        module = sqlite3 if self._key else sqlite3_std
+        export = key is not None and key != self._key
+
+        def on_step(status: int, remaining: int, total: int) -> None:
+            if progress is not None:
+                progress(total - remaining, total)
+            # The `sleep` argument of `Connection.backup` only applies after a busy
+            # or locked step, so the pause between steps is taken here
+            if sleep and remaining > 0:
+                time.sleep(sleep)
+
+        if export:
+            # The backup API copies raw pages, so a copy with different encryption is
+            # exported from a private snapshot instead of the live database.
+            fd, tmp = tempfile.mkstemp(
+                prefix=f".{output_file.name}.", suffix=".tmp", dir=output_file.parent
+            )
+            os.close(fd)
+            target = Path(tmp)
+        else:
+            target = output_file
+
+        with self.engine.connect() as conn:
+            src = conn.connection.dbapi_connection
+            dst = module.connect(str(target))
+            try:
+                if self._key:
+                    dst.execute(f"PRAGMA key = '{self._key}'")
+                src.backup(dst, pages=pages, progress=on_step)
+                if export:
+                    output_file.unlink(missing_ok=True)
+                    dst.execute("ATTACH DATABASE ? AS export KEY ?", (str(output_file), key))
+                    dst.execute("SELECT sqlcipher_export('export')")
+                    dst.execute("DETACH DATABASE export")
+            finally:
+                dst.close()
+                if export:
+                    target.unlink(missing_ok=True)
+
+    def read_only_connection(self) -> Any:
+        """Opens a separate, read-only DB-API connection to the database file.
+
+        The connection is unlocked with the database key (if any) and can't take
+        write locks, so scanners and checks can use it while the database is in use.
+        The caller is responsible for closing it.
+
+        Examples
+        --------
+        >>> db = Rekordbox6Database()
+        >>> conn = db.read_only_connection()
+        >>> conn.execute("SELECT count(*) FROM djmdContent").fetchone()
+        (1234,)
+        >>> conn.close()
+        """
+        import sqlite3 as sqlite3_std
+
+        module = sqlite3 if self._key else sqlite3_std
+        uri = Path(self.engine.url.database).resolve().as_uri() + "?mode=ro"
+        conn = module.connect(uri, uri=True)
+        if self._key:
+            conn.execute(f"PRAGMA key = '{self._key}'")
+        return conn
@@ -7,10 +7,12 @@ import xml.etree.cElementTree as xml
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum, IntEnum
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Mapping, Tuple, Union
 
+import numpy as np
+import numpy.typing as npt
 from dateutil.relativedelta import relativedelta  # noqa
-from sqlalchemy import and_, not_, or_
+from sqlalchemy import Integer, TypeDecorator, and_, not_, or_
 from sqlalchemy.sql.elements import ColumnElement
 
 from .tables import DjmdContent
@@ -165,6 +167,12 @@ TYPE_CONVERSION: Dict[str, Any] = {
 
 PROPERTIES = [str(p.value) for p in list(Property)]  # noqa
 
+# Units of the `IN_LAST` and `NOT_IN_LAST` operators
+DATE_UNITS = ("day", "week", "month", "year")
+
+ContentSnapshot = Mapping[str, npt.NDArray[Any]]
+Predicate = Callable[[ContentSnapshot], npt.NDArray[np.bool_]]
+
 
 @dataclass
 class Condition:
@@ -228,6 +236,178 @@ def _get_condition_values(cond: Condition) -> Tuple[Any, Any]:
     return val_left, val_right
 
 
+def _in_last_threshold(unit: str, value: int) -> datetime:
+    """Returns the start of the time span of an `IN_LAST` or `NOT_IN_LAST` condition."""
+    if unit not in DATE_UNITS:
+        raise ValueError(f"Unknown unit '{unit}'")
+    return datetime.now() - relativedelta(**{unit + "s": value})
+
+
+def snapshot_column_kind(column_name: str) -> str:
+    """Returns how a column is stored in a content snapshot.
+
+    Parameters
+    ----------
+    column_name : str
+        The name of a column or association proxy of the ``DjmdContent`` table.
+
+    Returns
+    -------
+    kind : {"numeric", "text", "related", "tags"} str
+        ``numeric`` columns are stored as float arrays with NaN for NULL, ``text``
+        and ``related`` (association proxy) columns as object arrays with None for
+        NULL and ``tags`` (MyTag IDs) as object array of frozensets. Text columns
+        holding only numbers in the database are stored as numeric columns.
+    """
+    if column_name == "MyTagIDs":
+        return "tags"
+    column = DjmdContent.__table__.columns.get(column_name)
+    if column is None:
+        return "related"
+    if isinstance(column.type, Integer):
+        return "numeric"
+    return "text"
+
+
+def _bind_value(column_name: str, numeric: bool, value: Any) -> Any:
+    # Convert a condition value like SQLite compares it with the column
+    if value is None:
+        return None
+    if numeric:
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                return np.inf  # SQLite sorts text after all numbers
+        return value
+    if isinstance(value, datetime):
+        column = DjmdContent.__table__.columns.get(column_name)
+        if column is not None and isinstance(column.type, TypeDecorator):
+            return column.type.process_bind_param(value, None)
+        return str(value)
+    return str(value)
+
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _text_test(values: npt.NDArray[Any], func: Callable[[str], bool]) -> npt.NDArray[np.bool_]:
+    return np.fromiter(
+        (v is not None and func(v) for v in values), dtype=np.bool_, count=len(values)
+    )
+
+
+def _numeric_mask(
+    values: npt.NDArray[np.float64], op: int, left: Any, right: Any
+) -> npt.NDArray[np.bool_]:
+    with np.errstate(invalid="ignore"):
+        if op == Operator.EQUAL:
+            mask = values == left
+        elif op == Operator.NOT_EQUAL:
+            mask = values != left
+        elif op == Operator.GREATER:
+            mask = values > left
+        elif op == Operator.LESS:
+            mask = values < left
+        elif op == Operator.IN_RANGE:
+            mask = (values >= left) & (values <= right)
+        elif op in (Operator.CONTAINS, Operator.STARTS_WITH, Operator.ENDS_WITH):
+            # LIKE compares the text representation of numbers
+            text = np.array(
+                [
+                    None if np.isnan(v) else ("%d" % v if v.is_integer() else repr(v))
+                    for v in values
+                ],
+                dtype=object,
+            )
+            return _text_mask(text, op, str(left), right)
+        else:
+            raise ValueError(f"Unknown operator '{op}'")
+    return mask & ~np.isnan(values)  # type: ignore[no-any-return]
+
+
+def _text_mask(values: npt.NDArray[Any], op: int, left: Any, right: Any) -> npt.NDArray[np.bool_]:
+    if op == Operator.EQUAL:
+        return _text_test(values, lambda v: v == left)
+    elif op == Operator.NOT_EQUAL:
+        return _text_test(values, lambda v: v != left)
+    elif op == Operator.GREATER:
+        return _text_test(values, lambda v: v > left)
+    elif op == Operator.LESS:
+        return _text_test(values, lambda v: v < left)
+    elif op == Operator.IN_RANGE:
+        return _text_test(values, lambda v: left <= v <= right)
+    # LIKE is case-insensitive for ASCII characters
+    pattern = left.translate(_ASCII_LOWER)
+    if op == Operator.CONTAINS:
+        return _text_test(values, lambda v: pattern in v.translate(_ASCII_LOWER))
+    elif op == Operator.STARTS_WITH:
+        return _text_test(values, lambda v: v.translate(_ASCII_LOWER).startswith(pattern))
+    elif op == Operator.ENDS_WITH:
+        return _text_test(values, lambda v: v.translate(_ASCII_LOWER).endswith(pattern))
+    raise ValueError(f"Unknown operator '{op}'")
+
+
+def _compile_condition(cond: Condition) -> Union[Predicate, None]:
+    val_left, val_right = _get_condition_values(cond)
+    if cond.property not in PROPERTY_COLUMN_MAP:
+        logger.warning(f"Unsupported property '{cond.property}'")
+        return None
+    column_name = PROPERTY_COLUMN_MAP[cond.property]
+    op = cond.operator
+
+    if snapshot_column_kind(column_name) == "tags":
+        if op not in (Operator.CONTAINS, Operator.NOT_CONTAINS):
+            raise ValueError(f"Unknown operator '{op}'")
+        tag_id = int(val_left)
+        if tag_id < 0:
+            tag_id = right_bitshift(tag_id)
+        tag = str(tag_id)
+        negate_tag = op == Operator.NOT_CONTAINS
+
+        def tags_predicate(snapshot: ContentSnapshot) -> npt.NDArray[np.bool_]:
+            values = snapshot[column_name]
+            mask = np.fromiter((tag in v for v in values), dtype=np.bool_, count=len(values))
+            return ~mask if negate_tag else mask
+
+        return tags_predicate
+
+    if op in (Operator.IN_LAST, Operator.NOT_IN_LAST):
+        val_left = _in_last_threshold(cond.unit, val_left)
+        op = Operator.GREATER if op == Operator.IN_LAST else Operator.LESS
+    if op != Operator.IN_RANGE:
+        val_right = None
+    # `NOT CONTAINS` of an association proxy is `NOT EXISTS`, which is true for NULL
+    negate = op == Operator.NOT_CONTAINS
+    null_result = negate and snapshot_column_kind(column_name) == "related"
+    if negate:
+        op = Operator.CONTAINS
+
+    def predicate(snapshot: ContentSnapshot) -> npt.NDArray[np.bool_]:
+        values = snapshot[column_name]
+        numeric = values.dtype.kind == "f"
+        null = np.isnan(values) if numeric else np.equal(values, None)
+        if val_left is None:
+            # Comparing with an empty value is rendered as `IS NULL` / `IS NOT NULL`
+            if op == Operator.EQUAL:
+                return null  # type: ignore[no-any-return]
+            if op == Operator.NOT_EQUAL:
+                return ~null  # type: ignore[no-any-return]
+            return np.full(len(values), null_result, dtype=np.bool_)
+        like = op in (Operator.CONTAINS, Operator.STARTS_WITH, Operator.ENDS_WITH)
+        left = _bind_value(column_name, numeric and not like, val_left)
+        right = _bind_value(column_name, numeric, val_right)
+        if numeric:
+            mask = _numeric_mask(values, op, left, right)
+        else:
+            mask = _text_mask(values, op, left, right)
+        if negate:
+            return (~mask & ~null) | (null & null_result)  # type: ignore[no-any-return]
+        return mask
+
+    return predicate
+
+
 class SmartList:
     """Rekordbox smart playlist XML handler."""
 
@@ -343,25 +523,11 @@ class SmartList:
                 elif cond.operator == Operator.ENDS_WITH:
                     comp = getattr(DjmdContent, colum_name).endswith(val_left)
                 elif cond.operator == Operator.IN_LAST:
-                    now = datetime.now()
-                    if cond.unit == "day":
-                        t0 = now - relativedelta(days=val_left)
-                        comp = getattr(DjmdContent, colum_name) > t0
-                    elif cond.unit == "month":
-                        t0 = now - relativedelta(months=val_left)
-                        comp = getattr(DjmdContent, colum_name).month > t0
-                    else:
-                        raise ValueError(f"Unknown unit '{cond.unit}'")
+                    t0 = _in_last_threshold(cond.unit, val_left)
+                    comp = getattr(DjmdContent, colum_name) > t0
                 elif cond.operator == Operator.NOT_IN_LAST:
-                    now = datetime.now()
-                    if cond.unit == "day":
-                        t0 = now - relativedelta(days=val_left)
-                        comp = getattr(DjmdContent, colum_name) < t0
-                    elif cond.unit == "month":
-                        t0 = now - relativedelta(months=val_left)
-                        comp = getattr(DjmdContent, colum_name).month < t0
-                    else:
-                        raise ValueError(f"Unknown unit '{cond.unit}'")
+                    t0 = _in_last_threshold(cond.unit, val_left)
+                    comp = getattr(DjmdContent, colum_name) < t0
                 else:
                     raise ValueError(f"Unknown operator '{cond.operator}'")
                 comps.append(comp)
@@ -370,3 +536,40 @@ class SmartList:
                 logger.warning(f"Unsupported property '{cond.property}'")
 
         return logical_op(*comps)
+
+    def compile(self) -> Predicate:
+        """Compile the smart playlist into a predicate over a content snapshot.
+
+        The predicate evaluates the conditions with NumPy on a columnar in-memory
+        snapshot of the ``DjmdContent`` table (see
+        :meth:`Rekordbox6Database.get_content_snapshot`) and matches the same
+        contents as the SQL query of :meth:`filter_clause`. Unlike the SQL query,
+        `MYTAG` conditions match the tag ID exactly.
+
+        Returns
+        -------
+        predicate : Callable
+            A function that takes a snapshot and returns a boolean mask of the
+            matching contents.
+
+        Examples
+        --------
+        >>> db = Rekordbox6Database()
+        >>> snapshot = db.get_content_snapshot()
+        >>> smart = SmartList()
+        >>> smart.add_condition(Property.BPM, Operator.GREATER, "12800")
+        >>> ids = snapshot["ID"][smart.compile()(snapshot)]
+        """
+        match_all = self.logical_operator == LogicalOperator.ALL
+        predicates = [p for p in map(_compile_condition, self.conditions) if p is not None]
+
+        def predicate(snapshot: ContentSnapshot) -> npt.NDArray[np.bool_]:
+            n = len(snapshot["ID"])
+            if not predicates:
+                return np.ones(n, dtype=np.bool_)
+            mask = predicates[0](snapshot)
+            for pred in predicates[1:]:
+                mask = (mask & pred(snapshot)) if match_all else (mask | pred(snapshot))
+            return mask
+
+        return predicate
@@ -3,12 +3,15 @@
 # Date:   2023-02-01
 
 import os
+import struct
 
 import numpy as np
 import pytest
+from construct import Int16ub
 from numpy.testing import assert_equal
 
 from pyrekordbox import anlz
+from pyrekordbox.anlz.file import XOR_MASK, get_tag_data, splice_tags, unmask_pssi
 
 TEST_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".testdata")
 ANLZ_ROOT = os.path.join(TEST_ROOT, "export", "PIONEER", "USBANLZ")
@@ -37,6 +40,84 @@ def test_read_anlz_files():
         assert len(files) == len(anlz_files)
 
 
+def test_index_anlz_dirs():
+    index = anlz.index_anlz_dirs(ANLZ_ROOT, max_workers=2)
+    assert len(index) == len(ANLZ_DIRS)
+    for root, files in ANLZ_DIRS:
+        assert index[root] == files
+        assert files == {k: p for k, p in anlz.get_anlz_paths(root).items() if p}
+
+
+def test_index_anlz_dirs_root():
+    # The root itself is indexed if it contains ANLZ files
+    root, files = ANLZ_DIRS[0]
+    index = anlz.index_anlz_dirs(root)
+    assert list(index.keys()) == [root]
+    assert index[root] == files
+    assert list(anlz.walk_anlz_dirs(root)) == []
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("ANLZ0000.DAT", True),
+        ("ANLZ0001.2EX", True),
+        ("ANLZ0000.DAT.bak", False),
+        ("ANLZ0000.EXT.tmp", False),
+        ("ANLZ0000_DAT", False),
+    ],
+)
+def test_is_anlz_file(tmp_path, name, expected):
+    path = tmp_path / name
+    path.write_bytes(b"")
+    assert anlz.is_anlz_file(path) is expected
+
+
+def _unmask_pssi_reference(tag_data, len_tag):
+    # Byte-wise implementation the vectorized `unmask_pssi` has to match
+    len_entries = Int16ub.parse(tag_data[16:18])
+    data = bytearray(tag_data[:len_tag])
+    for x in range(len(data) - 18):
+        mask = XOR_MASK[x % len(XOR_MASK)] + len_entries
+        if mask > 255:
+            mask -= 256
+        data[18 + x] ^= mask
+    return bytes(data)
+
+
+@pytest.mark.parametrize("len_entries", [0, 1, 11, 19, 100, 255])
+def test_unmask_pssi(len_entries):
+    rng = np.random.default_rng(len_entries)
+    len_tag = 32 + 24 * len_entries
+    header = b"PSSI" + (32).to_bytes(4, "big") + len_tag.to_bytes(4, "big")
+    header += (24).to_bytes(4, "big") + len_entries.to_bytes(2, "big")
+    body = rng.integers(0, 256, len_tag - len(header) + 16, dtype=np.uint8).tobytes()
+    tag_data = header + body  # trailing bytes belong to the next tag
+
+    result = unmask_pssi(tag_data, len_tag)
+    assert len(result) == len_tag
+    assert result == _unmask_pssi_reference(tag_data, len_tag)
+    # The mask is an involution
+    assert unmask_pssi(result, len_tag) == tag_data[:len_tag]
+
+
+def test_parse_garbled_pssi():
+    for _, files in ANLZ_DIRS:
+        file = anlz.AnlzFile.parse_file(files["EXT"])
+        if "PSSI" not in file:
+            continue
+        data = file.build()
+        i = data.index(b"PSSI")
+        len_tag = int.from_bytes(data[i + 8 : i + 12], "big")
+        garbled = data[:i] + unmask_pssi(data[i:], len_tag) + data[i + len_tag :]
+        assert garbled != data
+
+        tag = file.get_tag("PSSI")
+        tag_garbled = anlz.AnlzFile.parse(garbled).get_tag("PSSI")
+        assert tag_garbled.content.mood == tag.content.mood
+        assert tag_garbled.content.entries == tag.content.entries
+
+
 # -- Tags ------------------------------------------------------------------------------
 
 
@@ -178,6 +259,25 @@ def test_pwv5_tag_getters(paths):
     assert len(heights) == colors.shape[0]
 
 
+def test_cue_point_rebuild():
+    values = (28, 56, 1, 4, 0x10000, 0xFFFF, 0xFFFF, 2, 0, 1000, 5000, 9000)
+    pcpt = b"PCPT" + struct.pack(">IIIIIHHBBHII", *values)
+    pcpt += b"\x00" * 16
+    entry = anlz.structs.AnlzCuePoint.parse(pcpt)
+    assert entry.type == "loop"
+    assert entry.time == 5000
+    assert anlz.structs.AnlzCuePoint.build(entry) == pcpt
+
+    comment = "Drop".encode("utf-16-be") + b"\x00\x00"
+    values = (16, 56 + len(comment), 2, 1, 7000, 0xFFFFFFFF, 3, 0, 0, len(comment))
+    pcp2 = b"PCP2" + struct.pack(">IIIB3xIIB7xHHI", *values)
+    pcp2 += comment + bytes([0x2A, 255, 0, 0]) + b"\x00" * 8
+    entry = anlz.structs.AnlzCuePoint2.parse(pcp2)
+    assert entry.type == 1
+    assert entry.comment == "Drop"
+    assert anlz.structs.AnlzCuePoint2.build(entry) == pcp2
+
+
 # -- File ------------------------------------------------------------------------------
 
 
@@ -206,3 +306,57 @@ def test_anlzfile_getall():
     values = file.getall(key)
     assert len(values) == 1
     assert values[0] == tag.get()
+
+
+def test_anlzfile_save(tmp_path):
+    paths = ANLZ_FILES[0]
+    file = anlz.AnlzFile.parse_file(paths["DAT"])
+    path = tmp_path / "ANLZ0000.DAT"
+    file.save(path)
+    assert path.read_bytes() == file.build()
+    # No temporary files are left behind
+    assert os.listdir(tmp_path) == ["ANLZ0000.DAT"]
+
+
+def test_splice_tags():
+    for _, files in ANLZ_DIRS:
+        for path in files.values():
+            with open(path, "rb") as fh:
+                data = fh.read()
+            file = anlz.AnlzFile.parse(data)
+            tags = file.getall_tags("PCOB")
+            if not tags:
+                continue
+            # Splicing the rebuilt tags reproduces the file
+            assert splice_tags(data, {"PCOB": [t.build() for t in tags]}) == data
+
+            for tag in tags:
+                for entry in tag.content.entries:
+                    entry.time += 1000
+            new_data = splice_tags(data, {"PCOB": [t.build() for t in tags]})
+            new_file = anlz.AnlzFile.parse(new_data)
+            assert new_file.file_header.len_file == len(new_data)
+            for old_tag, new_tag in zip(tags, new_file.getall_tags("PCOB")):
+                assert [e.time for e in new_tag.content.entries] == [
+                    e.time for e in old_tag.content.entries
+                ]
+            assert new_file.get("PPTH") == file.get("PPTH")
+
+
+def test_get_tag_data():
+    for _, files in ANLZ_DIRS:
+        for path in files.values():
+            with open(path, "rb") as fh:
+                data = fh.read()
+            file = anlz.AnlzFile.parse(data)
+            for tag_type in ("PPTH", "PCOB"):
+                expected = [t.build() for t in file.getall_tags(tag_type)]
+                assert get_tag_data(data, tag_type) == expected
+
+
+def test_splice_tags_count_mismatch():
+    paths = ANLZ_FILES[0]
+    with open(paths["DAT"], "rb") as fh:
+        data = fh.read()
+    with pytest.raises(ValueError):
+        splice_tags(data, {"PCOB": []})
@@ -4,7 +4,9 @@
 
 import os
 import shutil
+import sqlite3
 import tempfile
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -1107,6 +1109,115 @@ def test_get_playlist_contents_smart(db):
     assert {c.ID for c in contents} == {str(CID1), str(CID2), str(CID3)}
 
 
+def test_get_content_snapshot():
+    snapshot = DB.get_content_snapshot()
+    contents = DB.get_content().all()
+    assert len(snapshot["ID"]) == len(contents)
+    for i, cid in enumerate(snapshot["ID"]):
+        content = DB.get_content(ID=cid)
+        assert snapshot["Title"][i] == content.Title
+        assert snapshot["BPM"][i] == content.BPM
+        assert snapshot["ArtistName"][i] == content.ArtistName
+        assert snapshot["MyTagIDs"][i] == frozenset(content.MyTagIDs)
+
+
+@pytest.fixture
+def smart_db(db):
+    """Database with some varied content data for comparing smart list queries."""
+    genre = db.add_genre("Techno")
+    db.flush()
+    c1 = db.get_content(ID=CID1)
+    c1.Rating = 3
+    c1.DJPlayCount = 10
+    c1.GenreID = genre.ID
+    c1.StockDate = "2022-04-10"
+    c2 = db.get_content(ID=CID2)
+    c2.Rating = 5
+    c2.DJPlayCount = 2
+    c2.ReleaseDate = "2021-01-01"
+    c4 = db.get_content(ID=CID4)
+    c4.created_at = datetime.now()
+    now = datetime_to_str(datetime.now())
+    for i, (cid, tag_id) in enumerate([(CID1, "1013096925"), (CID3, "2059253088")]):
+        db.session.execute(
+            text(
+                "INSERT INTO djmdSongMyTag (ID, MyTagID, ContentID, TrackNo, UUID, rb_local_usn, "
+                "created_at, updated_at) VALUES (:id, :tag, :cid, 1, :uuid, 1, :now, :now)"
+            ),
+            {"id": str(900 + i), "tag": tag_id, "cid": str(cid), "uuid": str(i), "now": now},
+        )
+    db.flush()
+    return db
+
+
+SMART_CONDITIONS = [
+    (Property.ARTIST, Operator.EQUAL, "Loopmasters", "", ""),
+    (Property.ARTIST, Operator.NOT_EQUAL, "Loopmasters", "", ""),
+    (Property.ARTIST, Operator.CONTAINS, "LOOP", "", ""),
+    (Property.ARTIST, Operator.NOT_CONTAINS, "loop", "", ""),
+    (Property.ARTIST, Operator.STARTS_WITH, "loop", "", ""),
+    (Property.ARTIST, Operator.ENDS_WITH, "ters", "", ""),
+    (Property.NAME, Operator.EQUAL, "HORN", "", ""),
+    (Property.NAME, Operator.CONTAINS, "demo", "", ""),
+    (Property.NAME, Operator.NOT_CONTAINS, "demo", "", ""),
+    (Property.FILENAME, Operator.ENDS_WITH, ".mp3", "", ""),
+    (Property.COMMENTS, Operator.CONTAINS, "www", "", ""),
+    (Property.GENRE, Operator.EQUAL, "Techno", "", ""),
+    (Property.GENRE, Operator.NOT_CONTAINS, "tech", "", ""),
+    (Property.KEY, Operator.CONTAINS, "A", "", ""),
+    (Property.GROUPING, Operator.EQUAL, "0", "", ""),
+    (Property.BPM, Operator.GREATER, "12500", "", ""),
+    (Property.BPM, Operator.LESS, "12500", "", ""),
+    (Property.BPM, Operator.IN_RANGE, "12000", "12800", ""),
+    (Property.RATING, Operator.EQUAL, "3", "", ""),
+    (Property.RATING, Operator.NOT_EQUAL, "3", "", ""),
+    (Property.COUNTER, Operator.GREATER, "5", "", ""),
+    (Property.COUNTER, Operator.IN_RANGE, "1", "5", ""),
+    (Property.DURATION, Operator.GREATER, "100", "", ""),
+    (Property.YEAR, Operator.EQUAL, "0", "", ""),
+    (Property.STOCK_DATE, Operator.GREATER, "2022-04-09", "", ""),
+    (Property.STOCK_DATE, Operator.LESS, "2022-04-10", "", ""),
+    (Property.DATE_RELEASED, Operator.IN_RANGE, "2020-01-01", "2022-01-01", ""),
+    (Property.DATE_CREATED, Operator.GREATER, "2022-04-09", "", ""),
+    (Property.DATE_CREATED, Operator.IN_LAST, "1", "", "day"),
+    (Property.DATE_CREATED, Operator.NOT_IN_LAST, "2", "", "week"),
+    (Property.DATE_CREATED, Operator.IN_LAST, "1", "", "month"),
+    (Property.DATE_CREATED, Operator.NOT_IN_LAST, "1", "", "year"),
+    (Property.MYTAG, Operator.CONTAINS, "1013096925", "", ""),
+    (Property.MYTAG, Operator.NOT_CONTAINS, "1013096925", "", ""),
+]
+
+
+def _smart_ids(db, smart):
+    query = db.query(tables.DjmdContent.ID).filter(smart.filter_clause())
+    expected = {row[0] for row in query.all()}
+    snapshot = db.get_content_snapshot()
+    actual = set(snapshot["ID"][smart.compile()(snapshot)])
+    return expected, actual
+
+
+@mark.parametrize("prop,op,left,right,unit", SMART_CONDITIONS)
+def test_smartlist_compile(smart_db, prop, op, left, right, unit):
+    smart = SmartList()
+    smart.add_condition(prop, op, left, right, unit)
+    expected, actual = _smart_ids(smart_db, smart)
+    assert actual == expected
+
+
+@mark.parametrize("logical_op", [LogicalOperator.ALL, LogicalOperator.ANY])
+def test_smartlist_compile_logical(smart_db, logical_op):
+    smart = SmartList(logical_op)
+    smart.add_condition(Property.ARTIST, Operator.EQUAL, "Loopmasters")
+    smart.add_condition(Property.RATING, Operator.GREATER, "4")
+    smart.add_condition(Property.MYTAG, Operator.CONTAINS, "2059253088")
+    expected, actual = _smart_ids(smart_db, smart)
+    assert actual == expected
+    if logical_op == LogicalOperator.ALL:
+        assert actual == set()
+    else:
+        assert actual == {str(CID1), str(CID2), str(CID3)}
+
+
 def test_add_album(db):
     old_usn = db.get_local_usn()
     name = "test"
@@ -1234,3 +1345,118 @@ def test_copy_unlocked():
                 query = db2.query(table).filter_by(ID=row.ID)
             data2 = query.one().to_dict()
             assert data == data2
+
+
+def test_copy_unlocked_tables():
+    db = Rekordbox6Database(LOCKED, unlock=True)
+    tmpdir = tempfile.mkdtemp()
+    calls = []
+    try:
+        out = os.path.join(tmpdir, "plain.db")
+        names = ["djmdContent", "djmdSongPlaylist"]
+        db.copy_unlocked(out, tables=names, batch_size=2, progress=lambda *args: calls.append(args))
+        # Progress is reported per batch, the last call of each table has the totals
+        n_content = db.get_content().count()
+        assert ("djmdContent", n_content, n_content) in calls
+        assert all(name in names and copied <= total for name, copied, total in calls)
+
+        conn = sqlite3.connect(out)
+        try:
+            query = "SELECT name FROM sqlite_master WHERE type = ?"
+            assert {row[0] for row in conn.execute(query, ("table",))} == set(names)
+            assert conn.execute("SELECT count(*) FROM djmdContent").fetchone()[0] == n_content
+            assert conn.execute(query, ("index",)).fetchall()
+        finally:
+            conn.close()
+
+        # Without indexes, only the ones backing constraints exist
+        db.copy_unlocked(out, tables=["djmdContent"], indexes=False)
+        conn = sqlite3.connect(out)
+        try:
+            rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+            assert all(row[0].startswith("sqlite_autoindex") for row in rows)
+        finally:
+            conn.close()
+
+        with pytest.raises(ValueError):
+            db.copy_unlocked(out, tables=["djmdNope"])
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir)
+
+
+def test_backup():
+    db = Rekordbox6Database(UNLOCKED, unlock=False)
+    tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    tmp.close()
+    steps = []
+    try:
+        db.backup(tmp.name, pages=16, progress=lambda copied, total: steps.append((copied, total)))
+        assert len(steps) > 1
+        assert steps[-1][0] == steps[-1][1]
+
+        db2 = Rekordbox6Database(tmp.name, unlock=False)
+        assert db2.get_content().count() == db.get_content().count()
+        db2.close()
+
+        # An unencrypted database can't be re-encrypted
+        with pytest.raises(ValueError):
+            db.backup(tmp.name, key="402fd")
+    finally:
+        db.close()
+        os.remove(tmp.name)
+
+
+def test_backup_sleep():
+    db = Rekordbox6Database(UNLOCKED, unlock=False)
+    tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    tmp.close()
+    steps = []
+    try:
+        t0 = time.perf_counter()
+        db.backup(tmp.name, pages=64, progress=lambda *args: steps.append(args), sleep=0.01)
+        elapsed = time.perf_counter() - t0
+        # The pause is taken between steps, not after the last one
+        assert len(steps) > 2
+        assert elapsed >= 0.01 * (len(steps) - 1)
+    finally:
+        db.close()
+        os.remove(tmp.name)
+
+
+def test_backup_encrypted():
+    db = Rekordbox6Database(LOCKED, unlock=True)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # Same key: raw page copy
+        locked_copy = os.path.join(tmpdir, "locked.db")
+        db.backup(locked_copy)
+        db2 = Rekordbox6Database(locked_copy, unlock=True)
+        assert db2.get_content().count() == db.get_content().count()
+        db2.close()
+
+        # Empty key: exported as a plain SQLite file
+        plain_copy = os.path.join(tmpdir, "plain.db")
+        db.backup(plain_copy, key="")
+        db3 = Rekordbox6Database(plain_copy, unlock=False)
+        assert db3.get_content().count() == db.get_content().count()
+        db3.close()
+        # The private snapshot used for the export is removed
+        assert not [name for name in os.listdir(tmpdir) if name.endswith(".tmp")]
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir)
+
+
+@mark.parametrize("path,unlock", [(UNLOCKED, False), (LOCKED, True)])
+def test_read_only_connection(path, unlock):
+    db = Rekordbox6Database(path, unlock=unlock)
+    conn = db.read_only_connection()
+    try:
+        count = conn.execute("SELECT count(*) FROM djmdContent").fetchone()[0]
+        assert count == db.get_content().count()
+        with pytest.raises(Exception, match="readonly"):
+            conn.execute("DELETE FROM djmdContent")
+    finally:
+        conn.close()
+        db.close()
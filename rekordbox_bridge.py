@@ -7,616 +7,3230 @@ Provides interface between Electron app and pyrekordbox library
 import sys
 import json
 import os
+import base64
+import difflib
+import hashlib
+import tempfile
 import shutil
+import sqlite3
 import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Tuple
 
 # Add pyrekordbox to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'pyrekordbox-0.4.4'))
 
 try:
+    import numpy as np
     from pyrekordbox import Rekordbox6Database, RekordboxXml, show_config, update_config
     from pyrekordbox.config import __config__ as pyrekordbox_config, get_config
     from pyrekordbox.utils import get_rekordbox_pid
+    from pyrekordbox.anlz import (
+        AnlzFile, get_anlz_paths, get_tag_data, read_anlz_files, index_anlz_dirs, splice_tags,
+        write_atomic
+    )
+    from pyrekordbox.anlz.tags import PPTHAnlzTag
     from pyrekordbox.db6.smartlist import SmartList, Property, Operator
-    from pyrekordbox.db6.tables import PlaylistType, DjmdSongPlaylist
+    from pyrekordbox.db6.tables import (
+        PlaylistType, DjmdSongPlaylist, DjmdContent, DjmdCue, DjmdArtist, DjmdAlbum, DjmdGenre,
+        DjmdKey, DjmdLabel, DjmdMyTag, DjmdSongMyTag, ContentFile
+    )
+    from sqlalchemy import or_
 except ImportError as e:
     print(json.dumps({"success": False, "error": f"Failed to import pyrekordbox: {str(e)}"}))
     sys.exit(1)
 
+# Title/artist noise ignored when matching duplicates
+_FEAT_RE = re.compile(r"[(\[]?\b(feat|ft|featuring)\b\.?[^()\[\]]*[)\]]?")
+_ORIGINAL_MIX_RE = re.compile(r"[(\[]\s*original( mix)?\s*[)\]]")
+_NON_WORD_RE = re.compile(r"[\W_]+")
 
-class RekordboxBridge:
-    """Bridge between Electron app and pyrekordbox"""
-    
-    def __init__(self):
-        self.db = None
-        self.config = None
+# Tracks per process pool job when previewing smart fixes
+SMART_FIX_PREVIEW_CHUNK = 1000
 
-    # -----------------------------
-    # Helpers: DB safety / framing
-    # -----------------------------
-    @staticmethod
-    def _is_corruption_error(err: Exception) -> bool:
-        msg = str(err).lower()
-        return (
-            "database disk image is malformed" in msg
-            or "disk image is malformed" in msg
-            or "malformed" in msg
-            or "sqlcipher3.dbapi2.databaseerror" in msg and "malformed" in msg
-        )
+# Smart fix patterns, compiled once (see _compile_smart_fixes)
+SMART_FIX_FIELDS = ('Name', 'Artist', 'Album', 'Genre', 'Comments', 'Label')
+_WHITESPACE_RE = re.compile(r'\s+')
+_GARBAGE_RE = re.compile(r'^[\s\[\]\|\-]+|[\s\[\]\|\-]+$')
+_REMIX_SUFFIX_RE = re.compile(r'\s*-\s*(.*?)(?:mix|remix|version|edit)$', re.IGNORECASE)
+_REMIXER_RES = (
+    re.compile(r'\(([^)]+?)(?:extended|club|dance|radio)?\s*(?:remix|mix|version|edit)\)', re.IGNORECASE),
+    re.compile(r'\(([^)]+?)\s+(?:extended|club|dance|radio)?\s*(?:remix|mix|version|edit)\)', re.IGNORECASE),
+)
+_REMIXER_FILTER_WORDS = ('original', 'radio', 'club', 'dance', 'extended')
+_EMPTY_PARENS_RE = re.compile(r'\(\s*\)')
+_URL_RE = re.compile(r'https?://[^\s]+')
+_NUMBER_PREFIX_RES = (
+    re.compile(r'^\d+\.\s*'),  # 01.
+    re.compile(r'^\(\d+\)\s*'),  # (01)
+    re.compile(r'^\d+\s*-\s*'),  # 01 -
+    re.compile(r'^\[\d+\]\s*'),  # [01]
+)
 
-    def _safe_rollback(self) -> None:
+# Track fields fed to the duplicate finder
+MATCH_FIELDS = (
+    "id", "title", "artist", "length", "file_size", "bit_rate", "rating", "play_count",
+    "date_added", "folder_path",
+)
+
+# Bytes hashed from each end of a file when screening for identical files, and the
+# read size when hashing whole files
+DIGEST_SAMPLE_SIZE = 64 * 1024
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+# Chunk size of the deduplicated backup store (a multiple of SQLite's page size)
+# and the default number of snapshots kept per period
+BACKUP_CHUNK_SIZE = 64 * 1024
+BACKUP_RETENTION = {"last": 3, "hourly": 24, "daily": 7, "weekly": 8}
+
+# Pages copied per step by online backups, and the pause between steps that lets
+# Rekordbox write in between
+ONLINE_BACKUP_PAGES = 1024
+ONLINE_BACKUP_SLEEP = 0.005
+
+# Integrity check tiers, and the rows read per step by the table scan
+INTEGRITY_MODES = ("quick", "full", "tables")
+INTEGRITY_RANGE_ROWS = 5000
+
+# Columns of a damaged row the corruption scanner tries to salvage
+SCAN_REFERENCE_COLUMNS = ("ID", "ContentID", "PlaylistID", "UUID")
+
+# Directory (next to master.db, like bonk_backups) holding Bonk's derived data
+BONK_CACHE_DIRNAME = "bonk_cache"
+
+# DjmdCue.InFrame/OutFrame count 1/150 s frames
+CUE_FRAMES_PER_MS = 150 / 1000
+# Prefix of the copy of an ANLZ file kept until the database commit of a cue shift or
+# relocation; the name no longer matches the ANLZ file pattern, so a copy left by a
+# crash is never picked up as an analysis file
+ANLZ_ORIGINAL_PREFIX = ".bonk-orig-"
+
+# Packed layout of a cached cue entry (loop_end == -1 means "no loop end")
+CUE_DTYPE = np.dtype([("time", "<i4"), ("loop_end", "<i4"), ("hot_cue", "<i4"), ("is_loop", "u1")])
+
+# Waveform pyramid levels as entries of the 150 entries/s detail waveform per bucket
+# (150, 50, 25, 10, 5, 2 and 1 px/s) and the packed layout of one bucket
+WAVEFORM_DETAIL_RATE = 150
+WAVEFORM_BUCKET_SIZES = (1, 3, 6, 15, 30, 75, 150)
+WAVEFORM_BUCKET_DTYPE = np.dtype(
+    [("min", "u1"), ("max", "u1"), ("rms", "u1"), ("r", "u1"), ("g", "u1"), ("b", "u1")]
+)
+
+
+def _emit_event(event: Dict[str, Any]) -> None:
+    """Write one streaming event as a JSON line to stdout.
+
+    Streaming verbs emit these lines while working; the final result object is
+    still printed last by main(), so consumers read stdout line by line.
+    """
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def _open_cache_db(cache_dir: str, filename: str) -> sqlite3.Connection:
+    """Open (and create if needed) a SQLite file inside Bonk's cache directory."""
+    os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(cache_dir, filename), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _anlz_dir_signature(anlz_dir: str) -> Optional[str]:
+    """Signature of the ANLZ files in a directory (name, mtime, size).
+
+    Rekordbox rewrites these files when a track is re-analysed, which changes
+    the signature and thereby invalidates anything cached for the directory.
+    Returns None if the directory does not exist.
+    """
+    parts = []
+    try:
+        with os.scandir(anlz_dir) as it:
+            for entry in it:
+                if entry.name.startswith("ANLZ") and entry.is_file():
+                    st = entry.stat()
+                    parts.append(f"{entry.name}:{st.st_mtime_ns}:{st.st_size}")
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    parts.sort()
+    return "|".join(parts)
+
+
+def _decode_anlz_dir(anlz_dir: str) -> Dict[str, Any]:
+    """Parse the ANLZ files of a track and decode waveform preview and cues.
+
+    Returns a dict with ``waveform`` (uint8 array or None) and ``cues``
+    (array of ``CUE_DTYPE``).
+    """
+    waveform = None
+    cues = []
+    for anlz_file in read_anlz_files(anlz_dir).values():
         try:
-            if self.db:
-                self.db.rollback()
+            if "PWAV" in anlz_file and waveform is None:
+                h, _ = anlz_file.get_tag("PWAV").get()
+                waveform = np.asarray(h, dtype=np.uint8)
+            if "PWV4" in anlz_file and waveform is None:
+                heights, _, _ = anlz_file.get_tag("PWV4").get()
+                waveform = np.asarray(heights[:, 0], dtype=np.uint8)
+
+            # DAT and EXT carry the same cue lists, use the first file that has cues
+            if not cues:
+                for tag in anlz_file.getall_tags("PCOB"):
+                    for ent in tag.content.entries:
+                        is_loop = "loop" in str(getattr(ent, "type", "")).lower()
+                        loop_time = int(ent.loop_time)
+                        loop_end = loop_time if is_loop and loop_time != 0xFFFFFFFF else -1
+                        cues.append((int(ent.time), loop_end, int(ent.hot_cue), int(is_loop)))
         except Exception:
             pass
+    return {"waveform": waveform, "cues": np.array(cues, dtype=CUE_DTYPE)}
 
-    def _safe_commit(self, *, autoinc: bool = True) -> Optional[str]:
-        """Commit and return error string if failed."""
-        try:
-            if not self.db:
-                return "Database not open"
-            self.db.commit(autoinc=autoinc)
-            return None
-        except Exception as e:
-            self._safe_rollback()
-            return str(e)
 
-    def _stage_delete_track(self, content) -> None:
-        """Stage deletion of a track and its playlist links (no commit)."""
-        # Delete join rows first
-        playlist_entries = self.db.query(DjmdSongPlaylist).filter(
-            DjmdSongPlaylist.ContentID == content.ID
-        ).all()
-        for entry in playlist_entries:
-            # Use pyrekordbox delete wrapper so registry is tracked
-            self.db.delete(entry)
-        self.db.delete(content)
-        
-    def get_config(self) -> Dict[str, Any]:
-        """Get current pyrekordbox configuration"""
-        try:
-            # Ensure config is populated
-            if not pyrekordbox_config.get("pioneer"):
-                update_config()
-            
-            pioneer_config = pyrekordbox_config.get("pioneer", {})
-            rb6_config = pyrekordbox_config.get("rekordbox6", {})
-            rb7_config = pyrekordbox_config.get("rekordbox7", {})
-            
-            # Try to get database path from config
-            db_path = None
-            if rb7_config.get("db_path"):
-                db_path = str(rb7_config["db_path"])
-            elif rb6_config.get("db_path"):
-                db_path = str(rb6_config["db_path"])
-            
-            return {
-                "success": True,
-                "config": {
-                    "install_dir": str(pioneer_config.get("install_dir", "")) if pioneer_config.get("install_dir") else None,
-                    "app_dir": str(pioneer_config.get("app_dir", "")) if pioneer_config.get("app_dir") else None,
-                    "db_path": db_path,
-                }
-            }
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    def set_config(self, install_dir: Optional[str] = None, app_dir: Optional[str] = None) -> Dict[str, Any]:
-        """Update pyrekordbox configuration"""
-        try:
-            if install_dir and app_dir:
-                update_config(install_dir, app_dir)
-            return {"success": True}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    def open_database(self, db_path: Optional[str] = None) -> Dict[str, Any]:
-        """Open Rekordbox 6/7 database"""
-        try:
-            actual_path = None
-            if db_path:
-                # Verify the path exists
-                if not os.path.exists(db_path):
-                    return {
-                        "success": False,
-                        "error": f"Database file not found: {db_path}"
-                    }
-                actual_path = os.path.abspath(db_path)
-                print(f"Opening database from provided path: {actual_path}", file=sys.stderr)
-                # Rekordbox6Database uses 'path' parameter, not 'db_path'
-                self.db = Rekordbox6Database(path=db_path)
-            else:
-                print("Opening database using auto-detection...", file=sys.stderr)
-                try:
-                    self.db = Rekordbox6Database()
-                    # Get the actual path that was used
-                    try:
-                        if hasattr(self.db, 'engine') and self.db.engine:
-                            url = str(self.db.engine.url)
-                            if 'sqlite' in url and ':///' in url:
-                                parts = url.split(':///')
-                                if len(parts) > 1:
-                                    actual_path = parts[1].split('?')[0]
-                                    actual_path = os.path.abspath(actual_path)
-                    except:
-                        pass
-                except Exception as auto_error:
-                    # Auto-detection failed - provide helpful error message
-                    error_msg = str(auto_error)
-                    
-                    # Check common locations
-                    common_paths = []
-                    home_dir = os.path.expanduser("~")
-                    
-                    # macOS common locations
-                    if sys.platform == "darwin":
-                        common_paths = [
-                            os.path.join(home_dir, "Library", "Pioneer", "rekordbox", "master.db"),
-                            os.path.join(home_dir, "Library", "Pioneer", "rekordbox", "datafile.edb"),
-                            "/Applications/Pioneer/rekordbox 6/master.db",
-                            "/Applications/Pioneer/rekordbox 7/master.db",
-                        ]
-                    # Windows common locations
-                    elif sys.platform == "win32":
-                        appdata = os.environ.get("APPDATA", "")
-                        if appdata:
-                            common_paths = [
-                                os.path.join(appdata, "Pioneer", "rekordbox", "master.db"),
-                                os.path.join(appdata, "Pioneer", "rekordbox", "datafile.edb"),
-                            ]
-                    
-                    # Check if any common paths exist
-                    found_paths = [p for p in common_paths if os.path.exists(p)]
-                    
-                    suggestion = ""
-                    if found_paths:
-                        suggestion = f"\n\nFound database at: {found_paths[0]}\nPlease use 'Browse' to select this file manually."
-                    else:
-                        suggestion = "\n\nCommon locations to check:\n"
-                        for path in common_paths:
-                            suggestion += f"  - {path}\n"
-                        suggestion += "\nPlease use 'Browse' to manually select your master.db file."
-                    
-                    return {
-                        "success": False,
-                        "error": f"Failed to open database: {error_msg}{suggestion}"
-                    }
-            
-            # Verify database file exists and get its info
-            if actual_path:
-                if os.path.exists(actual_path):
-                    file_size = os.path.getsize(actual_path)
-                    print(f"✓ Database opened: {actual_path}", file=sys.stderr)
-                    print(f"  File size: {file_size:,} bytes ({file_size / (1024*1024):.2f} MB)", file=sys.stderr)
-                    # Verify it's actually a master.db file
-                    if actual_path.endswith('master.db'):
-                        print(f"  ✓ Confirmed: This is a master.db file", file=sys.stderr)
-                    else:
-                        print(f"  ⚠ Warning: File name is not 'master.db'", file=sys.stderr)
-                else:
-                    print(f"  ⚠ Warning: Database path does not exist: {actual_path}", file=sys.stderr)
-            
-            return {
-                "success": True,
-                "message": "Database opened successfully",
-                "db_path": actual_path
-            }
-        except Exception as e:
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-            error_msg = str(e)
-            
-            # Provide helpful suggestions if auto-detection failed
-            if "No Rekordbox" in error_msg or "directory found" in error_msg:
-                home_dir = os.path.expanduser("~")
-                if sys.platform == "darwin":
-                    common_db = os.path.join(home_dir, "Library", "Pioneer", "rekordbox", "master.db")
-                    if os.path.exists(common_db):
-                        error_msg += f"\n\nFound database at: {common_db}\nPlease use 'Browse' to select this file."
-                    else:
-                        error_msg += f"\n\nCommon locations to check:\n  - {common_db}\n  - ~/Library/Pioneer/rekordbox/datafile.edb\n\nPlease use 'Browse' to manually select your master.db file."
-            
-            return {
-                "success": False,
-                "error": f"Failed to open database: {error_msg}"
-            }
-    
-    def close_database(self) -> Dict[str, Any]:
-        """Close the database connection"""
+ARRAY_ENCODINGS = ("json", "base64", "file")
+# Per-call directories for ``file`` encoded arrays; the reader deletes each file
+# after loading it, and directories left behind by a crashed reader are swept
+ARRAY_FILE_ROOT = os.path.join(tempfile.gettempdir(), "bonk_arrays")
+ARRAY_FILE_TTL = 15 * 60
+
+
+def _array_file_dir(encoding: str) -> Optional[str]:
+    """Validate ``encoding`` and return a fresh directory for ``file`` arrays, else None.
+
+    Directories older than ``ARRAY_FILE_TTL`` from earlier calls are removed first.
+    """
+    if encoding not in ARRAY_ENCODINGS:
+        raise ValueError(f"Invalid encoding: {encoding}")
+    if encoding != "file":
+        return None
+    os.makedirs(ARRAY_FILE_ROOT, exist_ok=True)
+    cutoff = time.time() - ARRAY_FILE_TTL
+    for entry in os.scandir(ARRAY_FILE_ROOT):
         try:
-            if self.db:
-                self.db.close()
-                self.db = None
-            return {"success": True}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    def backup_database(self, db_path: Optional[str] = None) -> Dict[str, Any]:
-        """Backup the Rekordbox database file with rotation (keeps 3 backups)"""
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+    return tempfile.mkdtemp(prefix="call_", dir=ARRAY_FILE_ROOT)
+
+
+def _release_array_file_dir(directory: Optional[str]) -> None:
+    """Remove a per-call array directory if no array was written into it."""
+    if directory:
         try:
-            actual_db_path = None
+            os.rmdir(directory)
+        except OSError:
+            pass
 
-            if db_path:
-                # Verify the path exists
-                if not os.path.exists(db_path):
-                    return {
-                        "success": False,
-                        "error": f"Database file not found: {db_path}"
-                    }
-                actual_db_path = os.path.abspath(db_path)
-            else:
-                # Auto-detect database path like import function does
-                print("Auto-detecting database for backup...", file=sys.stderr)
-                try:
-                    # Temporarily open database to get path
-                    temp_db = Rekordbox6Database()
 
-                    # Get the actual path that was used
-                    if hasattr(temp_db, 'engine') and temp_db.engine:
-                        url = str(temp_db.engine.url)
+def _encode_array(arr: np.ndarray, encoding: str = "json", directory: Optional[str] = None) -> Any:
+    """Encode a numeric array for the JSON result.
 
-                        # Extract database path from SQLAlchemy URL
-                        # URL format: sqlite+pysqlcipher://:***@//Users/suhaas/Library/Pioneer/rekordbox/master.db
-                        if '@' in url:
-                            # Split on @ and take the part after it
-                            path_part = url.split('@', 1)[1].split('?')[0]
+    ``json`` returns a plain list (the historical format). ``base64`` and
+    ``file`` return a descriptor with ``dtype`` and ``shape`` plus either the
+    base64 encoded little-endian bytes or the path of a file holding them in
+    ``directory`` (see ``_array_file_dir``), so large arrays can be read
+    straight into a typed array. The reader deletes the file.
+    """
+    if encoding == "json":
+        return arr.tolist()
+    if encoding not in ARRAY_ENCODINGS:
+        raise ValueError(f"Invalid encoding: {encoding}")
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+    descriptor = {"encoding": encoding, "dtype": arr.dtype.name, "shape": list(arr.shape)}
+    if encoding == "base64":
+        descriptor["data"] = base64.b64encode(arr.tobytes()).decode("ascii")
+    else:
+        fd, path = tempfile.mkstemp(prefix="bonk_wf_", suffix=".bin", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(arr.tobytes())
+        descriptor["path"] = path
+    return descriptor
 
-                            # Handle double slash at start (remove one)
-                            if path_part.startswith('//'):
-                                path_part = path_part[1:]
 
-                            actual_db_path = os.path.abspath(path_part)
+def _cues_to_json(cues: np.ndarray) -> List[Dict[str, Any]]:
+    return [
+        {
+            "time_ms": int(c["time"]),
+            "loop_end_ms": int(c["loop_end"]) if c["loop_end"] >= 0 else None,
+            "hot_cue": int(c["hot_cue"]),
+            "type": "loop" if c["is_loop"] else "cue",
+        }
+        for c in cues
+    ]
 
-                    temp_db.close()
 
-                except Exception as e:
-                    return {
-                        "success": False,
-                        "error": f"Failed to auto-detect database: {str(e)}"
-                    }
+def _shift_anlz_cues(anlz_dir: str, offset_ms: int, cues: str = "all",
+                     dry_run: bool = False) -> Dict[str, int]:
+    """Shift the cue points in the DAT and EXT files of a track.
 
-            if not actual_db_path or not os.path.exists(actual_db_path):
-                return {
-                    "success": False,
-                    "error": f"Database file not found: {actual_db_path}"
-                }
-            
-            # Create backup directory next to the database file
-            db_dir = os.path.dirname(actual_db_path)
-            backup_dir = os.path.join(db_dir, "bonk_backups")
+    Only the PCOB/PCO2 tags are rebuilt; they are spliced into the original
+    file bytes and written through a temp file and rename, so every other tag
+    is preserved byte for byte and a crash never leaves a truncated file.
+    ``cues`` selects ``all``, ``hot`` or ``memory`` cue lists. Cues that would
+    move before the start of the track are placed at 0 and counted in
+    ``clamped_count``.
 
-            # Create backup directory if it doesn't exist
-            os.makedirs(backup_dir, exist_ok=True)
+    The original of every rewritten file is kept next to it (see
+    ``_keep_anlz_original``) and returned as ``originals``, so the caller can
+    put it back if the database update fails; if this function fails, the files
+    it already wrote are restored before the error is raised.
+    """
+    no_loop = 0xFFFFFFFF
+    entry_count = 0
+    clamped_count = 0
+    file_count = 0
+    originals: List[Tuple[str, str]] = []
+    paths = get_anlz_paths(anlz_dir)
+    try:
+        for kind in ("DAT", "EXT"):
+            path = paths.get(kind)
+            if not path:
+                continue
+            with open(path, "rb") as fh:
+                data = fh.read()
+            anlz_file = AnlzFile.parse(data)
+            rebuilt: Dict[str, List[bytes]] = {}
+            changed = False
+            for tag_type in ("PCOB", "PCO2"):
+                tags = anlz_file.getall_tags(tag_type)
+                if not tags:
+                    continue
+                for tag in tags:
+                    cue_type = str(tag.content.cue_type if tag_type == "PCOB" else tag.content.type)
+                    if cues != "all" and cue_type != ("hotcue" if cues == "hot" else "memory"):
+                        continue
+                    for entry in tag.content.entries:
+                        if int(entry.time) + offset_ms < 0:
+                            clamped_count += 1
+                        entry.time = max(int(entry.time) + offset_ms, 0)
+                        if 0 < int(entry.loop_time) < no_loop:
+                            entry.loop_time = max(int(entry.loop_time) + offset_ms, 0)
+                        entry_count += 1
+                        changed = True
+                rebuilt[tag_type] = [tag.build() for tag in tags]
+            if changed and not dry_run:
+                originals.append((str(path), _keep_anlz_original(str(path))))
+                write_atomic(path, splice_tags(data, rebuilt))
+                file_count += 1
+    except BaseException:
+        _restore_anlz_originals(originals)
+        raise
+    return {
+        "entry_count": entry_count,
+        "clamped_count": clamped_count,
+        "file_count": file_count,
+        "originals": originals,
+    }
 
-            # Generate backup filename with timestamp
-            db_filename = os.path.basename(actual_db_path)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f"{db_filename}.backup_{timestamp}"
-            backup_path = os.path.join(backup_dir, backup_filename)
-
-            # Copy the database file
-            print(f"Creating backup: {backup_path}", file=sys.stderr)
-            shutil.copy2(actual_db_path, backup_path)
-            
-            # Get all backup files for this database
-            backup_pattern = f"{db_filename}.backup_*"
-            existing_backups = []
-            for file in os.listdir(backup_dir):
-                if file.startswith(f"{db_filename}.backup_"):
-                    backup_file_path = os.path.join(backup_dir, file)
-                    # Get modification time for sorting
-                    mtime = os.path.getmtime(backup_file_path)
-                    existing_backups.append((mtime, backup_file_path, file))
-            
-            # Sort by modification time (oldest first)
-            existing_backups.sort(key=lambda x: x[0])
-            
-            # Keep only the 3 most recent backups (delete older ones)
-            max_backups = 3
-            if len(existing_backups) > max_backups:
-                backups_to_delete = existing_backups[:-max_backups]  # All except the last 3
-                for _, backup_path_to_delete, backup_name in backups_to_delete:
-                    try:
-                        os.remove(backup_path_to_delete)
-                        print(f"Deleted old backup: {backup_name}", file=sys.stderr)
-                    except Exception as e:
-                        print(f"Warning: Could not delete old backup {backup_name}: {e}", file=sys.stderr)
-            
-            remaining_backups = len([f for f in os.listdir(backup_dir) if f.startswith(f"{db_filename}.backup_")])
-            print(f"✓ Backup created. Total backups: {remaining_backups}", file=sys.stderr)
-            
-            return {
-                "success": True,
-                "backup_path": backup_path,
-                "backup_count": remaining_backups
-            }
-        except Exception as e:
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-            return {
-                "success": False,
-                "error": f"Failed to backup database: {str(e)}"
-            }
-    
-    def check_database_integrity(self) -> Dict[str, Any]:
-        """Check database integrity using SQLite PRAGMA integrity_check"""
-        try:
-            if not self.db:
-                return {
-                    "success": False,
-                    "error": "Database not open"
-                }
-            
-            # Get raw connection to run PRAGMA commands
-            connection = self.db.engine.raw_connection()
-            cursor = connection.cursor()
-            
-            # Run integrity check
-            cursor.execute("PRAGMA integrity_check")
-            result = cursor.fetchone()
-            
-            cursor.close()
-            connection.close()
-            
-            integrity_ok = result and result[0] == "ok"
-            message = result[0] if result else "Unknown integrity status"
-            
-            # Provide more helpful error messages for common corruption types
-            if not integrity_ok:
-                if "index" in message.lower() and "wrong" in message.lower():
-                    message += "\n\nThis indicates index corruption. The repair function will rebuild all indexes to fix this issue."
-                elif "malformed" in message.lower() or "corrupt" in message.lower():
-                    message += "\n\nThis indicates database file corruption. The repair function will attempt to fix this using VACUUM."
-            
-            return {
-                "success": True,
-                "integrity_ok": integrity_ok,
-                "message": message
-            }
-        except Exception as e:
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-            return {
-                "success": False,
-                "error": f"Failed to check database integrity: {str(e)}"
-            }
-    
-    def repair_database(self) -> Dict[str, Any]:
-        """Attempt to repair database using SQLite VACUUM"""
-        db_path = None
+
+def _keep_anlz_original(path: str) -> str:
+    """Keep the current version of an ANLZ file before it is replaced; returns the copy.
+
+    A hard link costs nothing and survives the rename of ``write_atomic``; file
+    systems without hard links (e.g. exFAT) get a real copy.
+    """
+    original = os.path.join(os.path.dirname(path), ANLZ_ORIGINAL_PREFIX + os.path.basename(path))
+    if os.path.exists(original):
+        os.remove(original)
+    try:
+        os.link(path, original)
+    except OSError:
+        shutil.copy2(path, original)
+    return original
+
+
+def _restore_anlz_originals(originals: List[Tuple[str, str]]) -> List[Dict[str, str]]:
+    """Move kept ANLZ originals back in place; returns the files that couldn't be restored."""
+    errors = []
+    for path, original in originals:
         try:
-            if not self.db:
-                return {
-                    "success": False,
-                    "error": "Database not open"
-                }
-            
-            # Check if Rekordbox is running
-            pid = get_rekordbox_pid()
-            if pid:
-                return {
-                    "success": False,
-                    "error": "Rekordbox is running. Please close Rekordbox before repairing the database."
-                }
-            
-            # Get the database path before closing
-            if hasattr(self.db, 'engine') and self.db.engine:
-                url = str(self.db.engine.url)
-                if 'sqlite' in url:
-                    # Handle both encrypted and unencrypted URLs
-                    if '@' in url:
-                        # Encrypted: sqlite+pysqlcipher://:***@/path/to/db
-                        path_part = url.split('@', 1)[1].split('?')[0]
-                        if path_part.startswith('//'):
-                            path_part = path_part[1:]
-                        db_path = os.path.abspath(path_part)
-                    elif ':///' in url:
-                        # Unencrypted: sqlite:///path/to/db
-                        parts = url.split(':///')
-                        if len(parts) > 1:
-                            db_path = parts[1].split('?')[0]
-                            db_path = os.path.abspath(db_path)
-            
-            if not db_path or not os.path.exists(db_path):
-                return {
-                    "success": False,
-                    "error": "Could not determine database path"
-                }
-            
-            # Close the database connection first
-            self.db.close()
-            
-            # Create a backup before repair
-            backup_result = self.backup_database(db_path)
-            if not backup_result.get("success"):
-                print(f"Warning: Could not create backup before repair: {backup_result.get('error')}", file=sys.stderr)
-            
-            # Reopen database to get connection
-            self.db = Rekordbox6Database(path=db_path)
-            
-            # Get connection for repair operations
-            connection = self.db.engine.raw_connection()
-            cursor = connection.cursor()
-            
-            # First, rebuild all indexes to fix index corruption
-            print("Step 1: Rebuilding indexes to fix index corruption...", file=sys.stderr)
-            try:
-                cursor.execute("REINDEX")
-                print("✓ Indexes rebuilt successfully", file=sys.stderr)
-            except Exception as e:
-                print(f"Warning: REINDEX failed: {e}", file=sys.stderr)
-                # Continue with VACUUM anyway
-            
-            # Then run VACUUM to repair and compact the database
-            print("Step 2: Running VACUUM to repair and compact database...", file=sys.stderr)
-            cursor.execute("VACUUM")
-            print("✓ VACUUM completed successfully", file=sys.stderr)
-            
-            cursor.close()
-            connection.close()
-            
-            # Close and reopen to verify
-            self.db.close()
-            self.db = Rekordbox6Database(path=db_path)
-            
-            # Check integrity after repair
-            integrity_result = self.check_database_integrity()
-            
-            if integrity_result.get("integrity_ok"):
-                return {
-                    "success": True,
-                    "message": "Database repaired successfully",
-                    "integrity_ok": True
-                }
+            if os.path.samefile(original, path):
+                # Never replaced: rename() between two links to one file does nothing
+                os.remove(original)
             else:
-                return {
-                    "success": False,
-                    "error": f"Database repair completed but integrity check failed: {integrity_result.get('message')}",
-                    "integrity_ok": False
-                }
-        except Exception as e:
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-            # Try to reopen database
-            try:
-                if db_path and os.path.exists(db_path):
-                    self.db = Rekordbox6Database(path=db_path)
-            except:
-                pass
-            return {
-                "success": False,
-                "error": f"Failed to repair database: {str(e)}"
-            }
-    
-    def import_from_database(self, db_path: Optional[str] = None) -> Dict[str, Any]:
-        """Import tracks and playlists from Rekordbox database"""
+                os.replace(original, path)
+        except OSError as e:
+            errors.append({"path": path, "error": str(e)})
+    return errors
+
+
+def _discard_anlz_originals(originals: List[Tuple[str, str]]) -> None:
+    for _, original in originals:
         try:
-            # Open database if not already open
-            if not self.db:
-                result = self.open_database(db_path)
-                if not result["success"]:
-                    return result
-                actual_db_path = result.get("db_path")
-                if actual_db_path:
-                    print(f"Importing from database: {actual_db_path}", file=sys.stderr)
-            
-            # Get all tracks
-            tracks = []
-            for content in self.db.get_content():
-                # Safely get key name
-                try:
-                    key_name = content.KeyName if content.Key else ""
-                except:
-                    key_name = ""
-                
-                # Safely get remixer name
-                try:
-                    remixer_name = content.RemixerName if content.Remixer else ""
-                except:
-                    remixer_name = ""
-                
-                # Rekordbox stores BPM multiplied by 100 (e.g., 128.5 BPM = 12850)
-                # Convert back to normal BPM by dividing by 100
-                bpm_value = None
-                if content.BPM is not None:
-                    bpm_value = content.BPM / 100.0
-                
-                # Collect MyTag names if available
-                try:
-                    raw_mytags = list(content.MyTagNames) if hasattr(content, "MyTagNames") else []
-                except Exception:
-                    raw_mytags = []
-
-                # Parse MyTags into category + name using Rekordbox's four buckets
-                # Expected format: "Category: Name" where Category is one of Genre/Components/Situation/Custom
-                allowed_categories = {"Genre", "Components", "Situation", "Custom"}
-                tags = []
-                for mt in raw_mytags:
-                    if not mt:
-                        continue
-                    if ":" in mt:
-                        cat, val = mt.split(":", 1)
-                        cat = cat.strip()
-                        val = val.strip()
-                        if cat in allowed_categories and val:
-                            tags.append({"category": cat, "name": val, "source": "rekordbox"})
-                            continue
-                    # Fallback: unknown format, treat as Custom with full string
-                    tags.append({"category": "Custom", "name": mt.strip(), "source": "rekordbox"})
+            os.remove(original)
+        except OSError:
+            pass
 
-                # Safely get composer name
-                try:
-                    composer_name = content.ComposerName if content.Composer else ""
-                except:
-                    composer_name = ""
-                
-                # Safely get album artist name
-                try:
-                    album_artist_name = content.AlbumArtistName if content.Album else ""
-                except:
-                    album_artist_name = ""
-                
-                # Safely get lyricist name (Lyricist is a ForeignKey to DjmdArtist)
-                try:
-                    if content.Lyricist:
-                        lyricist_artist = self.db.get_artist(ID=content.Lyricist)
-                        lyricist_name = lyricist_artist.Name if lyricist_artist else ""
-                    else:
-                        lyricist_name = ""
-                except:
-                    lyricist_name = ""
-                
-                # Safely get original artist name
-                try:
-                    original_artist_name = content.OrgArtistName if content.OrgArtist else ""
-                except:
-                    original_artist_name = ""
 
-                track = {
-                    "TrackID": str(content.ID),
-                    "Name": content.Title or "",
-                    "Artist": content.ArtistName or "",
-                    "Album": content.AlbumName or "",
-                    "Genre": content.GenreName or "",
-                    "Year": str(content.ReleaseYear) if content.ReleaseYear else "",
-                    "AverageBpm": str(bpm_value) if bpm_value is not None else "",
-                    "TotalTime": str(int(content.Length * 1000)) if content.Length else "",
-                    "BitRate": str(content.BitRate) if content.BitRate else "",
-                    "SampleRate": str(content.SampleRate) if content.SampleRate else "",
-                    "Comments": content.Commnt or "",
-                    "Rating": str(content.Rating) if content.Rating else "",
-                    "Location": f"file://localhost{content.FolderPath}",
-                    "Tonality": key_name,
-                    "Key": key_name,
-                    "Label": content.LabelName or "",
-                    "Remixer": remixer_name,
-                    "Composer": composer_name,
-                    "AlbumArtist": album_artist_name,
-                    "TrackNumber": str(content.TrackNo) if content.TrackNo is not None else "",
-                    "DiscNumber": str(content.DiscNo) if content.DiscNo is not None else "",
-                    "Lyricist": lyricist_name,
-                    "OriginalArtist": original_artist_name,
-                    "MixName": content.Subtitle or "",  # Subtitle field stores Mix Name
-                    "Mix": content.Subtitle or "",  # Keep Mix for backward compatibility
-                    "DateAdded": content.created_at.isoformat() if content.created_at else "",
-                    "PlayCount": str(content.DJPlayCount) if content.DJPlayCount else "",
-                    "Color": str(content.ColorID) if content.ColorID else "",
-                    "tags": tags,
-                }
-                tracks.append(track)
-            
-            # Get all playlists
-            playlists = []
-            print(f"Fetching playlists...", file=sys.stderr)
-            all_playlists = list(self.db.get_playlist())
-            print(f"Found {len(all_playlists)} playlists", file=sys.stderr)
-            
-            # Only get root-level playlists (those without a parent)
-            for playlist in all_playlists:
+def _rewrite_anlz_path(anlz_dir: str, new_path: str) -> Dict[str, Any]:
+    """Set the PPTH path of the analysis files of a track.
+
+    Only the PPTH tag is parsed and rebuilt; it is spliced into the original bytes
+    and written atomically. Returns the name and new size of each rewritten file
+    as ``files``, and the kept originals (see ``_keep_anlz_original``) as
+    ``originals``; if this function fails, the files it already wrote are
+    restored before the error is raised.
+    """
+    files = []
+    originals: List[Tuple[str, str]] = []
+    try:
+        for path in get_anlz_paths(anlz_dir).values():
+            if not path:
+                continue
+            with open(path, "rb") as fh:
+                data = fh.read()
+            tag_data = get_tag_data(data, "PPTH")
+            if not tag_data:
+                continue
+            tags = [PPTHAnlzTag(item) for item in tag_data]
+            if all(tag.path == new_path for tag in tags):
+                continue
+            for tag in tags:
+                tag.set(new_path)
+                tag.update_len()
+            new_data = splice_tags(data, {"PPTH": [tag.build() for tag in tags]})
+            originals.append((str(path), _keep_anlz_original(str(path))))
+            write_atomic(path, new_data)
+            files.append((os.path.basename(str(path)), len(new_data)))
+    except BaseException:
+        _restore_anlz_originals(originals)
+        raise
+    return {"files": files, "originals": originals}
+
+
+def _beatgrid_stats(anlz_dir: str) -> Optional[Dict[str, Any]]:
+    """Decode the beat grid of a track and compute grid statistics.
+
+    Uses the PQTZ tag of the DAT file and falls back to the two PQT2 anchor
+    beats of the 2EX file. Returns None if the track has no beat grid.
+
+    * ``drift_ms``: largest deviation of a beat from a constant-tempo grid
+      fitted through all beats
+    * ``grid_error_ms``: accumulated offset between the stored beat times
+      and the times implied by the stored per-beat tempos
+    * ``tempo_changes``: number of tempo changes along the grid
+    """
+    paths = get_anlz_paths(anlz_dir)
+    source = None
+    if paths.get("DAT"):
+        anlz_file = AnlzFile.parse_file(paths["DAT"])
+        if "PQTZ" in anlz_file:
+            beats, bpms, times = anlz_file.get_tag("PQTZ").get()
+            if len(beats):
+                source = "PQTZ"
+    if source is None and paths.get("2EX"):
+        anlz_file = AnlzFile.parse_file(paths["2EX"])
+        if "PQT2" in anlz_file:
+            beats, bpms, times = anlz_file.get_tag("PQT2").get()
+            if len(beats):
+                source = "PQT2"
+    if source is None:
+        return None
+
+    n = len(times)
+    tempo_changes = int(np.count_nonzero(np.diff(bpms)))
+    drift_ms = 0.0
+    grid_error_ms = 0.0
+    if n > 2:
+        idx = np.arange(n, dtype=np.float64)
+        slope, offset = np.polyfit(idx, times, 1)
+        drift_ms = float(np.max(np.abs(times - (slope * idx + offset)))) * 1000
+        expected = np.cumsum(60.0 / bpms[:-1])
+        grid_error_ms = float(np.max(np.abs((times[1:] - times[0]) - expected))) * 1000
+    downbeats = np.flatnonzero(beats == 1)
+    return {
+        "source": source,
+        "beat_count": n,
+        "bpm_avg": float(np.mean(bpms)),
+        "bpm_min": float(np.min(bpms)),
+        "bpm_max": float(np.max(bpms)),
+        "tempo_changes": tempo_changes,
+        "variable_bpm": tempo_changes > 0,
+        "drift_ms": drift_ms,
+        "grid_error_ms": grid_error_ms,
+        "first_beat_ms": float(times[0]) * 1000,
+        "first_downbeat_ms": float(times[downbeats[0]]) * 1000 if len(downbeats) else None,
+    }
+
+
+def _decode_detail_waveform(anlz_dir: str) -> Optional[Tuple[str, np.ndarray, np.ndarray]]:
+    """Decode the detail waveform of a track from its EXT file.
+
+    Prefers the colour detail (PWV5) over the monochrome detail (PWV3). Returns
+    ``(source, heights, colors)`` with heights in 0-31 and an ``(n, 3)`` array
+    of RGB colour components in 0-7, or None if there is no detail waveform.
+    """
+    path = get_anlz_paths(anlz_dir).get("EXT")
+    if not path:
+        return None
+    anlz_file = AnlzFile.parse_file(path)
+    if "PWV5" in anlz_file:
+        x = np.asarray(anlz_file.get_tag("PWV5").content.entries, dtype=np.uint16)
+        colors = np.stack([(x >> 13) & 0x7, (x >> 10) & 0x7, (x >> 7) & 0x7], axis=1)
+        return "PWV5", ((x >> 2) & 0x1F).astype(np.uint8), colors.astype(np.uint8)
+    if "PWV3" in anlz_file:
+        heights, whiteness = anlz_file.get_tag("PWV3").get()
+        colors = np.repeat(whiteness.astype(np.uint8)[:, None], 3, axis=1)
+        return "PWV3", heights.astype(np.uint8), colors
+    return None
+
+
+def _waveform_pyramid(heights: np.ndarray, colors: np.ndarray) -> List[np.ndarray]:
+    """Downsample a detail waveform into one bucket array per pyramid level.
+
+    Each bucket holds the min, max and RMS height and the mean colour of the
+    detail entries it covers; a trailing partial bucket only covers the
+    remaining entries.
+    """
+    n = len(heights)
+    h = heights.astype(np.float64)
+    c = colors.astype(np.float64)
+    levels = []
+    for size in WAVEFORM_BUCKET_SIZES:
+        starts = np.arange(0, n, size)
+        counts = np.diff(np.append(starts, n))
+        buckets = np.zeros(len(starts), dtype=WAVEFORM_BUCKET_DTYPE)
+        if n:
+            buckets["min"] = np.minimum.reduceat(heights, starts)
+            buckets["max"] = np.maximum.reduceat(heights, starts)
+            buckets["rms"] = np.rint(np.sqrt(np.add.reduceat(h * h, starts) / counts))
+            mean_colors = np.rint(np.add.reduceat(c, starts, axis=0) / counts[:, None])
+            buckets["r"], buckets["g"], buckets["b"] = mean_colors.T
+        levels.append(buckets)
+    return levels
+
+
+def _build_waveform_pyramid(anlz_dir: str) -> Optional[Dict[str, Any]]:
+    detail = _decode_detail_waveform(anlz_dir)
+    if detail is None:
+        return None
+    source, heights, colors = detail
+    return {"source": source, "entry_count": len(heights), "levels": _waveform_pyramid(heights, colors)}
+
+
+def _normalize_match_text(text: Optional[str]) -> str:
+    """Lowercase, diacritic-free, punctuation-free form of a title or artist for matching."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = _FEAT_RE.sub(" ", text.replace("&", " and "))
+    text = _ORIGINAL_MIX_RE.sub(" ", text)
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+def _duplicate_score(a: Dict[str, Any], b: Dict[str, Any], duration_tolerance: float) -> float:
+    """Similarity of two tracks in [0, 1] from title, artist, duration and file size.
+
+    ``a`` and ``b`` carry the normalized title and artist as ``match_title`` and
+    ``match_artist``.
+    """
+    if a["file_size"] and a["file_size"] == b["file_size"] and a["length"] == b["length"]:
+        return 1.0
+    if a["length"] and b["length"]:
+        delta = abs(a["length"] - b["length"])
+        if delta > duration_tolerance:
+            return 0.0
+        duration = 1.0 - delta / (duration_tolerance + 1.0)
+    else:
+        duration = 0.5
+    title = difflib.SequenceMatcher(None, a["match_title"], b["match_title"]).ratio()
+    # A missing artist earns no credit, so a shared title alone never reaches 0.85
+    artist = 0.0
+    if a["match_artist"] and b["match_artist"]:
+        artist = difflib.SequenceMatcher(None, a["match_artist"], b["match_artist"]).ratio()
+    return 0.5 * title + 0.3 * artist + 0.2 * duration
+
+
+def _pick_keeper(tracks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Best copy of a duplicate cluster: highest bitrate, then size, rating, plays, oldest."""
+    return max(
+        tracks,
+        key=lambda t: (
+            t["bit_rate"] or 0,
+            t["file_size"] or 0,
+            t["rating"] or 0,
+            t["play_count"] or 0,
+            # Earlier date added wins
+            -datetime.fromisoformat(t["date_added"]).timestamp() if t["date_added"] else float("-inf"),
+        ),
+    )
+
+
+def _find_duplicate_clusters(rows: List[Dict[str, Any]], threshold: float = 0.85,
+                             duration_tolerance: float = 3.0,
+                             max_block_size: int = 200) -> List[Dict[str, Any]]:
+    """Cluster duplicate tracks.
+
+    Tracks are grouped into blocks by normalized artist+title, by file size and duration,
+    and by duration bucket plus the first title word; only pairs within a block are
+    scored, so the cost stays near-linear. Pairs scoring at least ``threshold`` are
+    merged with union-find. Blocks larger than ``max_block_size`` (e.g. thousands of
+    untitled tracks) are skipped.
+    """
+    for row in rows:
+        row["match_title"] = _normalize_match_text(row["title"])
+        row["match_artist"] = _normalize_match_text(row["artist"])
+
+    blocks: Dict[Tuple, List[int]] = {}
+    width = max(duration_tolerance, 1.0)
+    for i, row in enumerate(rows):
+        keys = []
+        if row["match_title"]:
+            keys.append(("name", row["match_artist"], row["match_title"]))
+            if row["length"]:
+                bucket = int(row["length"] // width)
+                first_word = row["match_title"].split()[0]
+                # Also file under the next bucket so tracks straddling a boundary meet
+                keys.append(("dur", bucket, first_word))
+                keys.append(("dur", bucket + 1, first_word))
+        if row["file_size"]:
+            keys.append(("size", row["file_size"], row["length"]))
+        for key in keys:
+            blocks.setdefault(key, []).append(i)
+
+    parent = list(range(len(rows)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    scores: Dict[Tuple[int, int], float] = {}
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > max_block_size:
+            continue
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pair = (members[x], members[y])
+                if pair in scores:
+                    continue
+                score = _duplicate_score(rows[pair[0]], rows[pair[1]], duration_tolerance)
+                scores[pair] = score
+                if score >= threshold:
+                    parent[find(pair[0])] = find(pair[1])
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(rows)):
+        groups.setdefault(find(i), []).append(i)
+    cluster_scores: Dict[int, List[float]] = {}
+    for (a, b), score in scores.items():
+        if score >= threshold:
+            cluster_scores.setdefault(find(a), []).append(score)
+
+    clusters = []
+    for root, members in groups.items():
+        if len(members) < 2:
+            continue
+        tracks = [rows[i] for i in members]
+        keeper = _pick_keeper(tracks)
+        clusters.append({
+            "score": round(min(cluster_scores[root]), 3),
+            "keeper": keeper["id"],
+            "tracks": [
+                {key: t[key] for key in t if not key.startswith("match_")} for t in tracks
+            ],
+        })
+    clusters.sort(key=lambda c: (-c["score"], -len(c["tracks"])))
+    return clusters
+
+
+def _stat_file(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _sample_digest(path: str, size: int) -> str:
+    """Digest of the size plus the first and last DIGEST_SAMPLE_SIZE bytes of a file.
+
+    Files up to twice the sample size are hashed whole, so for them the sample
+    digest is also the full content digest.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as f:
+        if size <= 2 * DIGEST_SAMPLE_SIZE:
+            h.update(f.read())
+        else:
+            h.update(f.read(DIGEST_SAMPLE_SIZE))
+            f.seek(-DIGEST_SAMPLE_SIZE, os.SEEK_END)
+            h.update(f.read(DIGEST_SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+def _full_digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    buffer = bytearray(DIGEST_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def _name_key(name: str) -> str:
+    """Comparable form of a file name (NFC; case-folded on case-insensitive platforms)."""
+    name = unicodedata.normalize("NFC", name)
+    return name.casefold() if sys.platform in ("win32", "darwin") else name
+
+
+def _list_directory(directory: str, cached_mtime_ns: Optional[int]) -> Optional[Tuple[int, Optional[List[str]]]]:
+    """Stat a directory and list it unless its mtime matches the cached one.
+
+    Returns None if the directory is missing, else ``(mtime_ns, names)`` with
+    ``names`` None when the cached listing is still valid.
+    """
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+    if mtime_ns == cached_mtime_ns:
+        return mtime_ns, None
+    try:
+        with os.scandir(directory) as it:
+            names = [entry.name for entry in it]
+    except OSError:
+        return None
+    return mtime_ns, names
+
+
+def _scan_dir_files(directory: str) -> Tuple[List[Tuple[str, int, str]], List[str]]:
+    """Files (name, size, path) and subdirectories of one directory; unreadable ones are empty."""
+    files, subdirs = [], []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            subdirs.append(entry.path)
+                    elif entry.is_file():
+                        files.append((entry.name, entry.stat().st_size, entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+
+def _media_duration(path: str) -> Optional[float]:
+    """Duration in seconds read with mutagen (optional dependency), None if unknown."""
+    try:
+        import mutagen
+    except ImportError:
+        return None
+    try:
+        audio = mutagen.File(path)
+    except Exception:
+        return None
+    if audio is None or getattr(audio, "info", None) is None:
+        return None
+    return getattr(audio.info, "length", None)
+
+
+def _compile_smart_fixes(fixes: Dict[str, Any]) -> Callable[[Dict[str, str]], bool]:
+    """Compile the enabled smart fix options into one transform.
+
+    The returned function applies the fixes in order to a track dict (Name, Artist,
+    Album, Genre, Comments, Label, Remixer) in place and returns True if the track
+    should be written back.
+    """
+    steps: List[Callable[[Dict[str, str]], bool]] = []
+
+    if fixes.get('extractArtistEnabled'):
+        separator = fixes.get('extractArtistSeparator', ' - ')
+        result_number = fixes.get('extractArtistResultNumber', 1) - 1  # Convert to 0-based
+
+        def extract_artist(data: Dict[str, str]) -> bool:
+            if data['Name'] and separator in data['Name']:
+                parts = data['Name'].split(separator)
+                if 0 <= result_number < len(parts):
+                    extracted_artist = parts[result_number].strip()
+                    if extracted_artist and not data['Artist']:
+                        data['Artist'] = extracted_artist
+                        # Remove the extracted part from title
+                        parts.pop(result_number)
+                        data['Name'] = separator.join(parts).strip()
+                        return True
+            return False
+        steps.append(extract_artist)
+
+    if fixes.get('replaceCharsEnabled'):
+        chars_to_replace = list(fixes.get('replaceCharsList', '_'))
+
+        def replace_chars(data: Dict[str, str]) -> bool:
+            changed = False
+            for field in SMART_FIX_FIELDS:
+                if data[field] and chars_to_replace:
+                    value = data[field]
+                    for char in chars_to_replace:
+                        value = value.replace(char, ' ')
+                    data[field] = value
+                    changed = True
+            return changed
+        steps.append(replace_chars)
+
+    def for_fields(option: str, func: Callable[[str], Tuple[str, bool]]) -> None:
+        """Add a step applying ``func`` to the non-empty fields selected by ``option``."""
+        fields = list(fixes.get(option, []))
+
+        def step(data: Dict[str, str]) -> bool:
+            changed = False
+            for field in fields:
+                if field in data and data[field]:
+                    data[field], field_changed = func(data[field])
+                    changed = changed or field_changed
+            return changed
+        steps.append(step)
+
+    if fixes.get('removeGarbageEnabled'):
+        # Collapse whitespace and strip leading/trailing special chars
+        for_fields('removeGarbageFields', lambda v: (_GARBAGE_RE.sub('', _WHITESPACE_RE.sub(' ', v)), True))
+
+    if fixes.get('addRemixParenthesisEnabled'):
+        def add_parenthesis(value: str) -> Tuple[str, bool]:
+            match = _REMIX_SUFFIX_RE.search(value)
+            if match and '(' not in value:
+                remix_text = match.group(1).strip()
+                return f"{_REMIX_SUFFIX_RE.sub('', value).strip()} ({remix_text})", True
+            return value, False
+        for_fields('addRemixParenthesisFields', add_parenthesis)
+
+    if fixes.get('extractRemixerEnabled'):
+        def extract_remixer(data: Dict[str, str]) -> bool:
+            if not data['Name']:
+                return False
+            # Look for patterns like (Artist Remix) or (Artist Extended Remix)
+            for pattern in _REMIXER_RES:
+                match = pattern.search(data['Name'])
+                if match:
+                    remixer = match.group(1).strip()
+                    # Filter out generic terms
+                    if not any(word in remixer.lower() for word in _REMIXER_FILTER_WORDS):
+                        data['Remixer'] = remixer
+                        # Remove the remix info and leftover empty parentheses from the title
+                        name = pattern.sub('', data['Name']).strip()
+                        name = _EMPTY_PARENS_RE.sub('', name)
+                        data['Name'] = _WHITESPACE_RE.sub(' ', name).strip()
+                        return True
+            return False
+        steps.append(extract_remixer)
+
+    if fixes.get('removeUrlsEnabled'):
+        if fixes.get('removeUrlsDeleteAll'):
+            # Delete entire field if it contains a URL
+            for_fields('removeUrlsFields', lambda v: ('', True) if _URL_RE.search(v) else (v, False))
+        else:
+            def remove_urls(value: str) -> Tuple[str, bool]:
+                cleaned = _URL_RE.sub('', value).strip()
+                return cleaned, cleaned != value
+            for_fields('removeUrlsFields', remove_urls)
+
+    if fixes.get('fixCasingEnabled'):
+        # ALL UPPERCASE or all lowercase text becomes title case
+        for_fields(
+            'fixCasingFields',
+            lambda v: (v.title(), True) if v.isupper() or v.islower() else (v, False),
+        )
+
+    if fixes.get('removeNumberPrefixEnabled'):
+        def remove_number_prefix(value: str) -> Tuple[str, bool]:
+            for pattern in _NUMBER_PREFIX_RES:
+                value = pattern.sub('', value)
+            return value, True
+        for_fields('removeNumberPrefixFields', remove_number_prefix)
+
+    def transform(data: Dict[str, str]) -> bool:
+        changed = False
+        for step in steps:
+            if step(data):
+                changed = True
+        return changed
+
+    return transform
+
+
+def _strip_smart_fix_fields(data: Dict[str, str]) -> None:
+    """Strip surrounding whitespace from the fixed fields, as written to the database."""
+    for field in SMART_FIX_FIELDS:
+        if data[field]:
+            data[field] = data[field].strip()
+
+
+def _preview_smart_fixes(fixes: Dict[str, Any], rows: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Return the before/after diffs the smart fixes would produce for ``rows``.
+
+    Module-level so it can run in a process pool worker; nothing is written.
+    """
+    apply_fixes = _compile_smart_fixes(fixes)
+    diffs = []
+    for before in rows:
+        after = dict(before)
+        if not apply_fixes(after):
+            continue
+        _strip_smart_fix_fields(after)
+        changes = {
+            field: {"before": before[field], "after": after[field]}
+            for field in SMART_FIX_FIELDS + ('Remixer',)
+            if after[field] != before[field]
+        }
+        if changes:
+            diffs.append({"TrackID": before['TrackID'], "changes": changes})
+    return diffs
+
+
+class AnlzCache:
+    """On-disk cache of decoded ANLZ waveform previews and cue lists.
+
+    Entries are keyed by ANLZ directory and validated against the signature
+    (path, mtime, size) of the ANLZ files, so a re-analysis in Rekordbox
+    invalidates them automatically. Payloads are stored as packed binary
+    blobs. Track path lookups are cached as well and are only trusted while
+    master.db itself is unchanged.
+    """
+
+    FILENAME = "anlz_cache.sqlite"
+    # Bump when the decoded payload changes; older entries are discarded
+    VERSION = 1
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS anlz")
+            self.conn.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS anlz (
+                anlz_dir TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                waveform BLOB,
+                cues BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS track_paths (
+                folder_path TEXT PRIMARY KEY,
+                db_signature TEXT NOT NULL,
+                content_id TEXT NOT NULL,
+                anlz_dir TEXT NOT NULL,
+                duration_ms INTEGER
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get_track(self, folder_path: str, db_signature: str) -> Optional[Tuple[str, str, Optional[int]]]:
+        row = self.conn.execute(
+            "SELECT db_signature, content_id, anlz_dir, duration_ms FROM track_paths WHERE folder_path = ?",
+            (folder_path,),
+        ).fetchone()
+        if row is None or row[0] != db_signature:
+            return None
+        return row[1], row[2], row[3]
+
+    def put_track(self, folder_path: str, db_signature: str, content_id: str,
+                  anlz_dir: str, duration_ms: Optional[int]) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO track_paths VALUES (?, ?, ?, ?, ?)",
+            (folder_path, db_signature, content_id, anlz_dir, duration_ms),
+        )
+        self.conn.commit()
+
+    def get(self, anlz_dir: str, signature: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT signature, waveform, cues FROM anlz WHERE anlz_dir = ?", (anlz_dir,)
+        ).fetchone()
+        if row is None or row[0] != signature:
+            return None
+        waveform = np.frombuffer(row[1], dtype=np.uint8) if row[1] is not None else None
+        return {"waveform": waveform, "cues": np.frombuffer(row[2], dtype=CUE_DTYPE)}
+
+    def put(self, anlz_dir: str, signature: str, decoded: Dict[str, Any]) -> None:
+        waveform = decoded["waveform"]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO anlz VALUES (?, ?, ?, ?)",
+            (
+                anlz_dir,
+                signature,
+                waveform.tobytes() if waveform is not None else None,
+                decoded["cues"].tobytes(),
+            ),
+        )
+        self.conn.commit()
+
+
+class AnlzIndex:
+    """Persistent index of the ANLZ directories below share/PIONEER/USBANLZ.
+
+    Holds every analysis directory, keyed like ``key_for`` (the parent of an
+    ``AnalysisDataPath``, e.g. ``/PIONEER/USBANLZ/735/e8b81...``), so
+    ``index-anlz`` can match it against the library to find tracks without
+    analysis and orphaned directories. The files of a directory are not stored:
+    resolving a track lists its directory once, which is always current.
+    """
+
+    FILENAME = "anlz_index.sqlite"
+    # Bump when the table layout changes; older indexes are discarded
+    VERSION = 2
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS anlz_dirs")
+            self.conn.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS anlz_dirs (
+                analysis_dir TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @staticmethod
+    def key_for(analysis_data_path: str) -> str:
+        """Index key (analysis directory) of an AnalysisDataPath value."""
+        return "/" + Path(analysis_data_path.replace("\\", "/").strip("/")).parent.as_posix()
+
+    def rebuild(self, share_dir: str, max_workers: Optional[int] = None) -> int:
+        """Re-index all ANLZ directories in a single parallel scandir pass."""
+        root = os.path.join(share_dir, "PIONEER", "USBANLZ")
+        index = index_anlz_dirs(root, max_workers=max_workers) if os.path.isdir(root) else {}
+        rows = [("/" + Path(os.path.relpath(anlz_dir, share_dir)).as_posix(),) for anlz_dir in index]
+        with self.conn:
+            self.conn.execute("DELETE FROM anlz_dirs")
+            self.conn.executemany("INSERT INTO anlz_dirs VALUES (?)", rows)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (datetime.now().isoformat(),)
+            )
+        return len(rows)
+
+    def analysis_dirs(self) -> set:
+        return {row[0] for row in self.conn.execute("SELECT analysis_dir FROM anlz_dirs")}
+
+
+class BeatgridCache:
+    """Queryable cache of per-track beat grid statistics.
+
+    Rows are keyed by content ID; the grid statistics are validated against
+    the ANLZ signature (see ``_anlz_dir_signature``) while the database BPM
+    and the resulting mismatch are refreshed on every analysis run.
+    """
+
+    FILENAME = "beatgrid_cache.sqlite"
+    STAT_COLUMNS = (
+        "source", "beat_count", "bpm_avg", "bpm_min", "bpm_max", "tempo_changes",
+        "variable_bpm", "drift_ms", "grid_error_ms", "first_beat_ms", "first_downbeat_ms",
+    )
+    COLUMNS = ("content_id", "anlz_dir", "signature") + STAT_COLUMNS + ("db_bpm", "bpm_mismatch")
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS beatgrids (
+                content_id TEXT PRIMARY KEY,
+                anlz_dir TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                source TEXT,
+                beat_count INTEGER,
+                bpm_avg REAL,
+                bpm_min REAL,
+                bpm_max REAL,
+                tempo_changes INTEGER,
+                variable_bpm INTEGER,
+                drift_ms REAL,
+                grid_error_ms REAL,
+                first_beat_ms REAL,
+                first_downbeat_ms REAL,
+                db_bpm REAL,
+                bpm_mismatch REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_beatgrids_mismatch ON beatgrids (bpm_mismatch);
+            CREATE INDEX IF NOT EXISTS idx_beatgrids_drift ON beatgrids (drift_ms);
+            CREATE INDEX IF NOT EXISTS idx_beatgrids_variable ON beatgrids (variable_bpm);
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def signatures(self) -> Dict[str, Tuple[str, str]]:
+        """content_id -> (anlz_dir, signature) of all cached rows."""
+        rows = self.conn.execute("SELECT content_id, anlz_dir, signature FROM beatgrids")
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def put_many(self, rows: List[Tuple]) -> None:
+        placeholders = ", ".join("?" * len(self.COLUMNS))
+        with self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO beatgrids VALUES ({placeholders})", rows)
+
+    def update_bpms(self, db_bpms: Dict[str, Optional[float]]) -> None:
+        """Refresh the database BPM of cached rows and recompute the mismatch."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE beatgrids SET db_bpm = ?, bpm_mismatch = ABS(bpm_avg - ?) WHERE content_id = ?",
+                [(bpm, bpm, cid) for cid, bpm in db_bpms.items()],
+            )
+
+    def prune(self, content_ids: set) -> int:
+        """Remove rows of contents that no longer exist."""
+        stale = [cid for cid in self.signatures() if cid not in content_ids]
+        with self.conn:
+            self.conn.executemany("DELETE FROM beatgrids WHERE content_id = ?", [(cid,) for cid in stale])
+        return len(stale)
+
+    def query(self, min_bpm_mismatch: Optional[float] = None, min_drift_ms: Optional[float] = None,
+              variable_bpm: Optional[bool] = None, order_by: str = "bpm_mismatch",
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if order_by not in self.COLUMNS:
+            raise ValueError(f"Invalid order_by column: {order_by}")
+        where, params = [], []
+        if min_bpm_mismatch is not None:
+            where.append("bpm_mismatch >= ?")
+            params.append(min_bpm_mismatch)
+        if min_drift_ms is not None:
+            where.append("drift_ms >= ?")
+            params.append(min_drift_ms)
+        if variable_bpm is not None:
+            where.append("variable_bpm = ?")
+            params.append(int(variable_bpm))
+        sql = f"SELECT {', '.join(self.COLUMNS)} FROM beatgrids"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order_by} DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        rows = []
+        for row in self.conn.execute(sql, params):
+            item = dict(zip(self.COLUMNS, row))
+            item["variable_bpm"] = bool(item["variable_bpm"])
+            del item["signature"]
+            rows.append(item)
+        return rows
+
+
+class WaveformCache:
+    """On-disk cache of multi-resolution waveform pyramids.
+
+    Every level is stored as its own packed blob, so a slice request only
+    reads the bytes of the requested range of a single level.
+    """
+
+    FILENAME = "waveform_cache.sqlite"
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pyramids (
+                anlz_dir TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                source TEXT,
+                entry_count INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS levels (
+                anlz_dir TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                bucket_count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (anlz_dir, level)
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get_info(self, anlz_dir: str, signature: str) -> Optional[Tuple[Optional[str], int]]:
+        """(source, entry_count) of a cached pyramid, None if missing or stale.
+
+        A cached source of None records that the track has no detail waveform.
+        """
+        row = self.conn.execute(
+            "SELECT signature, source, entry_count FROM pyramids WHERE anlz_dir = ?", (anlz_dir,)
+        ).fetchone()
+        if row is None or row[0] != signature:
+            return None
+        return row[1], row[2]
+
+    def put(self, anlz_dir: str, signature: str, pyramid: Optional[Dict[str, Any]]) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM levels WHERE anlz_dir = ?", (anlz_dir,))
+            if pyramid is None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pyramids VALUES (?, ?, NULL, 0)", (anlz_dir, signature)
+                )
+                return
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pyramids VALUES (?, ?, ?, ?)",
+                (anlz_dir, signature, pyramid["source"], pyramid["entry_count"]),
+            )
+            self.conn.executemany(
+                "INSERT INTO levels VALUES (?, ?, ?, ?)",
+                [(anlz_dir, i, len(b), b.tobytes()) for i, b in enumerate(pyramid["levels"])],
+            )
+
+    def get_slice(self, anlz_dir: str, level: int, start: int, end: int) -> np.ndarray:
+        """Buckets ``start:end`` of a level, read without loading the whole blob."""
+        size = WAVEFORM_BUCKET_DTYPE.itemsize
+        row = self.conn.execute(
+            "SELECT substr(data, ?, ?) FROM levels WHERE anlz_dir = ? AND level = ?",
+            (start * size + 1, max(end - start, 0) * size, anlz_dir, level),
+        ).fetchone()
+        if row is None or row[0] is None:
+            return np.zeros(0, dtype=WAVEFORM_BUCKET_DTYPE)
+        return np.frombuffer(row[0], dtype=WAVEFORM_BUCKET_DTYPE)
+
+
+class DigestCache:
+    """Content digests of library files, valid while a file's size and mtime are unchanged."""
+
+    FILENAME = "file_digests.sqlite"
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS digests (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sample TEXT,
+                full TEXT
+            )
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get_all(self) -> Dict[str, Tuple[int, int, Optional[str], Optional[str]]]:
+        rows = self.conn.execute("SELECT path, size, mtime_ns, sample, full FROM digests")
+        return {row[0]: row[1:] for row in rows}
+
+    def replace_all(self, rows: List[Tuple[str, int, int, Optional[str], Optional[str]]]) -> None:
+        """Store the digests of the current library, dropping files no longer in it."""
+        with self.conn:
+            self.conn.execute("DELETE FROM digests")
+            self.conn.executemany("INSERT INTO digests VALUES (?, ?, ?, ?, ?)", rows)
+
+
+class DirectoryListingCache:
+    """File names per directory, valid while the directory's mtime is unchanged."""
+
+    FILENAME = "dir_listings.sqlite"
+    # Listings younger than this are not trusted: coarse mtime resolution (FAT, SMB)
+    # could hide a change made within the same tick
+    MIN_AGE_NS = 2_000_000_000
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS listings (
+                directory TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                names TEXT NOT NULL
+            )
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def mtimes(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT directory, mtime_ns FROM listings"))
+
+    def names(self, directory: str) -> List[str]:
+        row = self.conn.execute(
+            "SELECT names FROM listings WHERE directory = ?", (directory,)
+        ).fetchone()
+        return json.loads(row[0])
+
+    def put_many(self, rows: List[Tuple[str, int, List[str]]]) -> None:
+        cutoff = time.time_ns() - self.MIN_AGE_NS
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?, ?)",
+                [(d, mtime, json.dumps(names)) for d, mtime, names in rows if mtime < cutoff],
+            )
+
+
+class IntegrityCheckCache:
+    """Integrity check results and table scan resume points, per database signature."""
+
+    FILENAME = "integrity_checks.sqlite"
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                mode TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                result TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS scan_progress (
+                signature TEXT NOT NULL,
+                tbl TEXT NOT NULL,
+                last_rowid INTEGER,
+                done INTEGER NOT NULL,
+                PRIMARY KEY (signature, tbl)
+            );
+            CREATE TABLE IF NOT EXISTS bad_ranges (
+                signature TEXT NOT NULL,
+                tbl TEXT NOT NULL,
+                first_rowid INTEGER,
+                last_rowid INTEGER,
+                error TEXT NOT NULL
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def get_result(self, mode: str, signature: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT result FROM results WHERE mode = ? AND signature = ?", (mode, signature)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_result(self, mode: str, signature: str, result: Dict[str, Any]) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (mode, signature, json.dumps(result))
+            )
+
+    def scan_state(self, signature: str, restart: bool = False) -> Dict[str, Tuple[Optional[int], bool]]:
+        """Resume points per table; progress recorded for other signatures is dropped."""
+        with self.conn:
+            for table in ("scan_progress", "bad_ranges"):
+                if restart:
+                    self.conn.execute(f"DELETE FROM {table}")
+                else:
+                    self.conn.execute(f"DELETE FROM {table} WHERE signature != ?", (signature,))
+        rows = self.conn.execute(
+            "SELECT tbl, last_rowid, done FROM scan_progress WHERE signature = ?", (signature,)
+        )
+        return {tbl: (last_rowid, bool(done)) for tbl, last_rowid, done in rows}
+
+    def save_progress(self, signature: str, table: str, last_rowid: Optional[int], done: bool,
+                      bad: List[Tuple[Optional[int], Optional[int], str]]) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scan_progress VALUES (?, ?, ?, ?)",
+                (signature, table, last_rowid, int(done)),
+            )
+            self.conn.executemany(
+                "INSERT INTO bad_ranges VALUES (?, ?, ?, ?, ?)",
+                [(signature, table, first, last, error) for first, last, error in bad],
+            )
+
+    def bad_ranges(self, signature: str) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT tbl, first_rowid, last_rowid, error FROM bad_ranges WHERE signature = ? "
+            "ORDER BY tbl, first_rowid",
+            (signature,),
+        )
+        return [
+            {"table": tbl, "first_rowid": first, "last_rowid": last, "error": error}
+            for tbl, first, last, error in rows
+        ]
+
+
+class SmartPlaylistCache:
+    """Persistent smart playlist results, keyed by SmartList XML hash and local USN.
+
+    Entries stay valid until the library's local USN changes. Lists with relative
+    date conditions (IN_LAST / NOT_IN_LAST) also record the day they were evaluated
+    on and expire at midnight.
+    """
+
+    FILENAME = "smart_playlist_cache.sqlite"
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                xml_hash TEXT PRIMARY KEY,
+                usn INTEGER NOT NULL,
+                date_bucket TEXT NOT NULL,
+                ids TEXT NOT NULL,
+                tracks TEXT
+            )
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @staticmethod
+    def key_for(smart_list_xml: str) -> str:
+        return hashlib.sha1(smart_list_xml.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def date_bucket(smart_list_xml: str) -> str:
+        """Evaluation day for lists with relative date conditions, else an empty string."""
+        smart = SmartList()
+        smart.parse(smart_list_xml)
+        relative = (Operator.IN_LAST, Operator.NOT_IN_LAST)
+        if any(cond.operator in relative for cond in smart.conditions):
+            return datetime.now().date().isoformat()
+        return ""
+
+    def _row(self, xml_hash: str, usn: int) -> Optional[Tuple[str, Optional[str]]]:
+        row = self.conn.execute(
+            "SELECT usn, date_bucket, ids, tracks FROM results WHERE xml_hash = ?", (xml_hash,)
+        ).fetchone()
+        if row is None or row[0] != usn:
+            return None
+        if row[1] and row[1] != datetime.now().date().isoformat():
+            return None
+        return row[2], row[3]
+
+    def get_ids(self, xml_hash: str, usn: int) -> Optional[List[str]]:
+        row = self._row(xml_hash, usn)
+        return json.loads(row[0]) if row else None
+
+    def get_tracks(self, xml_hash: str, usn: int) -> Optional[List[Dict[str, Any]]]:
+        row = self._row(xml_hash, usn)
+        return json.loads(row[1]) if row and row[1] is not None else None
+
+    def put(self, xml_hash: str, usn: int, date_bucket: str, ids: List[str],
+            tracks: Optional[List[Dict[str, Any]]] = None) -> None:
+        # Storing only the IDs keeps track rows cached for the same USN and day
+        self.conn.execute(
+            """
+            INSERT INTO results VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(xml_hash) DO UPDATE SET
+                ids = excluded.ids,
+                tracks = CASE
+                    WHEN excluded.tracks IS NOT NULL THEN excluded.tracks
+                    WHEN results.usn = excluded.usn
+                        AND results.date_bucket = excluded.date_bucket THEN results.tracks
+                END,
+                usn = excluded.usn,
+                date_bucket = excluded.date_bucket
+            """,
+            (
+                xml_hash,
+                usn,
+                date_bucket,
+                json.dumps(ids),
+                json.dumps(tracks) if tracks is not None else None,
+            ),
+        )
+        self.conn.commit()
+
+
+class LibraryIndex:
+    """Unencrypted, denormalized copy of the track library next to master.db.
+
+    Read-heavy verbs are served from here instead of decrypting master.db and joining
+    the related tables through SQLAlchemy. ``sync`` keeps it current incrementally:
+    rows are refreshed by ``rb_local_usn`` (including tracks whose artist, album,
+    genre, key, label or My-Tag entries changed) and deletions are found by ID diffs.
+
+    When SQLite has FTS5, ``tracks_fts`` indexes the searchable fields of ``tracks``
+    (kept in step by triggers) for ranked prefix search.
+    """
+
+    FILENAME = "library_index.sqlite"
+    # Bump when the schema or the track payload changes; the index is then rebuilt
+    VERSION = 3
+    # IN (...) chunk size, below SQLite's default host parameter limit
+    CHUNK_SIZE = 500
+    TRACK_COLUMNS = (
+        "id", "usn", "title", "artist", "original_artist", "album", "genre", "key_name",
+        "label", "remixer", "composer", "comments", "folder_path", "file_name", "file_size",
+        "length", "bpm", "rating", "release_year", "date_added", "payload",
+    )
+    # Full-text searchable columns and their bm25 weights (a title hit ranks highest)
+    SEARCH_WEIGHTS = {
+        "title": 10.0,
+        "artist": 6.0,
+        "original_artist": 3.0,
+        "composer": 3.0,
+        "remixer": 3.0,
+        "album": 4.0,
+        "genre": 2.0,
+        "key_name": 1.0,
+        "comments": 0.5,
+    }
+
+    def __init__(self, cache_dir: str):
+        self.conn = _open_cache_db(cache_dir, self.FILENAME)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            self.conn.executescript(
+                """
+                DROP TABLE IF EXISTS tracks_fts;
+                DROP TABLE IF EXISTS tracks;
+                DROP TABLE IF EXISTS track_tags;
+                DROP TABLE IF EXISTS playlist_tracks;
+                DROP TABLE IF EXISTS snapshot_columns;
+                DROP TABLE IF EXISTS meta;
+                """
+            )
+            self.conn.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tracks (
+                id TEXT PRIMARY KEY,
+                usn INTEGER,
+                title TEXT,
+                artist TEXT,
+                original_artist TEXT,
+                album TEXT,
+                genre TEXT,
+                key_name TEXT,
+                label TEXT,
+                remixer TEXT,
+                composer TEXT,
+                comments TEXT,
+                folder_path TEXT,
+                file_name TEXT,
+                file_size INTEGER,
+                length INTEGER,
+                bpm REAL,
+                rating INTEGER,
+                release_year INTEGER,
+                date_added TEXT,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS tracks_title ON tracks (title COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS tracks_folder_path ON tracks (folder_path);
+            CREATE INDEX IF NOT EXISTS tracks_file ON tracks (file_name, file_size);
+            CREATE INDEX IF NOT EXISTS tracks_usn ON tracks (usn);
+            CREATE TABLE IF NOT EXISTS track_tags (
+                id TEXT PRIMARY KEY,
+                content_id TEXT NOT NULL,
+                tag_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS track_tags_content ON track_tags (content_id);
+            CREATE INDEX IF NOT EXISTS track_tags_tag ON track_tags (tag_id);
+            CREATE TABLE IF NOT EXISTS playlist_tracks (
+                id TEXT PRIMARY KEY,
+                content_id TEXT NOT NULL,
+                playlist_id TEXT NOT NULL,
+                track_no INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS playlist_tracks_playlist
+                ON playlist_tracks (playlist_id, track_no);
+            CREATE INDEX IF NOT EXISTS playlist_tracks_content ON playlist_tracks (content_id);
+            CREATE TABLE IF NOT EXISTS snapshot_columns (
+                name TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value
+            );
+            """
+        )
+        self.fts = self._create_fts()
+
+    def _create_fts(self) -> bool:
+        """Create the external-content FTS5 index over ``tracks``; False if FTS5 is missing."""
+        columns = ", ".join(self.SEARCH_WEIGHTS)
+        new_values = ", ".join(f"new.{col}" for col in self.SEARCH_WEIGHTS)
+        old_values = ", ".join(f"old.{col}" for col in self.SEARCH_WEIGHTS)
+        try:
+            self.conn.executescript(
+                f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+                    {columns},
+                    content='tracks', content_rowid='rowid',
+                    prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+                    INSERT INTO tracks_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+                    INSERT INTO tracks_fts (tracks_fts, rowid, {columns})
+                        VALUES ('delete', old.rowid, {old_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE ON tracks BEGIN
+                    INSERT INTO tracks_fts (tracks_fts, rowid, {columns})
+                        VALUES ('delete', old.rowid, {old_values});
+                    INSERT INTO tracks_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+                END;
+                """
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Warning: FTS5 unavailable, search falls back to master.db: {e}", file=sys.stderr)
+            return False
+        return True
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _get_meta(self, key: str) -> Any:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: Any) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _chunks(self, ids) -> List[List[str]]:
+        ids = list(ids)
+        return [ids[i:i + self.CHUNK_SIZE] for i in range(0, len(ids), self.CHUNK_SIZE)]
+
+    def _ids_referencing(self, db, columns, ids) -> set:
+        """IDs of the rows of the table of ``columns`` that reference any of ``ids``."""
+        table_id = columns[0].class_.ID
+        found = set()
+        for chunk in self._chunks(ids):
+            query = db.query(table_id).filter(or_(*(col.in_(chunk) for col in columns)))
+            found.update(row[0] for row in query)
+        return found
+
+    def _sync_links(self, db, table, index_table: str, columns, last_usn: int) -> set:
+        """Mirror a link table (song/My-Tag or song/playlist); returns the touched content IDs."""
+        db_ids = {row[0] for row in db.query(table.ID)}
+        index_rows = {
+            row[0]: row[1]
+            for row in self.conn.execute(f"SELECT id, content_id FROM {index_table}")
+        }
+        deleted = set(index_rows) - db_ids
+        changed = {row[0] for row in db.query(table.ID).filter(table.rb_local_usn > last_usn)}
+        changed |= db_ids - set(index_rows)
+
+        touched = {index_rows[i] for i in deleted}
+        self.conn.executemany(f"DELETE FROM {index_table} WHERE id = ?", [(i,) for i in deleted])
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        for chunk in self._chunks(changed):
+            rows = db.query(table.ID, *columns).filter(table.ID.in_(chunk)).all()
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {index_table} VALUES ({placeholders})",
+                [tuple(row) for row in rows],
+            )
+            touched.update(index_rows[row[0]] for row in rows if row[0] in index_rows)
+            touched.update(row[1] for row in rows)
+        return touched
+
+    def sync(self, db, to_track, signature: str = "", file_id: str = "") -> Dict[str, Any]:
+        """Bring the index up to date with ``db``.
+
+        ``to_track`` converts a DjmdContent row into the stored track payload.
+        ``signature`` is the mtime/size signature of master.db and ``file_id`` its
+        device/inode, which changes when the file is replaced rather than written.
+        """
+        usn = db.get_local_usn()
+        last = self._get_meta("usn")
+        content_count = db.query(DjmdContent.ID).count()
+        indexed_count = self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        if (last is not None and int(last) == usn and content_count == indexed_count
+                and self._get_meta("signature") == signature):
+            return {"usn": usn, "updated": 0, "deleted": 0, "full": False}
+
+        # A USN that went backwards or a different file means master.db was replaced
+        # (e.g. restored); its USNs can't be compared with the indexed ones
+        full = last is None or int(last) > usn or self._get_meta("file_id") != file_id
+        if full:
+            self.conn.executescript(
+                "DELETE FROM tracks; DELETE FROM track_tags; DELETE FROM playlist_tracks;"
+            )
+        last_usn = -1 if full else int(last)
+
+        db_ids = {row[0] for row in db.query(DjmdContent.ID)}
+        indexed_ids = {row[0] for row in self.conn.execute("SELECT id FROM tracks")}
+        deleted = indexed_ids - db_ids
+        changed = db_ids - indexed_ids
+        changed.update(
+            row[0] for row in db.query(DjmdContent.ID).filter(DjmdContent.rb_local_usn > last_usn)
+        )
+
+        # Tracks whose denormalized names changed through a related table
+        if not full:
+            artists = {row[0] for row in db.query(DjmdArtist.ID).filter(DjmdArtist.rb_local_usn > last_usn)}
+            albums = {row[0] for row in db.query(DjmdAlbum.ID).filter(DjmdAlbum.rb_local_usn > last_usn)}
+            if artists:
+                albums |= self._ids_referencing(db, (DjmdAlbum.AlbumArtistID,), artists)
+                changed |= self._ids_referencing(db, (
+                    DjmdContent.ArtistID, DjmdContent.RemixerID, DjmdContent.OrgArtistID,
+                    DjmdContent.ComposerID, DjmdContent.Lyricist,
+                ), artists)
+            if albums:
+                changed |= self._ids_referencing(db, (DjmdContent.AlbumID,), albums)
+            for table, column in (
+                (DjmdGenre, DjmdContent.GenreID),
+                (DjmdKey, DjmdContent.KeyID),
+                (DjmdLabel, DjmdContent.LabelID),
+            ):
+                ids = {row[0] for row in db.query(table.ID).filter(table.rb_local_usn > last_usn)}
+                if ids:
+                    changed |= self._ids_referencing(db, (column,), ids)
+            tags = {row[0] for row in db.query(DjmdMyTag.ID).filter(DjmdMyTag.rb_local_usn > last_usn)}
+            if tags:
+                for chunk in self._chunks(tags):
+                    changed.update(
+                        row[0] for row in db.query(DjmdSongMyTag.ContentID).filter(
+                            DjmdSongMyTag.MyTagID.in_(chunk)
+                        )
+                    )
+
+        changed |= self._sync_links(
+            db, DjmdSongMyTag, "track_tags",
+            (DjmdSongMyTag.ContentID, DjmdSongMyTag.MyTagID), last_usn,
+        )
+        self._sync_links(
+            db, DjmdSongPlaylist, "playlist_tracks",
+            (DjmdSongPlaylist.ContentID, DjmdSongPlaylist.PlaylistID, DjmdSongPlaylist.TrackNo),
+            last_usn,
+        )
+
+        changed &= db_ids
+        self.conn.executemany("DELETE FROM tracks WHERE id = ?", [(i,) for i in deleted])
+        for chunk in self._chunks(changed):
+            rows = []
+            for content in db.query(DjmdContent).filter(DjmdContent.ID.in_(chunk)):
+                track = to_track(content)
+                rows.append((
+                    str(content.ID),
+                    content.rb_local_usn,
+                    track["Name"],
+                    track["Artist"],
+                    track["OriginalArtist"],
+                    track["Album"],
+                    track["Genre"],
+                    track["Key"],
+                    track["Label"],
+                    track["Remixer"],
+                    track["Composer"],
+                    track["Comments"],
+                    content.FolderPath,
+                    content.FileNameL,
+                    content.FileSize,
+                    content.Length,
+                    content.BPM / 100.0 if content.BPM is not None else None,
+                    content.Rating,
+                    content.ReleaseYear,
+                    track["DateAdded"],
+                    json.dumps(track),
+                ))
+            self.conn.executemany(self._upsert_sql, rows)
+        self._set_meta("usn", usn)
+        self._set_meta("signature", signature)
+        self._set_meta("file_id", file_id)
+        self.conn.commit()
+        return {"usn": usn, "updated": len(changed), "deleted": len(deleted), "full": full}
+
+    @property
+    def _upsert_sql(self) -> str:
+        # ON CONFLICT ... DO UPDATE keeps the rowid stable, which the FTS index is keyed by
+        columns = ", ".join(self.TRACK_COLUMNS)
+        updates = ", ".join(f"{col} = excluded.{col}" for col in self.TRACK_COLUMNS[1:])
+        placeholders = ", ".join("?" * len(self.TRACK_COLUMNS))
+        return (
+            f"INSERT INTO tracks ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (id) DO UPDATE SET {updates}"
+        )
+
+    @staticmethod
+    def fts_query(text: str) -> str:
+        """FTS5 query matching every term of ``text`` as a prefix (implicit AND)."""
+        # Terms without a word character produce no tokens and would make the query invalid
+        terms = [term.replace('"', '""') for term in text.split() if any(ch.isalnum() for ch in term)]
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def search(self, text: str, limit: int = 100) -> List[str]:
+        """Content IDs matching all terms of ``text``, best field-weighted match first."""
+        query = self.fts_query(text)
+        if not query:
+            return []
+        sql = (
+            "SELECT t.id FROM tracks_fts JOIN tracks t ON t.rowid = tracks_fts.rowid "
+            "WHERE tracks_fts MATCH ?"
+        )
+        # A single character matches a large part of the library; ranking every hit would
+        # cost far more than the keystroke is worth, so return the first matches unranked
+        if len(text.strip()) > 1:
+            weights = ", ".join(str(w) for w in self.SEARCH_WEIGHTS.values())
+            sql += f" ORDER BY bm25(tracks_fts, {weights})"
+        rows = self.conn.execute(sql + " LIMIT ?", (query, limit))
+        return [row[0] for row in rows]
+
+    @property
+    def usn(self) -> Optional[int]:
+        value = self._get_meta("usn")
+        return int(value) if value is not None else None
+
+    def tracks(self) -> List[Dict[str, Any]]:
+        rows = self.conn.execute("SELECT payload FROM tracks ORDER BY date_added, id")
+        return [json.loads(row[0]) for row in rows]
+
+    def match_rows(self) -> List[Dict[str, Any]]:
+        """Per-track fields used for duplicate detection."""
+        rows = self.conn.execute(
+            "SELECT id, title, artist, length, file_size, "
+            "CAST(NULLIF(json_extract(payload, '$.BitRate'), '') AS INTEGER), rating, "
+            "CAST(NULLIF(json_extract(payload, '$.PlayCount'), '') AS INTEGER), "
+            "date_added, folder_path FROM tracks"
+        )
+        return [dict(zip(MATCH_FIELDS, row)) for row in rows]
+
+    def playlist_content_ids(self, playlist_id: str) -> List[str]:
+        """Content IDs of a regular playlist, in playlist order."""
+        return [
+            row[0]
+            for row in self.conn.execute(
+                "SELECT p.content_id FROM playlist_tracks p JOIN tracks t ON t.id = p.content_id "
+                "WHERE p.playlist_id = ? ORDER BY p.track_no",
+                (playlist_id,),
+            )
+        ]
+
+    def get_snapshot(self, usn: int, signature: str = "") -> Optional[Dict[str, np.ndarray]]:
+        """Columnar DjmdContent snapshot (for smart list previews) taken at ``usn``.
+
+        Numeric columns are stored as raw float64 bytes, text columns as JSON lists
+        and the My-Tag sets as JSON lists of sorted IDs.
+        """
+        if self._get_meta("snapshot_key") != f"{usn}|{signature}":
+            return None
+        snapshot = {}
+        for name, kind, data in self.conn.execute("SELECT name, kind, data FROM snapshot_columns"):
+            if kind == "float":
+                snapshot[name] = np.frombuffer(data, dtype="<f8").copy()
+            elif kind == "set":
+                values = json.loads(data)
+                snapshot[name] = np.empty(len(values), dtype=object)
+                snapshot[name][:] = [frozenset(v) for v in values]
+            else:
+                snapshot[name] = np.array(json.loads(data), dtype=object)
+        return snapshot if "ID" in snapshot else None
+
+    def put_snapshot(self, usn: int, snapshot: Dict[str, np.ndarray], signature: str = "") -> None:
+        rows = []
+        for name, values in snapshot.items():
+            if values.dtype.kind == "f":
+                rows.append((name, "float", values.astype("<f8").tobytes()))
+            elif len(values) and isinstance(values[0], frozenset):
+                rows.append((name, "set", json.dumps([sorted(v) for v in values])))
+            else:
+                rows.append((name, "text", json.dumps(values.tolist())))
+        self.conn.execute("DELETE FROM snapshot_columns")
+        self.conn.executemany("INSERT INTO snapshot_columns VALUES (?, ?, ?)", rows)
+        self._set_meta("snapshot_key", f"{usn}|{signature}")
+        self.conn.commit()
+
+
+def _read_rowid_range(cursor, table: str, first: int, last: int) -> Optional[str]:
+    """Read every column of the rows of ``table`` in [first, last]; return the error, if any."""
+    try:
+        cursor.execute(f'SELECT * FROM "{table}" WHERE rowid BETWEEN ? AND ?', (first, last))
+        while cursor.fetchmany(1000):
+            pass
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def _bisect_unreadable_rows(cursor, table: str, first: int, last: int) -> List[Tuple[int, str]]:
+    """Split the rowid range [first, last] until only single unreadable rows remain.
+
+    Returns ``(rowid, error)`` for each of them; readable halves cost one read each.
+    """
+    error = _read_rowid_range(cursor, table, first, last)
+    if error is None:
+        return []
+    if first == last:
+        return [(first, error)]
+    middle = (first + last) // 2
+    return (_bisect_unreadable_rows(cursor, table, first, middle)
+            + _bisect_unreadable_rows(cursor, table, middle + 1, last))
+
+
+def _salvage_columns(cursor, table: str, rowid: int, columns: List[str]) -> Dict[str, Any]:
+    """Read ``columns`` of one damaged row one by one, keeping those that still read."""
+    values = {}
+    for column in columns:
+        try:
+            row = cursor.execute(f'SELECT "{column}" FROM "{table}" WHERE rowid = ?', (rowid,)).fetchone()
+        except Exception:
+            continue
+        if row is not None:
+            values[column] = row[0]
+    return values
+
+
+def _read_rows_skipping(cursor, table: str, first: int, last: int,
+                        skipped: List[Tuple[int, str]]) -> List[Tuple]:
+    """Read ``(rowid, *columns)`` for [first, last], bisecting around unreadable rows.
+
+    Rows that can't be read because of corruption are appended to ``skipped`` as
+    ``(rowid, error)``; any other error (e.g. a locked database) is re-raised, so
+    rows are never dropped for a transient failure.
+    """
+    try:
+        cursor.execute(f'SELECT rowid, * FROM "{table}" WHERE rowid BETWEEN ? AND ? ORDER BY rowid',
+                       (first, last))
+        return cursor.fetchall()
+    except Exception as e:
+        if not RekordboxBridge._is_corruption_error(e):
+            raise
+        if first == last:
+            skipped.append((first, str(e)))
+            return []
+    middle = (first + last) // 2
+    return (_read_rows_skipping(cursor, table, first, middle, skipped)
+            + _read_rows_skipping(cursor, table, middle + 1, last, skipped))
+
+
+def _update_column_digests(digests: List[Any], rows: List[Tuple]) -> None:
+    """Feed ``rows`` column by column into ``digests`` (one blake2b per column)."""
+    for row in rows:
+        for digest, value in zip(digests, row):
+            digest.update(repr(value).encode("utf-8"))
+            digest.update(b"\x00")
+
+
+def _retained_snapshots(created: Dict[str, float], retention: Dict[str, int]) -> set:
+    """Pick the snapshots to keep under a last/hourly/daily/weekly retention policy.
+
+    The newest ``last`` snapshots are always kept, and never fewer than one, so a
+    policy of all zeros cannot delete the backup just taken; for each other period
+    the newest snapshot of each of the most recent ``n`` hours/days/ISO weeks is
+    kept too.
+    """
+    newest_first = sorted(created, key=lambda name: created[name], reverse=True)
+    keep = set(newest_first[:max(retention.get("last", 0), 1)])
+    for period, fmt in (("hourly", "%Y-%m-%d %H"), ("daily", "%Y-%m-%d"), ("weekly", "%G-%V")):
+        limit = retention.get(period, 0)
+        buckets = set()
+        for name in newest_first:
+            if len(buckets) >= limit:
+                break
+            bucket = datetime.fromtimestamp(created[name]).strftime(fmt)
+            if bucket not in buckets:
+                buckets.add(bucket)
+                keep.add(name)
+    return keep
+
+
+class BackupStore:
+    """Deduplicated snapshots of database files inside ``bonk_backups``.
+
+    A file is split into fixed-size chunks; SQLite rewrites whole pages in place,
+    so unchanged regions keep their offsets and their hashes. Each unique chunk is
+    stored once under ``chunks/`` and every snapshot is a JSON manifest under
+    ``manifests/`` listing its chunk hashes in order.
+    """
+
+    DIRNAME = "store"
+    MANIFEST_VERSION = 1
+
+    def __init__(self, backup_dir: str):
+        self.root = os.path.join(backup_dir, self.DIRNAME)
+        self.chunk_dir = os.path.join(self.root, "chunks")
+        self.manifest_dir = os.path.join(self.root, "manifests")
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def manifest_path(self, name: str) -> str:
+        return os.path.join(self.manifest_dir, f"{name}.json")
+
+    def snapshots(self, db_name: Optional[str] = None, strict: bool = False) -> List[Dict[str, Any]]:
+        """Manifests of the stored snapshots (optionally of one file), oldest first.
+
+        Unreadable manifests are skipped, or raise a ValueError with ``strict``.
+        """
+        manifests = []
+        for filename in os.listdir(self.manifest_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.manifest_dir, filename), "r") as f:
+                    manifest = json.load(f)
+                if not isinstance(manifest.get("chunks"), list):
+                    raise ValueError("no chunk list")
+            except (OSError, ValueError, AttributeError) as e:
+                if strict:
+                    raise ValueError(f"Backup manifest {filename} is unreadable: {e}")
+                continue
+            if db_name is None or manifest.get("db_name") == db_name:
+                manifest["name"] = filename[:-len(".json")]
+                manifests.append(manifest)
+        manifests.sort(key=lambda m: m["created"])
+        return manifests
+
+    def create(self, path: str, source_path: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+        """Snapshot ``path``; returns the manifest and the number of bytes newly stored.
+
+        ``source_path`` names the original file when ``path`` is a temporary copy of it.
+        """
+        source_path = source_path or path
+        db_name = os.path.basename(source_path)
+        chunks: List[str] = []
+        seen = set()
+        size = 0
+        new_bytes = 0
+        whole = hashlib.blake2b(digest_size=32)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(BACKUP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                whole.update(chunk)
+                digest = hashlib.blake2b(chunk, digest_size=20).hexdigest()
+                chunks.append(digest)
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                chunk_path = self._chunk_path(digest)
+                try:
+                    intact = os.path.getsize(chunk_path) == len(chunk)
+                except OSError:
+                    intact = False
+                if not intact:
+                    os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                    write_atomic(chunk_path, chunk)
+                    new_bytes += len(chunk)
+
+        created = time.time()
+        name = f"{db_name}.{datetime.fromtimestamp(created).strftime('%Y%m%d_%H%M%S_%f')}"
+        manifest = {
+            "version": self.MANIFEST_VERSION,
+            "db_name": db_name,
+            "source_path": os.path.abspath(source_path),
+            "created": created,
+            "size": size,
+            "chunk_size": BACKUP_CHUNK_SIZE,
+            "digest": whole.hexdigest(),
+            "chunks": chunks,
+        }
+        # The manifest is written last, so an interrupted backup leaves no snapshot
+        write_atomic(self.manifest_path(name), json.dumps(manifest).encode("utf-8"))
+        manifest["name"] = name
+        return manifest, new_bytes
+
+    def restore(self, name: str, target_path: str) -> Dict[str, Any]:
+        """Reassemble snapshot ``name`` into ``target_path`` after verifying every chunk."""
+        with open(self.manifest_path(name), "r") as f:
+            manifest = json.load(f)
+        whole = hashlib.blake2b(digest_size=32)
+        fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(target_path)}.", suffix=".tmp",
+                                   dir=os.path.dirname(os.path.abspath(target_path)))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for digest in manifest["chunks"]:
+                    with open(self._chunk_path(digest), "rb") as f:
+                        chunk = f.read()
+                    if hashlib.blake2b(chunk, digest_size=20).hexdigest() != digest:
+                        raise ValueError(f"Backup chunk {digest} is damaged")
+                    whole.update(chunk)
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            if whole.hexdigest() != manifest["digest"]:
+                raise ValueError(f"Restored file does not match snapshot {name}")
+            os.replace(tmp, target_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        manifest["name"] = name
+        return manifest
+
+    def prune(self, db_name: str, retention: Dict[str, int]) -> Tuple[List[str], int]:
+        """Apply ``retention`` to the snapshots of ``db_name`` and delete unreferenced chunks.
+
+        Chunks are only deleted when every manifest in the store could be read, so a
+        damaged manifest never costs the chunks of its snapshot. Returns the deleted
+        snapshot names and the number of chunk bytes freed.
+        """
+        created = {m["name"]: m["created"] for m in self.snapshots(db_name)}
+        keep = _retained_snapshots(created, retention)
+        deleted = [name for name in created if name not in keep]
+        for name in deleted:
+            os.remove(self.manifest_path(name))
+        if not deleted:
+            return deleted, 0
+
+        try:
+            manifests = self.snapshots(strict=True)
+        except ValueError as e:
+            print(f"Warning: keeping all backup chunks: {e}", file=sys.stderr)
+            return deleted, 0
+        referenced = set()
+        for manifest in manifests:
+            referenced.update(manifest["chunks"])
+        freed = 0
+        for entry in os.scandir(self.chunk_dir):
+            if not entry.is_dir():
+                continue
+            for chunk in os.scandir(entry.path):
+                if chunk.name not in referenced and not chunk.name.startswith("."):
+                    freed += chunk.stat().st_size
+                    os.remove(chunk.path)
+        return deleted, freed
+
+
+class RekordboxBridge:
+    """Bridge between Electron app and pyrekordbox"""
+    
+    def __init__(self):
+        self.db = None
+        self.config = None
+        self._smart_cache = None
+        self._library = None
+
+    # -----------------------------
+    # Helpers: DB safety / framing
+    # -----------------------------
+    @staticmethod
+    def _is_corruption_error(err: Exception) -> bool:
+        msg = str(err).lower()
+        return (
+            "database disk image is malformed" in msg
+            or "disk image is malformed" in msg
+            or "malformed" in msg
+            or "sqlcipher3.dbapi2.databaseerror" in msg and "malformed" in msg
+        )
+
+    def _safe_rollback(self) -> None:
+        try:
+            if self.db:
+                self.db.rollback()
+        except Exception:
+            pass
+
+    def _safe_commit(self, *, autoinc: bool = True) -> Optional[str]:
+        """Commit and return error string if failed."""
+        try:
+            if not self.db:
+                return "Database not open"
+            self.db.commit(autoinc=autoinc)
+            return None
+        except Exception as e:
+            self._safe_rollback()
+            return str(e)
+
+    def _stage_delete_track(self, content) -> None:
+        """Stage deletion of a track and its playlist links (no commit)."""
+        # Delete join rows first
+        playlist_entries = self.db.query(DjmdSongPlaylist).filter(
+            DjmdSongPlaylist.ContentID == content.ID
+        ).all()
+        for entry in playlist_entries:
+            # Use pyrekordbox delete wrapper so registry is tracked
+            self.db.delete(entry)
+        self.db.delete(content)
+
+    def _db_file_path(self) -> Optional[str]:
+        """Return the file path of the open database, parsed from the engine URL."""
+        if not self.db or not getattr(self.db, 'engine', None):
+            return None
+        url = str(self.db.engine.url)
+        if 'sqlite' not in url:
+            return None
+        if '@' in url:
+            # Encrypted: sqlite+pysqlcipher://:***@/path/to/db
+            path_part = url.split('@', 1)[1].split('?')[0]
+            if path_part.startswith('//'):
+                path_part = path_part[1:]
+            return os.path.abspath(path_part)
+        if ':///' in url:
+            # Unencrypted: sqlite:///path/to/db
+            return os.path.abspath(url.split(':///', 1)[1].split('?')[0])
+        return None
+
+    def _db_signature(self) -> str:
+        """mtime/size signature of master.db (and its WAL) to validate cached lookups."""
+        db_file = self._db_file_path()
+        parts = []
+        for path in (db_file, f"{db_file}-wal") if db_file else ():
+            try:
+                st = os.stat(path)
+                parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+            except OSError:
+                parts.append("-")
+        return "|".join(parts)
+
+    def _db_file_id(self) -> str:
+        """Device/inode of master.db; changes when the file is replaced instead of written."""
+        db_file = self._db_file_path()
+        try:
+            st = os.stat(db_file) if db_file else None
+        except OSError:
+            st = None
+        return f"{st.st_dev}:{st.st_ino}" if st else "-"
+
+    def _cache_dir(self) -> str:
+        """Directory for Bonk's derived data, next to the database (like bonk_backups)."""
+        return os.path.join(str(self.db.db_directory), BONK_CACHE_DIRNAME)
+
+    @staticmethod
+    def _normalize_track_path(track_path: str) -> str:
+        """Strip file:// prefixes and use forward slashes, as stored in FolderPath."""
+        normalized = str(track_path).replace("\\", "/")
+        for prefix in ("file://localhost", "file://"):
+            if normalized.lower().startswith(prefix.lower()):
+                normalized = normalized[len(prefix):].lstrip("/")
+                break
+        return normalized.strip()
+
+    def get_config(self) -> Dict[str, Any]:
+        """Get current pyrekordbox configuration"""
+        try:
+            # Ensure config is populated
+            if not pyrekordbox_config.get("pioneer"):
+                update_config()
+            
+            pioneer_config = pyrekordbox_config.get("pioneer", {})
+            rb6_config = pyrekordbox_config.get("rekordbox6", {})
+            rb7_config = pyrekordbox_config.get("rekordbox7", {})
+            
+            # Try to get database path from config
+            db_path = None
+            if rb7_config.get("db_path"):
+                db_path = str(rb7_config["db_path"])
+            elif rb6_config.get("db_path"):
+                db_path = str(rb6_config["db_path"])
+            
+            return {
+                "success": True,
+                "config": {
+                    "install_dir": str(pioneer_config.get("install_dir", "")) if pioneer_config.get("install_dir") else None,
+                    "app_dir": str(pioneer_config.get("app_dir", "")) if pioneer_config.get("app_dir") else None,
+                    "db_path": db_path,
+                }
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def set_config(self, install_dir: Optional[str] = None, app_dir: Optional[str] = None) -> Dict[str, Any]:
+        """Update pyrekordbox configuration"""
+        try:
+            if install_dir and app_dir:
+                update_config(install_dir, app_dir)
+            return {"success": True}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def open_database(self, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Open Rekordbox 6/7 database"""
+        try:
+            actual_path = None
+            if db_path:
+                # Verify the path exists
+                if not os.path.exists(db_path):
+                    return {
+                        "success": False,
+                        "error": f"Database file not found: {db_path}"
+                    }
+                actual_path = os.path.abspath(db_path)
+                print(f"Opening database from provided path: {actual_path}", file=sys.stderr)
+                # Rekordbox6Database uses 'path' parameter, not 'db_path'
+                self.db = Rekordbox6Database(path=db_path)
+            else:
+                print("Opening database using auto-detection...", file=sys.stderr)
+                try:
+                    self.db = Rekordbox6Database()
+                    # Get the actual path that was used
+                    try:
+                        if hasattr(self.db, 'engine') and self.db.engine:
+                            url = str(self.db.engine.url)
+                            if 'sqlite' in url and ':///' in url:
+                                parts = url.split(':///')
+                                if len(parts) > 1:
+                                    actual_path = parts[1].split('?')[0]
+                                    actual_path = os.path.abspath(actual_path)
+                    except:
+                        pass
+                except Exception as auto_error:
+                    # Auto-detection failed - provide helpful error message
+                    error_msg = str(auto_error)
+                    
+                    # Check common locations
+                    common_paths = []
+                    home_dir = os.path.expanduser("~")
+                    
+                    # macOS common locations
+                    if sys.platform == "darwin":
+                        common_paths = [
+                            os.path.join(home_dir, "Library", "Pioneer", "rekordbox", "master.db"),
+                            os.path.join(home_dir, "Library", "Pioneer", "rekordbox", "datafile.edb"),
+                            "/Applications/Pioneer/rekordbox 6/master.db",
+                            "/Applications/Pioneer/rekordbox 7/master.db",
+                        ]
+                    # Windows common locations
+                    elif sys.platform == "win32":
+                        appdata = os.environ.get("APPDATA", "")
+                        if appdata:
+                            common_paths = [
+                                os.path.join(appdata, "Pioneer", "rekordbox", "master.db"),
+                                os.path.join(appdata, "Pioneer", "rekordbox", "datafile.edb"),
+                            ]
+                    
+                    # Check if any common paths exist
+                    found_paths = [p for p in common_paths if os.path.exists(p)]
+                    
+                    suggestion = ""
+                    if found_paths:
+                        suggestion = f"\n\nFound database at: {found_paths[0]}\nPlease use 'Browse' to select this file manually."
+                    else:
+                        suggestion = "\n\nCommon locations to check:\n"
+                        for path in common_paths:
+                            suggestion += f"  - {path}\n"
+                        suggestion += "\nPlease use 'Browse' to manually select your master.db file."
+                    
+                    return {
+                        "success": False,
+                        "error": f"Failed to open database: {error_msg}{suggestion}"
+                    }
+            
+            # Verify database file exists and get its info
+            if actual_path:
+                if os.path.exists(actual_path):
+                    file_size = os.path.getsize(actual_path)
+                    print(f"✓ Database opened: {actual_path}", file=sys.stderr)
+                    print(f"  File size: {file_size:,} bytes ({file_size / (1024*1024):.2f} MB)", file=sys.stderr)
+                    # Verify it's actually a master.db file
+                    if actual_path.endswith('master.db'):
+                        print(f"  ✓ Confirmed: This is a master.db file", file=sys.stderr)
+                    else:
+                        print(f"  ⚠ Warning: File name is not 'master.db'", file=sys.stderr)
+                else:
+                    print(f"  ⚠ Warning: Database path does not exist: {actual_path}", file=sys.stderr)
+            
+            return {
+                "success": True,
+                "message": "Database opened successfully",
+                "db_path": actual_path
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            error_msg = str(e)
+            
+            # Provide helpful suggestions if auto-detection failed
+            if "No Rekordbox" in error_msg or "directory found" in error_msg:
+                home_dir = os.path.expanduser("~")
+                if sys.platform == "darwin":
+                    common_db = os.path.join(home_dir, "Library", "Pioneer", "rekordbox", "master.db")
+                    if os.path.exists(common_db):
+                        error_msg += f"\n\nFound database at: {common_db}\nPlease use 'Browse' to select this file."
+                    else:
+                        error_msg += f"\n\nCommon locations to check:\n  - {common_db}\n  - ~/Library/Pioneer/rekordbox/datafile.edb\n\nPlease use 'Browse' to manually select your master.db file."
+            
+            return {
+                "success": False,
+                "error": f"Failed to open database: {error_msg}"
+            }
+    
+    def close_database(self) -> Dict[str, Any]:
+        """Close the database connection"""
+        try:
+            if self.db:
+                self.db.close()
+                self.db = None
+            if self._smart_cache is not None:
+                self._smart_cache.close()
+                self._smart_cache = None
+            if self._library is not None:
+                self._library.close()
+                self._library = None
+            return {"success": True}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def backup_database(self, db_path: Optional[str] = None,
+                        retention: Optional[Dict[str, int]] = None,
+                        online: bool = False) -> Dict[str, Any]:
+        """Backup the Rekordbox database file into the deduplicated backup store.
+
+        Only chunks that changed since earlier snapshots are written. Old snapshots
+        are pruned with ``retention`` (keys last/hourly/daily/weekly, defaulting to
+        ``BACKUP_RETENTION``). With ``online`` the file is first copied through the
+        SQLite backup API, so the snapshot is consistent even while it is in use;
+        SQLCipher re-encrypts every page of such a copy with a fresh IV, though, so
+        online snapshots of an encrypted library don't share chunks with earlier ones.
+        """
+        try:
+            actual_db_path = None
+
+            if db_path:
+                # Verify the path exists
+                if not os.path.exists(db_path):
+                    return {
+                        "success": False,
+                        "error": f"Database file not found: {db_path}"
+                    }
+                actual_db_path = os.path.abspath(db_path)
+            else:
+                # Auto-detect database path like import function does
+                print("Auto-detecting database for backup...", file=sys.stderr)
+                try:
+                    # Temporarily open database to get path
+                    temp_db = Rekordbox6Database()
+
+                    # Get the actual path that was used
+                    if hasattr(temp_db, 'engine') and temp_db.engine:
+                        url = str(temp_db.engine.url)
+
+                        # Extract database path from SQLAlchemy URL
+                        # URL format: sqlite+pysqlcipher://:***@//Users/suhaas/Library/Pioneer/rekordbox/master.db
+                        if '@' in url:
+                            # Split on @ and take the part after it
+                            path_part = url.split('@', 1)[1].split('?')[0]
+
+                            # Handle double slash at start (remove one)
+                            if path_part.startswith('//'):
+                                path_part = path_part[1:]
+
+                            actual_db_path = os.path.abspath(path_part)
+
+                    temp_db.close()
+
+                except Exception as e:
+                    return {
+                        "success": False,
+                        "error": f"Failed to auto-detect database: {str(e)}"
+                    }
+
+            if not actual_db_path or not os.path.exists(actual_db_path):
+                return {
+                    "success": False,
+                    "error": f"Database file not found: {actual_db_path}"
+                }
+            
+            # Snapshot into the deduplicated store next to the database file
+            backup_dir = os.path.join(os.path.dirname(actual_db_path), "bonk_backups")
+            store = BackupStore(backup_dir)
+            db_filename = os.path.basename(actual_db_path)
+
+            t0 = time.perf_counter()
+            if online:
+                fd, snapshot_path = tempfile.mkstemp(prefix=f".{db_filename}.", suffix=".tmp", dir=backup_dir)
+                os.close(fd)
+                try:
+                    result = self._online_copy(actual_db_path, snapshot_path)
+                    if not result["success"]:
+                        return result
+                    manifest, new_bytes = store.create(snapshot_path, source_path=actual_db_path)
+                finally:
+                    os.remove(snapshot_path)
+            else:
+                manifest, new_bytes = store.create(actual_db_path)
+            print(
+                f"Created backup {manifest['name']}: {new_bytes} of {manifest['size']} bytes new "
+                f"({time.perf_counter() - t0:.2f}s)",
+                file=sys.stderr,
+            )
+
+            policy = dict(BACKUP_RETENTION)
+            policy.update(retention or {})
+            deleted, freed = store.prune(db_filename, policy)
+            for name in deleted:
+                print(f"Deleted old backup: {name}", file=sys.stderr)
+
+            remaining_backups = len(store.snapshots(db_filename))
+            print(f"✓ Backup created. Total backups: {remaining_backups}", file=sys.stderr)
+
+            return {
+                "success": True,
+                "backup_path": store.manifest_path(manifest["name"]),
+                "backup_name": manifest["name"],
+                "backup_count": remaining_backups,
+                "size": manifest["size"],
+                "new_bytes": new_bytes,
+                "deleted": deleted,
+                "freed_bytes": freed,
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {
+                "success": False,
+                "error": f"Failed to backup database: {str(e)}"
+            }
+    
+    def _online_copy(self, db_path: str, output_path: str, key: Optional[str] = None,
+                     stream: bool = False) -> Dict[str, Any]:
+        """Copy ``db_path`` to ``output_path`` with the SQLite backup API, in steps."""
+        if not self.db or self._db_file_path() != os.path.abspath(db_path):
+            self.close_database()
+            result = self.open_database(db_path)
+            if not result["success"]:
+                return result
+
+        def progress(copied: int, total: int) -> None:
+            if stream:
+                _emit_event({"event": "progress", "stage": "backup", "copied": copied, "total": total})
+
+        self.db.backup(output_path, key=key, pages=ONLINE_BACKUP_PAGES, progress=progress,
+                       sleep=ONLINE_BACKUP_SLEEP)
+        return {"success": True}
+
+    def backup_online(self, output_path: str, key: Optional[str] = None,
+                      db_path: Optional[str] = None, stream: bool = False) -> Dict[str, Any]:
+        """Write a consistent copy of the database while it stays in use.
+
+        Pages are copied in steps through the SQLite backup API, pausing between
+        steps. ``key`` selects the encryption of the copy: ``None`` keeps the
+        database key, ``""`` writes an unencrypted file for analysis and any other
+        value re-encrypts it. With ``stream`` a ``progress`` event is emitted per step.
+        """
+        try:
+            if not db_path:
+                if not self.db:
+                    result = self.open_database()
+                    if not result["success"]:
+                        return result
+                db_path = self._db_file_path()
+
+            t0 = time.perf_counter()
+            result = self._online_copy(db_path, output_path, key=key, stream=stream)
+            if not result["success"]:
+                return result
+            elapsed = time.perf_counter() - t0
+            print(f"✓ Backed up {db_path} to {output_path} ({elapsed:.2f}s)", file=sys.stderr)
+            return {
+                "success": True,
+                "backup_path": os.path.abspath(output_path),
+                "size": os.path.getsize(output_path),
+                "encrypted": bool(self.db._key) if key is None else key != "",
+                "elapsed_s": round(elapsed, 3),
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to back up database: {str(e)}"}
+
+    def _backup_store_for(self, db_path: Optional[str]) -> Tuple[Optional[BackupStore], str]:
+        """Return the backup store next to ``db_path`` (or the open database) and the file name."""
+        if not db_path:
+            if not self.db:
+                result = self.open_database()
+                if not result["success"]:
+                    raise RuntimeError(result.get("error", "Could not open database"))
+            db_path = self._db_file_path()
+            if not db_path:
+                raise RuntimeError("Could not determine the database path")
+        db_path = os.path.abspath(db_path)
+        backup_dir = os.path.join(os.path.dirname(db_path), "bonk_backups")
+        if not os.path.isdir(os.path.join(backup_dir, BackupStore.DIRNAME)):
+            return None, os.path.basename(db_path)
+        return BackupStore(backup_dir), os.path.basename(db_path)
+
+    def list_backups(self, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """List the snapshots in the backup store, newest first."""
+        try:
+            store, db_filename = self._backup_store_for(db_path)
+            snapshots = store.snapshots(db_filename) if store else []
+            backups = [
+                {
+                    "name": m["name"],
+                    "created": datetime.fromtimestamp(m["created"]).isoformat(timespec="seconds"),
+                    "size": m["size"],
+                    "digest": m["digest"],
+                }
+                for m in reversed(snapshots)
+            ]
+            return {"success": True, "backups": backups, "backup_count": len(backups)}
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to list backups: {str(e)}"}
+
+    def restore_backup(self, name: str, target_path: str, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Rebuild snapshot ``name`` as ``target_path``.
+
+        An existing target is snapshotted first, so a restore can itself be undone.
+        """
+        try:
+            store, db_filename = self._backup_store_for(db_path)
+            if store is None or not os.path.exists(store.manifest_path(name)):
+                return {"success": False, "error": f"Backup not found: {name}"}
+
+            previous = None
+            if os.path.exists(target_path):
+                previous, _ = store.create(target_path)
+                print(f"Saved current {target_path} as backup {previous['name']}", file=sys.stderr)
+
+            manifest = store.restore(name, target_path)
+            print(f"✓ Restored backup {name} to {target_path}", file=sys.stderr)
+            return {
+                "success": True,
+                "restored": name,
+                "target_path": os.path.abspath(target_path),
+                "size": manifest["size"],
+                "previous_backup": previous["name"] if previous else None,
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to restore backup: {str(e)}"}
+
+    def check_database_integrity(self, mode: str = "quick", restart: bool = False,
+                                 time_budget: Optional[float] = None, stream: bool = False,
+                                 max_errors: int = 100) -> Dict[str, Any]:
+        """Check database integrity.
+
+        ``mode`` selects the tier: ``quick`` runs ``PRAGMA quick_check``, ``full`` runs
+        ``PRAGMA integrity_check`` (which also verifies index contents) and ``tables``
+        reads every row of the djmd* tables in rowid ranges, reporting the ranges that
+        fail. The table scan checkpoints after each range, so it can run in slices of
+        ``time_budget`` seconds and resumes where it stopped unless ``restart`` is set;
+        with ``stream`` a ``progress`` event is emitted per range. Finished results
+        are cached while master.db is unchanged.
+        """
+        cache = None
+        try:
+            if not self.db:
+                return {
+                    "success": False,
+                    "error": "Database not open"
+                }
+            if mode not in INTEGRITY_MODES:
+                return {"success": False, "error": f"Unknown integrity check mode: {mode}"}
+
+            signature = self._db_signature()
+            cache = IntegrityCheckCache(self._cache_dir())
+            if not restart:
+                cached = cache.get_result(mode, signature)
+                if cached is not None:
+                    return {**cached, "cached": True}
+
+            t0 = time.perf_counter()
+            # Get raw connection to run PRAGMA commands
+            connection = self.db.engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                if mode == "tables":
+                    result = self._scan_tables_integrity(cursor, cache, signature, restart, time_budget, stream)
+                else:
+                    pragma = "quick_check" if mode == "quick" else "integrity_check"
+                    try:
+                        cursor.execute(f"PRAGMA {pragma}({int(max_errors)})")
+                        messages = [row[0] for row in cursor.fetchall()]
+                    except Exception as e:
+                        # Severe damage aborts the check itself
+                        if not self._is_corruption_error(e):
+                            raise
+                        messages = [str(e)]
+                    integrity_ok = messages == ["ok"]
+                    result = {
+                        "integrity_ok": integrity_ok,
+                        "complete": True,
+                        "messages": [] if integrity_ok else messages,
+                    }
+                cursor.close()
+            finally:
+                connection.close()
+
+            if result["integrity_ok"] is None:
+                message = "Table scan incomplete; run it again to resume"
+            else:
+                message = "ok" if result["integrity_ok"] else (result["messages"] or ["Unknown integrity status"])[0]
+            # Provide more helpful error messages for common corruption types
+            if result["integrity_ok"] is False:
+                if "index" in message.lower() and "wrong" in message.lower():
+                    message += "\n\nThis indicates index corruption. The repair function will rebuild all indexes to fix this issue."
+                elif "malformed" in message.lower() or "corrupt" in message.lower():
+                    message += "\n\nThis indicates database file corruption. The repair function will attempt to fix this using VACUUM."
+
+            result = {
+                "success": True,
+                "mode": mode,
+                **result,
+                "message": message,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+            }
+            if result["complete"]:
+                cache.put_result(mode, signature, result)
+            return result
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {
+                "success": False,
+                "error": f"Failed to check database integrity: {str(e)}"
+            }
+        finally:
+            if cache:
+                cache.close()
+
+    def _scan_tables_integrity(self, cursor, cache: IntegrityCheckCache, signature: str, restart: bool,
+                               time_budget: Optional[float], stream: bool) -> Dict[str, Any]:
+        """Read the djmd* tables range by range, checkpointing into ``cache``."""
+        tables = [row[0] for row in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'djmd%' ORDER BY name"
+        ).fetchall()]
+        state = cache.scan_state(signature, restart=restart)
+        deadline = time.monotonic() + time_budget if time_budget else None
+        complete = True
+        for table in tables:
+            last_rowid, done = state.get(table, (None, False))
+            if done:
+                continue
+            try:
+                low, high = cursor.execute(f'SELECT min(rowid), max(rowid) FROM "{table}"').fetchone()
+            except Exception as e:
+                cache.save_progress(signature, table, None, True, [(None, None, str(e))])
+                continue
+            if low is None:
+                cache.save_progress(signature, table, None, True, [])
+                continue
+            start = low if last_rowid is None else last_rowid + 1
+            while start <= high:
+                end = min(start + INTEGRITY_RANGE_ROWS - 1, high)
+                error = _read_rowid_range(cursor, table, start, end)
+                cache.save_progress(signature, table, end, end >= high, [(start, end, error)] if error else [])
+                if stream:
+                    _emit_event({
+                        "event": "progress", "table": table, "rowid": end, "max_rowid": high,
+                        "error": error,
+                    })
+                start = end + 1
+                # Checked after a range, so every slice makes progress
+                if deadline is not None and time.monotonic() > deadline:
+                    complete = False
+                    break
+            if not complete:
+                break
+
+        bad_ranges = cache.bad_ranges(signature)
+        return {
+            "integrity_ok": not bad_ranges if complete or bad_ranges else None,
+            "complete": complete,
+            "messages": [f"{r['table']} rowid {r['first_rowid']}-{r['last_rowid']}: {r['error']}" for r in bad_ranges],
+            "bad_ranges": bad_ranges,
+            "table_count": len(tables),
+        }
+
+    def scan_corruption(self, tables: Optional[List[str]] = None, db_path: Optional[str] = None,
+                        stream: bool = False) -> Dict[str, Any]:
+        """Locate unreadable rows in any table of the database.
+
+        Each table is read in rowid ranges through a read-only connection and ranges
+        that fail are bisected down to single rows, so one pass finds every damaged
+        row. For those rows the ID/ContentID/PlaylistID columns that can still be read
+        are reported, along with the content and playlist IDs they reference. With
+        ``stream`` a ``progress`` event is emitted per range.
+        """
+        conn = None
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            conn = self.db.read_only_connection()
+            cursor = conn.cursor()
+            all_tables = [row[0] for row in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            ).fetchall()]
+            selected = tables or all_tables
+            unknown = [t for t in selected if t not in all_tables]
+            if unknown:
+                return {"success": False, "error": f"Unknown table(s): {', '.join(unknown)}"}
+
+            report = []
+            content_ids = set()
+            playlist_ids = set()
+            corrupt_rows = 0
+            for table in selected:
+                entry = {"table": table, "error": None, "rows": []}
+                try:
+                    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")').fetchall()]
+                    low, high = cursor.execute(f'SELECT min(rowid), max(rowid) FROM "{table}"').fetchone()
+                except Exception as e:
+                    # The table's root pages themselves are damaged
+                    entry["error"] = str(e)
+                    report.append(entry)
+                    continue
+                references = [c for c in columns if c in SCAN_REFERENCE_COLUMNS]
+
+                start = low
+                while low is not None and start <= high:
+                    end = min(start + INTEGRITY_RANGE_ROWS - 1, high)
+                    for rowid, error in _bisect_unreadable_rows(cursor, table, start, end):
+                        values = _salvage_columns(cursor, table, rowid, references)
+                        entry["rows"].append({"rowid": rowid, "error": error, "values": values})
+                        if values.get("ContentID"):
+                            content_ids.add(str(values["ContentID"]))
+                        if values.get("PlaylistID"):
+                            playlist_ids.add(str(values["PlaylistID"]))
+                        if values.get("ID") and table == "djmdContent":
+                            content_ids.add(str(values["ID"]))
+                        if values.get("ID") and table == "djmdPlaylist":
+                            playlist_ids.add(str(values["ID"]))
+                    if stream:
+                        _emit_event({
+                            "event": "progress", "table": table, "rowid": end, "max_rowid": high,
+                            "corrupt_rows": len(entry["rows"]),
+                        })
+                    start = end + 1
+
+                if entry["rows"]:
+                    corrupt_rows += len(entry["rows"])
+                    report.append(entry)
+
+            print(f"✓ Scanned {len(selected)} tables: {corrupt_rows} unreadable rows", file=sys.stderr)
+            return {
+                "success": True,
+                "corrupt": bool(report),
+                "table_count": len(selected),
+                "corrupt_row_count": corrupt_rows,
+                "tables": report,
+                "content_ids": sorted(content_ids),
+                "playlist_ids": sorted(playlist_ids),
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to scan for corruption: {str(e)}"}
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def rebuild_table(self, table: str, db_path: Optional[str] = None, dry_run: bool = False,
+                      stream: bool = False) -> Dict[str, Any]:
+        """Rebuild a djmd*/content* table from its readable rows.
+
+        Readable rows are streamed in rowid ranges (bisecting around unreadable ones)
+        into a scratch database with ``executemany``, so memory stays bounded by one
+        range. A fresh copy of the table is then filled from it, read back, and its
+        row count and per-column digests compared with what was read, before the
+        tables are swapped and the indexes and triggers recreated. The copy, check
+        and swap run in one transaction, so a failure leaves the original table
+        untouched, and a snapshot is added to the backup store first. ``dry_run``
+        rolls back after the swap.
+        """
+        connection = None
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+            if not re.fullmatch(r"(?i)(djmd|content)\w+", table):
+                return {"success": False, "error": f"Only djmd* and content* tables can be rebuilt: {table}"}
+            if get_rekordbox_pid():
+                return {
+                    "success": False,
+                    "error": "Rekordbox is running. Please close Rekordbox before rebuilding a table."
+                }
+
+            backup_name = None
+            if not dry_run:
+                backup_result = self.backup_database(self._db_file_path())
+                if not backup_result.get("success"):
+                    return {"success": False, "error": f"Could not create backup: {backup_result.get('error')}"}
+                backup_name = backup_result["backup_name"]
+
+            # End the session's read transaction so the swap can take the write lock
+            self._safe_rollback()
+            connection = self.db.engine.raw_connection()
+            dbapi = connection.dbapi_connection
+            isolation_level = dbapi.isolation_level
+            dbapi.isolation_level = None
+            cursor = dbapi.cursor()
+            staging_dir = tempfile.mkdtemp(prefix=".rebuild-", dir=os.path.dirname(self._db_file_path()))
+            try:
+                row = cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                ).fetchone()
+                if row is None:
+                    return {"success": False, "error": f"Table not found: {table}"}
+                extras = [r[0] for r in cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? "
+                    "AND sql IS NOT NULL",
+                    (table,),
+                ).fetchall()]
+                columns = [r[1] for r in cursor.execute(f'PRAGMA table_info("{table}")').fetchall()]
+                column_list = ", ".join(f'"{c}"' for c in columns)
+                placeholders = ", ".join("?" * (len(columns) + 1))
+
+                # Stage the readable rows in a scratch database attached to the same
+                # connection (SQLCipher encrypts it with the main key). Reads run in
+                # autocommit: once a read inside a write transaction hits a corrupt
+                # page, SQLite refuses every later write of that transaction.
+                cursor.execute("ATTACH DATABASE ? AS rebuild_staging",
+                               (os.path.join(staging_dir, "staging.db"),))
+                cursor.execute("PRAGMA rebuild_staging.journal_mode = OFF")
+                cursor.execute("PRAGMA rebuild_staging.synchronous = OFF")
+                cursor.execute(f"CREATE TABLE rebuild_staging.rows ({column_list})")
+                staging_insert = f"INSERT INTO rebuild_staging.rows (rowid, {column_list}) VALUES ({placeholders})"
+                read_digests = [hashlib.blake2b(digest_size=16) for _ in range(len(columns) + 1)]
+                skipped: List[Tuple[int, str]] = []
+                copied = 0
+                low, high = cursor.execute(f'SELECT min(rowid), max(rowid) FROM "{table}"').fetchone()
+                start = low
+                while low is not None and start <= high:
+                    end = min(start + INTEGRITY_RANGE_ROWS - 1, high)
+                    rows = _read_rows_skipping(cursor, table, start, end, skipped)
+                    cursor.execute("BEGIN")
+                    cursor.executemany(staging_insert, rows)
+                    cursor.execute("COMMIT")
+                    _update_column_digests(read_digests, rows)
+                    copied += len(rows)
+                    if stream:
+                        _emit_event({
+                            "event": "progress", "stage": "copy", "rowid": end, "max_rowid": high,
+                            "copied": copied, "skipped": len(skipped),
+                        })
+                    start = end + 1
+
+                # Build the replacement table, verify it and swap it in, all in one transaction
+                shadow = f"{table}__rebuild"
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(f'DROP TABLE IF EXISTS main."{shadow}"')
+                cursor.execute(re.sub(
+                    r'^(\s*CREATE\s+TABLE\s+)(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|\S+)',
+                    lambda m: f'{m.group(1)}main."{shadow}"', row[0], count=1, flags=re.IGNORECASE,
+                ))
+                cursor.execute(f'INSERT INTO main."{shadow}" (rowid, {column_list}) '
+                               f'SELECT rowid, {column_list} FROM rebuild_staging.rows ORDER BY rowid')
+                if stream:
+                    _emit_event({"event": "progress", "stage": "verify", "copied": copied})
+
+                written_digests = [hashlib.blake2b(digest_size=16) for _ in range(len(columns) + 1)]
+                cursor.execute(f'SELECT rowid, * FROM main."{shadow}" ORDER BY rowid')
+                written = 0
+                while True:
+                    rows = cursor.fetchmany(INTEGRITY_RANGE_ROWS)
+                    if not rows:
+                        break
+                    _update_column_digests(written_digests, rows)
+                    written += len(rows)
+                mismatched = [
+                    name for name, a, b in zip(["rowid"] + columns, read_digests, written_digests)
+                    if a.digest() != b.digest()
+                ]
+                if written != copied or mismatched:
+                    cursor.execute("ROLLBACK")
+                    return {
+                        "success": False,
+                        "error": f"Verification of the rebuilt {table} failed: {written} of {copied} rows, "
+                                 f"mismatched columns: {', '.join(mismatched) or 'none'}",
+                    }
+
+                # DROP has to walk the table's pages, which fails on a damaged table, so
+                # one with unreadable rows is unlinked from the schema instead; its pages
+                # are reclaimed by the VACUUM after the commit.
+                unlinked = bool(skipped)
+                if unlinked:
+                    schema_version = cursor.execute("PRAGMA main.schema_version").fetchone()[0]
+                    cursor.execute("PRAGMA writable_schema = ON")
+                    cursor.execute("DELETE FROM main.sqlite_master WHERE tbl_name = ?", (table,))
+                    cursor.execute(f"PRAGMA main.schema_version = {schema_version + 1}")
+                    cursor.execute("PRAGMA writable_schema = RESET")
+                else:
+                    cursor.execute(f'DROP TABLE main."{table}"')
+                cursor.execute(f'ALTER TABLE main."{shadow}" RENAME TO "{table}"')
+                for sql in extras:
+                    cursor.execute(sql)
+                cursor.execute("ROLLBACK" if dry_run else "COMMIT")
+                vacuumed = unlinked and not dry_run
+                if vacuumed:
+                    if stream:
+                        _emit_event({"event": "progress", "stage": "vacuum"})
+                    cursor.execute("DETACH DATABASE rebuild_staging")
+                    cursor.execute("VACUUM")
+            except BaseException:
+                if dbapi.in_transaction:
+                    cursor.execute("ROLLBACK")
+                raise
+            finally:
+                try:
+                    cursor.execute("DETACH DATABASE rebuild_staging")
+                except Exception:
+                    pass
+                cursor.close()
+                dbapi.isolation_level = isolation_level
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+            print(
+                f"✓ {'Verified' if dry_run else 'Rebuilt'} {table}: {copied} rows copied, {len(skipped)} skipped",
+                file=sys.stderr,
+            )
+            return {
+                "success": True,
+                "table": table,
+                "dry_run": dry_run,
+                "rows_copied": copied,
+                "rows_skipped": len(skipped),
+                "skipped": [{"rowid": rowid, "error": error} for rowid, error in skipped],
+                "indexes_recreated": len(extras),
+                "vacuumed": vacuumed,
+                "backup_name": backup_name,
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to rebuild table {table}: {str(e)}"}
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def repair_database(self) -> Dict[str, Any]:
+        """Attempt to repair database using SQLite VACUUM"""
+        db_path = None
+        try:
+            if not self.db:
+                return {
+                    "success": False,
+                    "error": "Database not open"
+                }
+            
+            # Check if Rekordbox is running
+            pid = get_rekordbox_pid()
+            if pid:
+                return {
+                    "success": False,
+                    "error": "Rekordbox is running. Please close Rekordbox before repairing the database."
+                }
+            
+            # Get the database path before closing
+            if hasattr(self.db, 'engine') and self.db.engine:
+                url = str(self.db.engine.url)
+                if 'sqlite' in url:
+                    # Handle both encrypted and unencrypted URLs
+                    if '@' in url:
+                        # Encrypted: sqlite+pysqlcipher://:***@/path/to/db
+                        path_part = url.split('@', 1)[1].split('?')[0]
+                        if path_part.startswith('//'):
+                            path_part = path_part[1:]
+                        db_path = os.path.abspath(path_part)
+                    elif ':///' in url:
+                        # Unencrypted: sqlite:///path/to/db
+                        parts = url.split(':///')
+                        if len(parts) > 1:
+                            db_path = parts[1].split('?')[0]
+                            db_path = os.path.abspath(db_path)
+            
+            if not db_path or not os.path.exists(db_path):
+                return {
+                    "success": False,
+                    "error": "Could not determine database path"
+                }
+            
+            # Close the database connection first
+            self.db.close()
+            
+            # Create a backup before repair
+            backup_result = self.backup_database(db_path)
+            if not backup_result.get("success"):
+                print(f"Warning: Could not create backup before repair: {backup_result.get('error')}", file=sys.stderr)
+            
+            # Reopen database to get connection
+            self.db = Rekordbox6Database(path=db_path)
+            
+            # Get connection for repair operations
+            connection = self.db.engine.raw_connection()
+            cursor = connection.cursor()
+            
+            # First, rebuild all indexes to fix index corruption
+            print("Step 1: Rebuilding indexes to fix index corruption...", file=sys.stderr)
+            try:
+                cursor.execute("REINDEX")
+                print("✓ Indexes rebuilt successfully", file=sys.stderr)
+            except Exception as e:
+                print(f"Warning: REINDEX failed: {e}", file=sys.stderr)
+                # Continue with VACUUM anyway
+            
+            # Then run VACUUM to repair and compact the database
+            print("Step 2: Running VACUUM to repair and compact database...", file=sys.stderr)
+            cursor.execute("VACUUM")
+            print("✓ VACUUM completed successfully", file=sys.stderr)
+            
+            cursor.close()
+            connection.close()
+            
+            # Close and reopen to verify
+            self.db.close()
+            self.db = Rekordbox6Database(path=db_path)
+            
+            # Check integrity after repair
+            integrity_result = self.check_database_integrity(mode="full")
+            
+            if integrity_result.get("integrity_ok"):
+                return {
+                    "success": True,
+                    "message": "Database repaired successfully",
+                    "integrity_ok": True
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": f"Database repair completed but integrity check failed: {integrity_result.get('message')}",
+                    "integrity_ok": False
+                }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            # Try to reopen database
+            try:
+                if db_path and os.path.exists(db_path):
+                    self.db = Rekordbox6Database(path=db_path)
+            except:
+                pass
+            return {
+                "success": False,
+                "error": f"Failed to repair database: {str(e)}"
+            }
+    
+    def _content_to_track(self, content) -> Dict[str, Any]:
+        """Convert a DjmdContent row to Bonk's track format."""
+        # Safely get key name
+        try:
+            key_name = content.KeyName if content.Key else ""
+        except:
+            key_name = ""
+
+        # Safely get remixer name
+        try:
+            remixer_name = content.RemixerName if content.Remixer else ""
+        except:
+            remixer_name = ""
+
+        # Rekordbox stores BPM multiplied by 100 (e.g., 128.5 BPM = 12850)
+        # Convert back to normal BPM by dividing by 100
+        bpm_value = None
+        if content.BPM is not None:
+            bpm_value = content.BPM / 100.0
+
+        # Collect MyTag names if available
+        try:
+            raw_mytags = list(content.MyTagNames) if hasattr(content, "MyTagNames") else []
+        except Exception:
+            raw_mytags = []
+
+        # Parse MyTags into category + name using Rekordbox's four buckets
+        # Expected format: "Category: Name" where Category is one of Genre/Components/Situation/Custom
+        allowed_categories = {"Genre", "Components", "Situation", "Custom"}
+        tags = []
+        for mt in raw_mytags:
+            if not mt:
+                continue
+            if ":" in mt:
+                cat, val = mt.split(":", 1)
+                cat = cat.strip()
+                val = val.strip()
+                if cat in allowed_categories and val:
+                    tags.append({"category": cat, "name": val, "source": "rekordbox"})
+                    continue
+            # Fallback: unknown format, treat as Custom with full string
+            tags.append({"category": "Custom", "name": mt.strip(), "source": "rekordbox"})
+
+        # Safely get composer name
+        try:
+            composer_name = content.ComposerName if content.Composer else ""
+        except:
+            composer_name = ""
+
+        # Safely get album artist name
+        try:
+            album_artist_name = content.AlbumArtistName if content.Album else ""
+        except:
+            album_artist_name = ""
+
+        # Safely get lyricist name (Lyricist is a ForeignKey to DjmdArtist)
+        try:
+            if content.Lyricist:
+                lyricist_artist = self.db.get_artist(ID=content.Lyricist)
+                lyricist_name = lyricist_artist.Name if lyricist_artist else ""
+            else:
+                lyricist_name = ""
+        except:
+            lyricist_name = ""
+
+        # Safely get original artist name
+        try:
+            original_artist_name = content.OrgArtistName if content.OrgArtist else ""
+        except:
+            original_artist_name = ""
+
+        track = {
+            "TrackID": str(content.ID),
+            "Name": content.Title or "",
+            "Artist": content.ArtistName or "",
+            "Album": content.AlbumName or "",
+            "Genre": content.GenreName or "",
+            "Year": str(content.ReleaseYear) if content.ReleaseYear else "",
+            "AverageBpm": str(bpm_value) if bpm_value is not None else "",
+            "TotalTime": str(int(content.Length * 1000)) if content.Length else "",
+            "BitRate": str(content.BitRate) if content.BitRate else "",
+            "SampleRate": str(content.SampleRate) if content.SampleRate else "",
+            "Comments": content.Commnt or "",
+            "Rating": str(content.Rating) if content.Rating else "",
+            "Location": f"file://localhost{content.FolderPath}",
+            "Tonality": key_name,
+            "Key": key_name,
+            "Label": content.LabelName or "",
+            "Remixer": remixer_name,
+            "Composer": composer_name,
+            "AlbumArtist": album_artist_name,
+            "TrackNumber": str(content.TrackNo) if content.TrackNo is not None else "",
+            "DiscNumber": str(content.DiscNo) if content.DiscNo is not None else "",
+            "Lyricist": lyricist_name,
+            "OriginalArtist": original_artist_name,
+            "MixName": content.Subtitle or "",  # Subtitle field stores Mix Name
+            "Mix": content.Subtitle or "",  # Keep Mix for backward compatibility
+            "DateAdded": content.created_at.isoformat() if content.created_at else "",
+            "PlayCount": str(content.DJPlayCount) if content.DJPlayCount else "",
+            "Color": str(content.ColorID) if content.ColorID else "",
+            "tags": tags,
+        }
+        return track
+
+    def import_from_database(self, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Import tracks and playlists from Rekordbox database"""
+        try:
+            # Open database if not already open
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+                actual_db_path = result.get("db_path")
+                if actual_db_path:
+                    print(f"Importing from database: {actual_db_path}", file=sys.stderr)
+            
+            # Get all tracks
+            library = self._library_index()
+            if library is not None:
+                tracks = library.tracks()
+            else:
+                tracks = []
+                for content in self.db.get_content():
+                    tracks.append(self._content_to_track(content))
+            
+            # Get all playlists
+            playlists = []
+            print(f"Fetching playlists...", file=sys.stderr)
+            all_playlists = list(self.db.get_playlist())
+            print(f"Found {len(all_playlists)} playlists", file=sys.stderr)
+            
+            # Only get root-level playlists (those without a parent)
+            for playlist in all_playlists:
                 if not playlist.ParentID or playlist.ParentID == "root":
                     pl_data = self._parse_playlist(playlist)
                     if pl_data:
@@ -654,6 +3268,47 @@ class RekordboxBridge:
                 "error": f"Failed to import from database: {str(e)}"
             }
     
+    def _library_index(self) -> Optional[LibraryIndex]:
+        """Open the sidecar library index and sync it once per session (None if unavailable)."""
+        if self._library is None:
+            library = None
+            try:
+                library = LibraryIndex(self._cache_dir())
+                stats = library.sync(
+                    self.db, self._content_to_track, self._db_signature(), self._db_file_id()
+                )
+                if stats["updated"] or stats["deleted"]:
+                    print(f"Library index synced: {stats}", file=sys.stderr)
+                self._library = library
+            except Exception as e:
+                print(f"Warning: library index unavailable: {e}", file=sys.stderr)
+                if library is not None:
+                    library.close()
+        return self._library
+
+    def _smart_playlist_cache(self) -> Optional[SmartPlaylistCache]:
+        """Lazily open the smart playlist result cache (None if unavailable)."""
+        if self._smart_cache is None:
+            try:
+                self._smart_cache = SmartPlaylistCache(self._cache_dir())
+            except Exception as e:
+                print(f"Warning: smart playlist cache unavailable: {e}", file=sys.stderr)
+        return self._smart_cache
+
+    def _smart_playlist_ids(self, playlist) -> List[str]:
+        """Content IDs of a smart playlist, served from the result cache when the USN is unchanged."""
+        cache = self._smart_playlist_cache()
+        if cache is None or not playlist.SmartList:
+            return [str(row[0]) for row in self.db.get_playlist_contents(playlist, DjmdContent.ID)]
+
+        xml_hash = cache.key_for(playlist.SmartList)
+        usn = self.db.get_local_usn()
+        ids = cache.get_ids(xml_hash, usn)
+        if ids is None:
+            ids = [str(row[0]) for row in self.db.get_playlist_contents(playlist, DjmdContent.ID)]
+            cache.put(xml_hash, usn, cache.date_bucket(playlist.SmartList), ids)
+        return ids
+
     def _parse_playlist(self, playlist) -> Optional[Dict[str, Any]]:
         """Parse a playlist object from the database"""
         try:
@@ -672,14 +3327,14 @@ class RekordboxBridge:
             if is_smart:
                 # For smart playlists, use get_playlist_contents to evaluate the smart list
                 try:
-                    contents = list(self.db.get_playlist_contents(playlist))
-                    for content in contents:
-                        track_ids.append(str(content.ID))
+                    track_ids = self._smart_playlist_ids(playlist)
                     print(f"  Smart playlist '{playlist.Name}' has {len(track_ids)} matching tracks", file=sys.stderr)
                 except Exception as e:
                     print(f"  Warning: Failed to get smart playlist contents: {e}", file=sys.stderr)
                     import traceback
                     traceback.print_exc(file=sys.stderr)
+            elif self._library is not None:
+                track_ids = self._library.playlist_content_ids(str(playlist.ID))
             else:
                 # For regular playlists, get tracks from Songs relationship
                 try:
@@ -736,7 +3391,8 @@ class RekordboxBridge:
                             "property": cond.property,
                             "operator": operator_str,
                             "value_left": str(cond.value_left) if cond.value_left is not None else "",
-                            "value_right": str(cond.value_right) if cond.value_right is not None else None
+                            "value_right": str(cond.value_right) if cond.value_right is not None else None,
+                            "unit": cond.unit or ""
                         }
                         conditions.append(condition)
                     
@@ -1833,11 +4489,9 @@ class RekordboxBridge:
                                 print(f"  Warning: Unknown operator '{operator_value}' in smart playlist '{playlist_name}', skipping condition", file=sys.stderr)
                                 continue
                             
-                            # Add condition to smart list
-                            if value_right:
-                                smart.add_condition(property_enum, operator_enum, value_left, value_right)
-                            else:
-                                smart.add_condition(property_enum, operator_enum, value_left)
+                            # Add condition to smart list; IN_LAST/NOT_IN_LAST need a date unit
+                            smart.add_condition(property_enum, operator_enum, value_left, value_right or "",
+                                                unit=condition.get("unit") or "")
                         
                         if existing and existing.is_smart_playlist:
                             # Update existing smart playlist
@@ -1866,345 +4520,1550 @@ class RekordboxBridge:
                 # Commit playlist changes
                 if playlist_added_count > 0 or playlist_updated_count > 0:
                     try:
-                        print(f"Step 8: Committing playlist changes ({playlist_added_count} added, {playlist_updated_count} updated)...", file=sys.stderr)
-                        self.db.commit()
-                        print("✓ Playlist changes committed successfully", file=sys.stderr)
+                        print(f"Step 8: Committing playlist changes ({playlist_added_count} added, {playlist_updated_count} updated)...", file=sys.stderr)
+                        self.db.commit()
+                        print("✓ Playlist changes committed successfully", file=sys.stderr)
+                    except Exception as e:
+                        error_str = str(e)
+                        print(f"ERROR committing playlists: {error_str}", file=sys.stderr)
+                        
+                        # Try to rollback
+                        try:
+                            self.db.rollback()
+                            print("✓ Rolled back playlist transaction", file=sys.stderr)
+                        except Exception as rollback_error:
+                            print(f"Error rolling back playlist changes: {rollback_error}", file=sys.stderr)
+                        
+                        # Check if it's a corruption error - try committing without autoincrement
+                        if "malformed" in error_str.lower() or "corrupt" in error_str.lower() or "database disk image" in error_str.lower():
+                            print("Attempting to commit playlists without USN autoincrement...", file=sys.stderr)
+                            try:
+                                self.db.commit(autoinc=False)
+                                print("✓ Playlist changes committed successfully without USN updates", file=sys.stderr)
+                            except Exception as retry_error:
+                                errors.append(f"Failed to commit playlist changes: {error_str}")
+                                print("⚠ Database corruption detected during playlist commit", file=sys.stderr)
+                                print("⚠ Playlists were not saved due to corruption", file=sys.stderr)
+                        else:
+                            errors.append(f"Failed to commit playlist changes: {error_str}")
+            
+            print(f"Export summary: {added_count} tracks added, {updated_count} tracks updated, {deleted_count} tracks deleted, {skipped_count} tracks skipped", file=sys.stderr)
+            print(f"Playlist summary: {playlist_added_count} playlists added, {playlist_updated_count} playlists updated, {playlist_skipped_count} playlists skipped", file=sys.stderr)
+            if skipped_count > 0:
+                print(f"  Note: Skipped tracks are either unchanged or don't exist in database", file=sys.stderr)
+            if deleted_count > 0:
+                print(f"  Note: {deleted_count} tracks deleted from Rekordbox (not in Bonk library)", file=sys.stderr)
+            if errors:
+                print(f"Errors: {len(errors)}", file=sys.stderr)
+                for error in errors[:5]:  # Print first 5 errors
+                    print(f"  - {error}", file=sys.stderr)
+            
+            return {
+                "success": True,
+                "added": added_count,
+                "updated": updated_count,
+                "deleted": deleted_count,
+                "skipped": skipped_count,
+                "playlists_added": playlist_added_count,
+                "playlists_updated": playlist_updated_count,
+                "playlists_skipped": playlist_skipped_count,
+                "corruption_hits": getattr(self, "_last_corruption_hits", None) or None,
+                "errors": errors if errors else None,
+                "db_path": actual_db_path
+            }
+        
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Failed to export to database: {str(e)}"
+            }
+    
+    def update_track_path(self, track_id: str, new_path: str, old_path: Optional[str] = None, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Update a track's file path in the Rekordbox database
+        
+        Can find track by ID (if numeric) or by old file path
+        """
+        try:
+            # Open database if not already open
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+            
+            content = None
+            
+            # Try to find track by ID first (if it's a numeric ID)
+            try:
+                track_id_int = int(track_id)
+                # get_content(ID=...) already returns DjmdContent or None, not a query
+                content = self.db.get_content(ID=track_id_int)
+            except (ValueError, TypeError):
+                # Track ID is not numeric (probably from XML import)
+                # Try to find by file path instead
+                pass
+            
+            # If not found by ID, try to find by old path
+            if not content and old_path:
+                # Normalize old path for comparison
+                normalized_old_path = str(old_path).replace("\\", "/")
+                # Remove file:// prefix if present
+                if normalized_old_path.startswith("file://localhost"):
+                    normalized_old_path = normalized_old_path.replace("file://localhost", "")
+                elif normalized_old_path.startswith("file://"):
+                    normalized_old_path = normalized_old_path.replace("file://", "")
+                
+                # Try to find by exact path match
+                try:
+                    content = self.db.get_content(FolderPath=normalized_old_path).one_or_none()
+                except:
+                    pass
+                
+                # If still not found, try case-insensitive search
+                if not content:
+                    all_content = list(self.db.get_content())
+                    for c in all_content:
+                        if c.FolderPath and c.FolderPath.lower() == normalized_old_path.lower():
+                            content = c
+                            break
+            
+            if not content:
+                return {
+                    "success": False, 
+                    "error": f"Track not found in database (ID: {track_id}, Path: {old_path})",
+                    "skipped": True
+                }
+            
+            # Normalize new path (Rekordbox uses forward slashes)
+            normalized_path = str(new_path).replace("\\", "/")
+            # Remove file:// prefix if present
+            if normalized_path.startswith("file://localhost"):
+                normalized_path = normalized_path.replace("file://localhost", "")
+            elif normalized_path.startswith("file://"):
+                normalized_path = normalized_path.replace("file://", "")
+            
+            old_db_path = content.FolderPath
+            
+            # Update the path using pyrekordbox's update_content_path
+            self.db.update_content_path(content, normalized_path, save=True, check_path=False, commit=True)
+            
+            return {
+                "success": True,
+                "track_id": str(content.ID),
+                "old_path": old_db_path,
+                "new_path": normalized_path
+            }
+        except Exception as e:
+            error_msg = str(e)
+            # Check for common database errors
+            if "database disk image is malformed" in error_msg or "malformed" in error_msg.lower():
+                # Database corruption or lock issue
+                if "locked" in error_msg.lower() or "busy" in error_msg.lower():
+                    return {
+                        "success": False,
+                        "error": f"Database is locked. Please close Rekordbox and try again. Error: {error_msg}"
+                    }
+                else:
+                    return {
+                        "success": False,
+                        "error": f"Database corruption detected. The database may be locked by Rekordbox, or a specific record is corrupted. Try closing Rekordbox and try again. Error: {error_msg}"
+                    }
+            else:
+                return {
+                    "success": False,
+                    "error": f"Failed to update track path: {error_msg}"
+                }
+    
+    @staticmethod
+    def _normalize_folder_prefix(prefix: str) -> str:
+        """FolderPath form of a folder: forward slashes, no file:// scheme or trailing slash.
+
+        Unlike ``_normalize_track_path`` the leading slash of POSIX paths is kept;
+        only the one in front of a Windows drive (``file:///C:/...``) is dropped.
+        """
+        prefix = str(prefix).replace("\\", "/").strip()
+        for scheme in ("file://localhost", "file://"):
+            if prefix.lower().startswith(scheme):
+                prefix = prefix[len(scheme):]
+                break
+        if re.match(r"/[A-Za-z]:/", prefix):
+            prefix = prefix[1:]
+        return prefix.rstrip("/")
+
+    def _apply_relocations(self, moves: Dict[Any, str], max_workers: Optional[int] = None
+                           ) -> Dict[str, Any]:
+        """Point each DjmdContent in ``moves`` at its new path, in one commit.
+
+        Updates the PPTH tag of the ANLZ files (in a process pool), then FolderPath
+        (and OrgFolderPath/FileNameL like ``update_content_path``) and the ContentFile
+        rows of the rewritten files. Tracks whose ANLZ files could not be rewritten
+        keep their old path and are reported in ``errors``. If the commit fails the
+        original ANLZ files are put back.
+        """
+        jobs = {}
+        for content, target in moves.items():
+            anlz_dir = self._anlz_dir_for(content.AnalysisDataPath)
+            if anlz_dir:
+                jobs[anlz_dir] = (str(content.ID), target)
+
+        rewritten: Dict[str, Dict[str, Any]] = {}
+        errors: List[Dict[str, str]] = []
+        try:
+            if len(jobs) <= 2:
+                for anlz_dir, (cid, target) in jobs.items():
+                    try:
+                        rewritten[anlz_dir] = _rewrite_anlz_path(anlz_dir, target)
                     except Exception as e:
-                        error_str = str(e)
-                        print(f"ERROR committing playlists: {error_str}", file=sys.stderr)
-                        
-                        # Try to rollback
+                        errors.append({"id": cid, "anlz_dir": anlz_dir, "error": str(e)})
+            else:
+                workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {
+                        executor.submit(_rewrite_anlz_path, d, target): d
+                        for d, (_, target) in jobs.items()
+                    }
+                    for future in as_completed(futures):
+                        anlz_dir = futures[future]
+                        try:
+                            rewritten[anlz_dir] = future.result()
+                        except Exception as e:
+                            errors.append({"id": jobs[anlz_dir][0], "anlz_dir": anlz_dir, "error": str(e)})
+            originals = [item for r in rewritten.values() for item in r["originals"]]
+            failed_ids = {error["id"] for error in errors}
+
+            relocated = 0
+            for content, target in moves.items():
+                if str(content.ID) in failed_ids:
+                    # The PPTH tags still hold the old path, so the database keeps it too
+                    continue
+                if content.OrgFolderPath == content.FolderPath:
+                    content.OrgFolderPath = target
+                content.FolderPath = target
+                name = target.rsplit("/", 1)[-1]
+                if content.FileNameL != name:
+                    content.FileNameL = name
+                relocated += 1
+
+            # The ANLZ files changed size and content: refresh their ContentFile rows
+            sizes: Dict[Tuple[str, str], int] = {}
+            for anlz_dir, result in rewritten.items():
+                cid = jobs[anlz_dir][0]
+                for name, size in result["files"]:
+                    sizes[(cid, name)] = size
+            content_ids = list({cid for cid, _ in sizes})
+            file_rows = 0
+            for i in range(0, len(content_ids), 500):
+                chunk = content_ids[i:i + 500]
+                for row in self.db.query(ContentFile).filter(ContentFile.ContentID.in_(chunk)):
+                    size = sizes.get((str(row.ContentID), (row.Path or "").rsplit("/", 1)[-1]))
+                    if size is not None:
+                        row.Size = size
+                        row.rb_file_hash_dirty = 1
+                        file_rows += 1
+
+            commit_error = self._safe_commit()
+        except BaseException:
+            self._safe_rollback()
+            _restore_anlz_originals([item for r in rewritten.values() for item in r["originals"]])
+            raise
+        if commit_error:
+            # Put the ANLZ files back so they match the database again
+            return {
+                "success": False,
+                "error": f"Failed to commit relocation: {commit_error}",
+                "anlz_restore_errors": _restore_anlz_originals(originals),
+            }
+        _discard_anlz_originals(originals)
+        return {
+            "success": True,
+            "relocated_count": relocated,
+            "anlz_file_count": sum(len(r["files"]) for r in rewritten.values()),
+            "content_file_count": file_rows,
+            "errors": errors,
+        }
+
+    def relocate_prefix(self, old_prefix: str, new_prefix: str, dry_run: bool = False,
+                        verify: bool = True, max_workers: Optional[int] = None,
+                        db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Move every track below ``old_prefix`` to the same relative path below ``new_prefix``.
+
+        All changes go out in one transaction (see ``_apply_relocations``). With
+        ``verify`` the new paths are checked in a thread pool first and tracks whose
+        target is missing are left alone.
+        """
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            old_prefix = self._normalize_folder_prefix(old_prefix)
+            new_prefix = self._normalize_folder_prefix(new_prefix)
+            if not old_prefix or not new_prefix:
+                return {"success": False, "error": "Both prefixes are required"}
+
+            # LIKE is case-insensitive for ASCII; the exact prefix is checked below
+            candidates = self.db.query(DjmdContent).filter(
+                DjmdContent.FolderPath.startswith(old_prefix + "/", autoescape=True)
+            ).all()
+            moves = {}
+            for content in candidates:
+                if content.FolderPath.startswith(old_prefix + "/"):
+                    moves[content] = new_prefix + content.FolderPath[len(old_prefix):]
+
+            missing_targets = []
+            if verify and moves:
+                targets = list(moves.values())
+                with ThreadPoolExecutor(max_workers=max_workers or 16) as executor:
+                    exists = dict(zip(targets, executor.map(os.path.isfile, targets)))
+                missing_targets = [c for c, target in moves.items() if not exists[target]]
+                for content in missing_targets:
+                    del moves[content]
+
+            summary = {
+                "matched_count": len(moves) + len(missing_targets),
+                "relocate_count": len(moves),
+                "missing_target_count": len(missing_targets),
+                "missing_targets": [
+                    {"id": str(c.ID), "path": c.FolderPath} for c in missing_targets[:100]
+                ],
+            }
+            if dry_run or not moves:
+                return {"success": True, "dry_run": dry_run, **summary}
+
+            applied = self._apply_relocations(moves, max_workers)
+            if not applied["success"]:
+                return applied
+
+            print(
+                f"✓ Relocated {applied['relocated_count']} tracks from {old_prefix} to {new_prefix}",
+                file=sys.stderr,
+            )
+            return {
+                "success": True,
+                "dry_run": False,
+                **summary,
+                "relocated_count": applied["relocated_count"],
+                "anlz_file_count": applied["anlz_file_count"],
+                "content_file_count": applied["content_file_count"],
+                "errors": applied["errors"],
+            }
+        except Exception as e:
+            self._safe_rollback()
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to relocate tracks: {str(e)}"}
+
+    def relocate_auto(self, roots: List[str], dry_run: bool = False, check_duration: bool = False,
+                      max_workers: Optional[int] = None, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Re-point missing tracks at files found below the search ``roots``.
+
+        The roots are walked with a parallel scandir into a (file name, size) index;
+        each missing track is then matched in O(1) by its FileNameL/FolderPath name and
+        FileSize. Unique matches are applied in bulk (see ``_apply_relocations``);
+        tracks with several candidates, or whose only candidate another missing track
+        also matched, are returned for review. ``check_duration``
+        compares candidate durations with the track Length when mutagen is installed,
+        which also settles some ambiguous matches.
+        """
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            missing_result = self.scan_missing(max_workers=max_workers)
+            if not missing_result["success"]:
+                return missing_result
+            missing_ids = [t["id"] for f in missing_result["folders"] for t in f["tracks"]]
+
+            workers = max_workers or 16
+            by_name_size: Dict[Tuple[str, int], List[str]] = {}
+            by_name: Dict[str, List[str]] = {}
+            file_count = 0
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = {executor.submit(_scan_dir_files, os.path.abspath(r)) for r in roots}
+                while pending:
+                    future = next(as_completed(pending))
+                    pending.remove(future)
+                    files, subdirs = future.result()
+                    for name, size, path in files:
+                        key = _name_key(name)
+                        path = path.replace("\\", "/")
+                        by_name_size.setdefault((key, size), []).append(path)
+                        by_name.setdefault(key, []).append(path)
+                    file_count += len(files)
+                    pending.update(executor.submit(_scan_dir_files, d) for d in subdirs)
+
+            duration_available = False
+            if check_duration:
+                try:
+                    import mutagen  # noqa: F401
+                    duration_available = True
+                except ImportError:
+                    print("Warning: mutagen is not installed, skipping the duration check", file=sys.stderr)
+
+            proposals = {}
+            ambiguous = []
+            unmatched = 0
+            contents = []
+            for i in range(0, len(missing_ids), 500):
+                chunk = missing_ids[i:i + 500]
+                contents.extend(self.db.query(DjmdContent).filter(DjmdContent.ID.in_(chunk)))
+            for content in contents:
+                file_name = content.FolderPath.rsplit("/", 1)[-1] if content.FolderPath else content.FileNameL
+                if not file_name:
+                    unmatched += 1
+                    continue
+                name = _name_key(file_name)
+                if content.FileSize:
+                    candidates = by_name_size.get((name, content.FileSize), [])
+                else:
+                    candidates = by_name.get(name, [])
+                if duration_available and content.Length and candidates:
+                    candidates = [
+                        c for c in candidates
+                        if (d := _media_duration(c)) is None or abs(d - content.Length) <= 2
+                    ]
+                if len(candidates) == 1:
+                    proposals[content] = candidates[0]
+                elif candidates:
+                    ambiguous.append({
+                        "id": str(content.ID), "path": content.FolderPath, "candidates": candidates
+                    })
+                else:
+                    unmatched += 1
+
+            # A file claimed by several missing tracks is left for review
+            claims: Dict[str, int] = {}
+            for target in proposals.values():
+                claims[target] = claims.get(target, 0) + 1
+            moves = {}
+            matched = []
+            for content, target in proposals.items():
+                if claims[target] > 1:
+                    ambiguous.append({
+                        "id": str(content.ID), "path": content.FolderPath, "candidates": [target]
+                    })
+                    continue
+                moves[content] = target
+                matched.append({
+                    "id": str(content.ID), "old_path": content.FolderPath, "new_path": target
+                })
+
+            summary = {
+                "missing_count": len(missing_ids),
+                "indexed_file_count": file_count,
+                "matched_count": len(matched),
+                "ambiguous_count": len(ambiguous),
+                "unmatched_count": unmatched,
+                "duration_checked": bool(duration_available),
+                "matched": matched,
+                "ambiguous": ambiguous,
+            }
+            if dry_run or not moves:
+                return {"success": True, "dry_run": dry_run, **summary}
+
+            applied = self._apply_relocations(moves, max_workers)
+            if not applied["success"]:
+                return applied
+            print(f"✓ Relocated {applied['relocated_count']} missing tracks", file=sys.stderr)
+            return {
+                "success": True,
+                "dry_run": False,
+                **summary,
+                "relocated_count": applied["relocated_count"],
+                "anlz_file_count": applied["anlz_file_count"],
+                "content_file_count": applied["content_file_count"],
+                "errors": applied["errors"],
+            }
+        except Exception as e:
+            self._safe_rollback()
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to relocate missing tracks: {str(e)}"}
+
+    @staticmethod
+    def _build_smart_list(conditions: List[Dict], logical_operator: int = 1
+                          ) -> Tuple[Optional[SmartList], Optional[str]]:
+        """Build a SmartList from UI condition dicts; returns (smart_list, error)."""
+        smart = SmartList(logical_operator=logical_operator)
+        for condition in conditions:
+            property_name = condition.get("property")
+            operator_value = condition.get("operator")
+            value_left = condition.get("value_left")
+            value_right = condition.get("value_right")
+
+            # Map string property names to Property enum
+            property_enum = getattr(Property, property_name, None)
+            if not property_enum:
+                return None, f"Unknown property: {property_name}"
+
+            # Map string operators to Operator enum
+            operator_enum = getattr(Operator, operator_value, None)
+            if operator_enum is None:
+                return None, f"Unknown operator: {operator_value}"
+
+            # Add condition to smart list; IN_LAST/NOT_IN_LAST need a date unit
+            smart.add_condition(property_enum, operator_enum, value_left, value_right or "",
+                                unit=condition.get("unit") or "")
+        return smart, None
+
+    def create_smart_playlist(self, name: str, conditions: List[Dict], logical_operator: int = 1, parent: Optional[str] = None) -> Dict[str, Any]:
+        """Create a smart playlist with specified conditions"""
+        try:
+            # Open database if not already open
+            if not self.db:
+                result = self.open_database()
+                if not result["success"]:
+                    return result
+
+            smart, error = self._build_smart_list(conditions, logical_operator)
+            if error:
+                return {"success": False, "error": error}
+
+            # Find parent if specified
+            parent_playlist = None
+            if parent:
+                try:
+                    parent_playlist = self.db.get_playlist(Name=parent).one_or_none()
+                except:
+                    pass
+
+            # Create the smart playlist
+            playlist = self.db.create_smart_playlist(name, smart, parent=parent_playlist)
+            
+            # Commit the changes so the playlist is immediately queryable
+            try:
+                self.db.commit()
+                print(f"✓ Smart playlist '{name}' created and committed (ID: {playlist.ID})", file=sys.stderr)
+            except Exception as commit_error:
+                # If commit fails, try without autoincrement
+                error_str = str(commit_error)
+                if "malformed" in error_str.lower() or "corrupt" in error_str.lower() or "database disk image" in error_str.lower():
+                    print(f"Warning: Commit failed due to corruption, retrying without USN updates...", file=sys.stderr)
+                    try:
+                        self.db.rollback()
+                        # Recreate the playlist since we rolled back
+                        playlist = self.db.create_smart_playlist(name, smart, parent=parent_playlist)
+                        self.db.commit(autoinc=False)
+                        print(f"✓ Smart playlist '{name}' created and committed without USN updates (ID: {playlist.ID})", file=sys.stderr)
+                    except Exception as retry_error:
+                        # Rollback again if retry fails
+                        try:
+                            self.db.rollback()
+                        except:
+                            pass
+                        return {
+                            "success": False,
+                            "error": f"Failed to commit smart playlist: {str(retry_error)}"
+                        }
+                else:
+                    # Rollback on other errors
+                    try:
+                        self.db.rollback()
+                    except:
+                        pass
+                    return {
+                        "success": False,
+                        "error": f"Failed to commit smart playlist: {error_str}"
+                    }
+
+            return {
+                "success": True,
+                "playlist_id": str(playlist.ID),
+                "playlist_name": playlist.Name,
+                "message": f"Smart playlist '{name}' created successfully"
+            }
+
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {
+                "success": False,
+                "error": f"Failed to create smart playlist: {str(e)}"
+            }
+
+    def _resolve_anlz_dir(self, track_path: str, cache: Optional["AnlzCache"]
+                          ) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+        """Resolve a track path to ``(anlz_dir, duration_ms, error)``.
+
+        ``anlz_dir`` is None if the track is not in the library or has no
+        analysis. Lookups are memoized in the AnlzCache while master.db is
+        unchanged.
+        """
+        normalized = self._normalize_track_path(track_path)
+        db_signature = self._db_signature()
+        cached_track = cache.get_track(normalized, db_signature) if cache else None
+        if cached_track:
+            _, anlz_dir, duration_ms = cached_track
+            return anlz_dir, duration_ms, None
+
+        content = self.db.get_content(FolderPath=normalized).one_or_none()
+        if not content:
+            for c in self.db.get_content():
+                if not c.FolderPath:
+                    continue
+                p = str(c.FolderPath).replace("\\", "/")
+                if p.lower() == normalized.lower():
+                    content = c
+                    break
+        if not content:
+            return None, None, None
+
+        duration_ms = None
+        if content.Length is not None:
+            duration_ms = int(content.Length * 1000)
+
+        try:
+            anlz_dir = str(self.db.get_anlz_dir(content))
+        except Exception as e:
+            return None, duration_ms, str(e)
+        if cache:
+            cache.put_track(normalized, db_signature, str(content.ID), anlz_dir, duration_ms)
+        return anlz_dir, duration_ms, None
+
+    def get_anlz_data(self, track_path: str, db_path: Optional[str] = None,
+                      encoding: str = "json") -> Dict[str, Any]:
+        """Get waveform preview and cues from Rekordbox ANLZ analysis for a track.
+
+        Decoded results are served from the on-disk AnlzCache when the ANLZ files
+        are unchanged, so repeated calls do not re-parse the analysis files.
+        ``encoding`` selects how the waveform array is returned (see ``_encode_array``).
+        """
+        cache = None
+        array_dir = None
+        try:
+            array_dir = _array_file_dir(encoding)
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            try:
+                cache = AnlzCache(self._cache_dir())
+            except Exception as e:
+                print(f"Warning: ANLZ cache unavailable: {e}", file=sys.stderr)
+
+            anlz_dir, duration_ms, error = self._resolve_anlz_dir(track_path, cache)
+            if anlz_dir is None:
+                result = {"success": True, "waveform": None, "cues": [], "duration_ms": duration_ms}
+                if error:
+                    result["error"] = error
+                return result
+
+            signature = _anlz_dir_signature(anlz_dir)
+            decoded = cache.get(anlz_dir, signature) if cache and signature is not None else None
+            if decoded is None:
+                try:
+                    decoded = _decode_anlz_dir(anlz_dir)
+                except Exception as e:
+                    return {
+                        "success": True,
+                        "waveform": None,
+                        "cues": [],
+                        "duration_ms": duration_ms,
+                        "error": str(e),
+                    }
+                if cache and signature is not None:
+                    cache.put(anlz_dir, signature, decoded)
+
+            waveform = None
+            if decoded["waveform"] is not None:
+                waveform = {"preview": _encode_array(decoded["waveform"], encoding, array_dir)}
+
+            return {
+                "success": True,
+                "waveform": waveform,
+                "cues": _cues_to_json(decoded["cues"]),
+                "duration_ms": duration_ms,
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "waveform": None,
+                "cues": [],
+                "duration_ms": None,
+            }
+        finally:
+            if cache:
+                cache.close()
+            _release_array_file_dir(array_dir)
+
+    def get_waveform_slice(self, track_path: str, px_per_sec: Optional[float] = None,
+                           start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                           db_path: Optional[str] = None, encoding: str = "json") -> Dict[str, Any]:
+        """Get a range of one level of a track's detail waveform pyramid.
+
+        The level is the coarsest one with at least ``px_per_sec`` buckets per
+        second (the full 150 px/s detail if omitted). The pyramid is built from
+        PWV5 (or PWV3) on first use and cached per ANLZ signature. ``encoding``
+        selects how the bucket arrays are returned (see ``_encode_array``).
+        """
+        anlz_cache = None
+        wf_cache = None
+        array_dir = None
+        try:
+            array_dir = _array_file_dir(encoding)
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            anlz_cache = AnlzCache(self._cache_dir())
+            wf_cache = WaveformCache(self._cache_dir())
+
+            anlz_dir, duration_ms, error = self._resolve_anlz_dir(track_path, anlz_cache)
+            if anlz_dir is None:
+                return {"success": True, "waveform": None, "duration_ms": duration_ms, "error": error}
+
+            signature = _anlz_dir_signature(anlz_dir)
+            if signature is None:
+                return {"success": True, "waveform": None, "duration_ms": duration_ms,
+                        "error": f"ANLZ directory not found: {anlz_dir}"}
+            info = wf_cache.get_info(anlz_dir, signature)
+            if info is None:
+                pyramid = _build_waveform_pyramid(anlz_dir)
+                wf_cache.put(anlz_dir, signature, pyramid)
+                info = (pyramid["source"], pyramid["entry_count"]) if pyramid else (None, 0)
+            source, entry_count = info
+            if source is None:
+                return {"success": True, "waveform": None, "duration_ms": duration_ms}
+
+            rates = [WAVEFORM_DETAIL_RATE / size for size in WAVEFORM_BUCKET_SIZES]
+            level = 0
+            if px_per_sec:
+                level = max(i for i, rate in enumerate(rates) if rate >= px_per_sec or i == 0)
+            size = WAVEFORM_BUCKET_SIZES[level]
+            bucket_count = -(-entry_count // size)
+            start = 0 if start_ms is None else int(start_ms * WAVEFORM_DETAIL_RATE / 1000) // size
+            end = bucket_count if end_ms is None else -(-int(end_ms * WAVEFORM_DETAIL_RATE / 1000) // size)
+            start = min(max(start, 0), bucket_count)
+            end = min(max(end, start), bucket_count)
+            buckets = wf_cache.get_slice(anlz_dir, level, start, end)
+
+            return {
+                "success": True,
+                "duration_ms": duration_ms,
+                "waveform": {
+                    "source": source,
+                    "level": level,
+                    "px_per_sec": rates[level],
+                    "bucket_count": bucket_count,
+                    "start_index": start,
+                    "start_ms": start * size * 1000 / WAVEFORM_DETAIL_RATE,
+                    "min": _encode_array(buckets["min"], encoding, array_dir),
+                    "max": _encode_array(buckets["max"], encoding, array_dir),
+                    "rms": _encode_array(buckets["rms"], encoding, array_dir),
+                    "color": _encode_array(np.stack([buckets["r"], buckets["g"], buckets["b"]], axis=1), encoding, array_dir),
+                },
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to get waveform slice: {str(e)}", "waveform": None}
+        finally:
+            if anlz_cache:
+                anlz_cache.close()
+            if wf_cache:
+                wf_cache.close()
+            _release_array_file_dir(array_dir)
+
+    def _anlz_dir_for(self, analysis_data_path: Optional[str]) -> Optional[str]:
+        """ANLZ directory for an AnalysisDataPath value (same as db.get_anlz_dir)."""
+        if not analysis_data_path:
+            return None
+        return str(self.db.share_directory / Path(analysis_data_path.strip("\\/")).parent)
+
+    def get_anlz_data_batch(self, track_paths: List[str], db_path: Optional[str] = None,
+                            stream: bool = False, max_workers: Optional[int] = None,
+                            encoding: str = "json") -> Dict[str, Any]:
+        """Get waveform previews and cues for many tracks at once.
+
+        All contents are resolved with a single query and a case-folded path
+        index. Tracks missing from the AnlzCache are parsed in a process pool.
+        With ``stream`` each track is emitted as an ``anlz`` event as soon as it
+        is ready and the final result only carries the counts. ``encoding`` is
+        applied to every waveform (see ``_encode_array``).
+        """
+        cache = None
+        array_dir = None
+        try:
+            array_dir = _array_file_dir(encoding)
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            # One query for all contents, indexed by exact and case-folded path
+            exact_index: Dict[str, Tuple[str, Optional[str], Optional[int]]] = {}
+            folded_index: Dict[str, Tuple[str, Optional[str], Optional[int]]] = {}
+            rows = self.db.query(
+                DjmdContent.ID, DjmdContent.FolderPath, DjmdContent.AnalysisDataPath, DjmdContent.Length
+            ).all()
+            for cid, folder_path, analysis_path, length in rows:
+                if not folder_path:
+                    continue
+                entry = (str(cid), analysis_path, int(length * 1000) if length is not None else None)
+                exact_index[folder_path] = entry
+                folded_index.setdefault(str(folder_path).replace("\\", "/").lower(), entry)
+
+            try:
+                cache = AnlzCache(self._cache_dir())
+            except Exception as e:
+                print(f"Warning: ANLZ cache unavailable: {e}", file=sys.stderr)
+
+            tracks: Dict[str, Dict[str, Any]] = {}
+
+            def deliver(track_path: str, data: Dict[str, Any]) -> None:
+                if stream:
+                    _emit_event({"event": "anlz", "track_path": track_path, **data})
+                else:
+                    tracks[track_path] = data
+
+            def to_payload(decoded: Dict[str, Any], duration_ms: Optional[int]) -> Dict[str, Any]:
+                waveform = None
+                if decoded["waveform"] is not None:
+                    waveform = {"preview": _encode_array(decoded["waveform"], encoding, array_dir)}
+                return {"waveform": waveform, "cues": _cues_to_json(decoded["cues"]), "duration_ms": duration_ms}
+
+            # Resolve contents and serve cache hits; collect the directories to parse
+            pending: Dict[str, List[Tuple[str, Optional[int]]]] = {}
+            signatures: Dict[str, Optional[str]] = {}
+            cached = 0
+            for track_path in track_paths:
+                normalized = self._normalize_track_path(track_path)
+                entry = exact_index.get(normalized) or folded_index.get(normalized.lower())
+                if not entry:
+                    deliver(track_path, {"waveform": None, "cues": [], "duration_ms": None})
+                    continue
+                _, analysis_path, duration_ms = entry
+                anlz_dir = self._anlz_dir_for(analysis_path)
+                if not anlz_dir:
+                    deliver(track_path, {"waveform": None, "cues": [], "duration_ms": duration_ms})
+                    continue
+                if anlz_dir not in signatures:
+                    signatures[anlz_dir] = _anlz_dir_signature(anlz_dir)
+                signature = signatures[anlz_dir]
+                decoded = cache.get(anlz_dir, signature) if cache and signature is not None else None
+                if decoded is not None:
+                    cached += 1
+                    deliver(track_path, to_payload(decoded, duration_ms))
+                else:
+                    pending.setdefault(anlz_dir, []).append((track_path, duration_ms))
+
+            def finish(anlz_dir: str, decoded: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+                signature = signatures.get(anlz_dir)
+                if decoded is not None and cache and signature is not None:
+                    cache.put(anlz_dir, signature, decoded)
+                for track_path, duration_ms in pending[anlz_dir]:
+                    if decoded is None:
+                        deliver(track_path, {"waveform": None, "cues": [], "duration_ms": duration_ms, "error": error})
+                    else:
+                        deliver(track_path, to_payload(decoded, duration_ms))
+
+            parsed = 0
+            if len(pending) <= 2:
+                # Not worth spawning worker processes
+                for anlz_dir in pending:
+                    try:
+                        finish(anlz_dir, _decode_anlz_dir(anlz_dir), None)
+                    except Exception as e:
+                        finish(anlz_dir, None, str(e))
+                    parsed += 1
+            else:
+                workers = max_workers or min(len(pending), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(_decode_anlz_dir, d): d for d in pending}
+                    for future in as_completed(futures):
+                        anlz_dir = futures[future]
                         try:
-                            self.db.rollback()
-                            print("✓ Rolled back playlist transaction", file=sys.stderr)
-                        except Exception as rollback_error:
-                            print(f"Error rolling back playlist changes: {rollback_error}", file=sys.stderr)
-                        
-                        # Check if it's a corruption error - try committing without autoincrement
-                        if "malformed" in error_str.lower() or "corrupt" in error_str.lower() or "database disk image" in error_str.lower():
-                            print("Attempting to commit playlists without USN autoincrement...", file=sys.stderr)
-                            try:
-                                self.db.commit(autoinc=False)
-                                print("✓ Playlist changes committed successfully without USN updates", file=sys.stderr)
-                            except Exception as retry_error:
-                                errors.append(f"Failed to commit playlist changes: {error_str}")
-                                print("⚠ Database corruption detected during playlist commit", file=sys.stderr)
-                                print("⚠ Playlists were not saved due to corruption", file=sys.stderr)
-                        else:
-                            errors.append(f"Failed to commit playlist changes: {error_str}")
-            
-            print(f"Export summary: {added_count} tracks added, {updated_count} tracks updated, {deleted_count} tracks deleted, {skipped_count} tracks skipped", file=sys.stderr)
-            print(f"Playlist summary: {playlist_added_count} playlists added, {playlist_updated_count} playlists updated, {playlist_skipped_count} playlists skipped", file=sys.stderr)
-            if skipped_count > 0:
-                print(f"  Note: Skipped tracks are either unchanged or don't exist in database", file=sys.stderr)
-            if deleted_count > 0:
-                print(f"  Note: {deleted_count} tracks deleted from Rekordbox (not in Bonk library)", file=sys.stderr)
-            if errors:
-                print(f"Errors: {len(errors)}", file=sys.stderr)
-                for error in errors[:5]:  # Print first 5 errors
-                    print(f"  - {error}", file=sys.stderr)
-            
-            return {
+                            finish(anlz_dir, future.result(), None)
+                        except Exception as e:
+                            finish(anlz_dir, None, str(e))
+                        parsed += 1
+
+            result = {
                 "success": True,
-                "added": added_count,
-                "updated": updated_count,
-                "deleted": deleted_count,
-                "skipped": skipped_count,
-                "playlists_added": playlist_added_count,
-                "playlists_updated": playlist_updated_count,
-                "playlists_skipped": playlist_skipped_count,
-                "corruption_hits": getattr(self, "_last_corruption_hits", None) or None,
-                "errors": errors if errors else None,
-                "db_path": actual_db_path
+                "track_count": len(track_paths),
+                "parsed_count": parsed,
+                "cached_count": cached,
             }
-        
+            if not stream:
+                result["tracks"] = tracks
+            return result
         except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to get ANLZ data: {str(e)}"}
+        finally:
+            if cache:
+                cache.close()
+            _release_array_file_dir(array_dir)
+
+    def index_anlz(self, db_path: Optional[str] = None, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """Rebuild the persistent ANLZ directory index and match it against the library."""
+        index = None
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            started = datetime.now()
+            index = AnlzIndex(self._cache_dir())
+            dir_count = index.rebuild(str(self.db.share_directory), max_workers=max_workers)
+            elapsed = (datetime.now() - started).total_seconds()
+            print(f"✓ Indexed {dir_count} ANLZ directories in {elapsed:.2f}s", file=sys.stderr)
+
+            indexed = index.analysis_dirs()
+            referenced = set()
+            missing_analysis = []
+            for cid, analysis_path in self.db.query(DjmdContent.ID, DjmdContent.AnalysisDataPath).all():
+                if not analysis_path:
+                    continue
+                key = AnlzIndex.key_for(analysis_path)
+                referenced.add(key)
+                if key not in indexed:
+                    missing_analysis.append(str(cid))
+
             return {
-                "success": False,
-                "error": f"Failed to export to database: {str(e)}"
+                "success": True,
+                "dir_count": dir_count,
+                "elapsed_seconds": elapsed,
+                "missing_analysis": missing_analysis,
+                "orphaned_dir_count": len(indexed - referenced),
             }
-    
-    def update_track_path(self, track_id: str, new_path: str, old_path: Optional[str] = None, db_path: Optional[str] = None) -> Dict[str, Any]:
-        """Update a track's file path in the Rekordbox database
-        
-        Can find track by ID (if numeric) or by old file path
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to index ANLZ files: {str(e)}"}
+        finally:
+            if index:
+                index.close()
+
+    def analyze_beatgrids(self, db_path: Optional[str] = None, stream: bool = False,
+                          max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """Compute beat grid statistics for the whole library.
+
+        Grids are decoded in a process pool; tracks whose ANLZ files are
+        unchanged since the last run are skipped. With ``stream`` a
+        ``progress`` event is emitted for every analysed track.
         """
+        cache = None
         try:
-            # Open database if not already open
             if not self.db:
                 result = self.open_database(db_path)
                 if not result["success"]:
                     return result
-            
-            content = None
-            
-            # Try to find track by ID first (if it's a numeric ID)
-            try:
-                track_id_int = int(track_id)
-                # get_content(ID=...) already returns DjmdContent or None, not a query
-                content = self.db.get_content(ID=track_id_int)
-            except (ValueError, TypeError):
-                # Track ID is not numeric (probably from XML import)
-                # Try to find by file path instead
-                pass
-            
-            # If not found by ID, try to find by old path
-            if not content and old_path:
-                # Normalize old path for comparison
-                normalized_old_path = str(old_path).replace("\\", "/")
-                # Remove file:// prefix if present
-                if normalized_old_path.startswith("file://localhost"):
-                    normalized_old_path = normalized_old_path.replace("file://localhost", "")
-                elif normalized_old_path.startswith("file://"):
-                    normalized_old_path = normalized_old_path.replace("file://", "")
-                
-                # Try to find by exact path match
-                try:
-                    content = self.db.get_content(FolderPath=normalized_old_path).one_or_none()
-                except:
-                    pass
-                
-                # If still not found, try case-insensitive search
-                if not content:
-                    all_content = list(self.db.get_content())
-                    for c in all_content:
-                        if c.FolderPath and c.FolderPath.lower() == normalized_old_path.lower():
-                            content = c
-                            break
-            
-            if not content:
-                return {
-                    "success": False, 
-                    "error": f"Track not found in database (ID: {track_id}, Path: {old_path})",
-                    "skipped": True
-                }
-            
-            # Normalize new path (Rekordbox uses forward slashes)
-            normalized_path = str(new_path).replace("\\", "/")
-            # Remove file:// prefix if present
-            if normalized_path.startswith("file://localhost"):
-                normalized_path = normalized_path.replace("file://localhost", "")
-            elif normalized_path.startswith("file://"):
-                normalized_path = normalized_path.replace("file://", "")
-            
-            old_db_path = content.FolderPath
-            
-            # Update the path using pyrekordbox's update_content_path
-            self.db.update_content_path(content, normalized_path, save=True, check_path=False, commit=True)
-            
+
+            cache = BeatgridCache(self._cache_dir())
+            known = cache.signatures()
+
+            db_bpms: Dict[str, Optional[float]] = {}
+            pending: Dict[str, List[str]] = {}
+            signatures: Dict[str, Optional[str]] = {}
+            no_analysis = 0
+            rows = self.db.query(DjmdContent.ID, DjmdContent.AnalysisDataPath, DjmdContent.BPM).all()
+            for cid, analysis_path, bpm in rows:
+                cid = str(cid)
+                db_bpms[cid] = bpm / 100 if bpm else None
+                anlz_dir = self._anlz_dir_for(analysis_path)
+                if not anlz_dir:
+                    no_analysis += 1
+                    continue
+                if anlz_dir not in signatures:
+                    signatures[anlz_dir] = _anlz_dir_signature(anlz_dir)
+                signature = signatures[anlz_dir]
+                if signature is None:
+                    no_analysis += 1
+                    continue
+                if known.get(cid) != (anlz_dir, signature):
+                    pending.setdefault(anlz_dir, []).append(cid)
+
+            new_rows: List[Tuple] = []
+            errors: List[Dict[str, str]] = []
+            no_grid = 0
+            done = 0
+
+            def finish(anlz_dir: str, stats: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+                nonlocal done, no_grid
+                for cid in pending[anlz_dir]:
+                    done += 1
+                    if error:
+                        errors.append({"id": cid, "error": error})
+                    elif stats is None:
+                        no_grid += 1
+                    else:
+                        db_bpm = db_bpms.get(cid)
+                        mismatch = abs(stats["bpm_avg"] - db_bpm) if db_bpm is not None else None
+                        values = tuple(stats[k] for k in BeatgridCache.STAT_COLUMNS)
+                        new_rows.append((cid, anlz_dir, signatures[anlz_dir]) + values + (db_bpm, mismatch))
+                    if stream:
+                        _emit_event({"event": "progress", "id": cid, "done": done})
+
+            if len(pending) <= 2:
+                for anlz_dir in pending:
+                    try:
+                        finish(anlz_dir, _beatgrid_stats(anlz_dir), None)
+                    except Exception as e:
+                        finish(anlz_dir, None, str(e))
+            else:
+                workers = max_workers or min(len(pending), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(_beatgrid_stats, d): d for d in pending}
+                    for future in as_completed(futures):
+                        anlz_dir = futures[future]
+                        try:
+                            finish(anlz_dir, future.result(), None)
+                        except Exception as e:
+                            finish(anlz_dir, None, str(e))
+
+            cache.put_many(new_rows)
+            cache.update_bpms(db_bpms)
+            pruned = cache.prune(set(db_bpms))
+            print(f"✓ Analysed {len(new_rows)} beat grids ({len(errors)} errors)", file=sys.stderr)
+
             return {
                 "success": True,
-                "track_id": str(content.ID),
-                "old_path": old_db_path,
-                "new_path": normalized_path
+                "track_count": len(db_bpms),
+                "analysed_count": len(new_rows),
+                "cached_count": len(db_bpms) - no_analysis - done,
+                "no_analysis_count": no_analysis,
+                "no_grid_count": no_grid,
+                "pruned_count": pruned,
+                "errors": errors,
             }
         except Exception as e:
-            error_msg = str(e)
-            # Check for common database errors
-            if "database disk image is malformed" in error_msg or "malformed" in error_msg.lower():
-                # Database corruption or lock issue
-                if "locked" in error_msg.lower() or "busy" in error_msg.lower():
-                    return {
-                        "success": False,
-                        "error": f"Database is locked. Please close Rekordbox and try again. Error: {error_msg}"
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to analyse beat grids: {str(e)}"}
+        finally:
+            if cache:
+                cache.close()
+
+    def query_beatgrids(self, min_bpm_mismatch: Optional[float] = None, min_drift_ms: Optional[float] = None,
+                        variable_bpm: Optional[bool] = None, order_by: str = "bpm_mismatch",
+                        limit: Optional[int] = None, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Query the beat grid statistics written by analyze_beatgrids."""
+        cache = None
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            cache = BeatgridCache(self._cache_dir())
+            tracks = cache.query(min_bpm_mismatch, min_drift_ms, variable_bpm, order_by, limit)
+            return {"success": True, "tracks": tracks, "count": len(tracks)}
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to query beat grids: {str(e)}"}
+        finally:
+            if cache:
+                cache.close()
+
+    def shift_cues(self, edits: List[Dict[str, Any]], dry_run: bool = False,
+                   max_workers: Optional[int] = None, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Shift the cue points of many tracks, e.g. after a re-grid.
+
+        Each edit is ``{"track_id", "offset_ms", "cues": "all"|"hot"|"memory"}``.
+        The ANLZ files are rewritten in a process pool (see
+        ``_shift_anlz_cues``); the matching DjmdCue rows of all tracks whose
+        files were written are then updated in a single transaction; if that
+        fails, the original ANLZ files are put back. Cues that a negative offset
+        would move before 0 are placed at 0 and listed per track in ``clamped``.
+        """
+        written: Dict[str, Dict[str, Any]] = {}
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            if not dry_run:
+                try:
+                    if get_rekordbox_pid():
+                        return {
+                            "success": False,
+                            "error": "Rekordbox is running. Please close Rekordbox before editing cues."
+                        }
+                except Exception as e:
+                    print(f"Could not check if Rekordbox is running: {e}", file=sys.stderr)
+
+            # Plan: resolve every edit to its ANLZ directory
+            plan: Dict[str, Tuple[str, int, str]] = {}
+            errors: List[Dict[str, str]] = []
+            ids = [str(e.get("track_id")) for e in edits]
+            analysis_paths = dict(
+                self.db.query(DjmdContent.ID, DjmdContent.AnalysisDataPath)
+                .filter(DjmdContent.ID.in_(ids)).all()
+            )
+            for edit in edits:
+                cid = str(edit.get("track_id"))
+                cues = edit.get("cues", "all")
+                if cues not in ("all", "hot", "memory"):
+                    errors.append({"id": cid, "error": f"Invalid cues selection: {cues}"})
+                    continue
+                if cid not in analysis_paths:
+                    errors.append({"id": cid, "error": "Track not found"})
+                    continue
+                anlz_dir = self._anlz_dir_for(analysis_paths[cid])
+                if not anlz_dir or not os.path.isdir(anlz_dir):
+                    errors.append({"id": cid, "error": "No analysis data"})
+                    continue
+                plan[cid] = (anlz_dir, int(edit.get("offset_ms", 0)), cues)
+
+            # Rewrite the ANLZ files
+            if len(plan) <= 2:
+                for cid, (anlz_dir, offset_ms, cues) in plan.items():
+                    try:
+                        written[cid] = _shift_anlz_cues(anlz_dir, offset_ms, cues, dry_run)
+                    except Exception as e:
+                        errors.append({"id": cid, "error": str(e)})
+            else:
+                workers = max_workers or min(len(plan), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {
+                        executor.submit(_shift_anlz_cues, anlz_dir, offset_ms, cues, dry_run): cid
+                        for cid, (anlz_dir, offset_ms, cues) in plan.items()
                     }
-                else:
+                    for future in as_completed(futures):
+                        cid = futures[future]
+                        try:
+                            written[cid] = future.result()
+                        except Exception as e:
+                            errors.append({"id": cid, "error": str(e)})
+
+            originals = [item for r in written.values() for item in r["originals"]]
+
+            # Update the DjmdCue rows of all written tracks in one transaction
+            db_cue_count = 0
+            db_clamped: Dict[str, int] = {}
+            written_ids = list(written)
+            for i in range(0, len(written_ids), 500):
+                chunk = written_ids[i:i + 500]
+                track_cues: Dict[str, List[Any]] = {}
+                for cue in self.db.query(DjmdCue).filter(DjmdCue.ContentID.in_(chunk)).all():
+                    track_cues.setdefault(str(cue.ContentID), []).append(cue)
+                for cid, cue_rows in track_cues.items():
+                    _, offset_ms, cues = plan[cid]
+                    # MPEG positions (VBR/ABR files only) per ms, from the track's other cues
+                    mpeg_rates = {}
+                    for col in ("MpegFrame", "MpegAbs"):
+                        rates = [
+                            getattr(cue, f"{prefix}{col}") / getattr(cue, f"{prefix}Msec")
+                            for cue in cue_rows for prefix in ("In", "Out")
+                            if (getattr(cue, f"{prefix}Msec") or 0) > 0 and getattr(cue, f"{prefix}{col}")
+                        ]
+                        mpeg_rates[col] = sum(rates) / len(rates) if rates else None
+                    for cue in cue_rows:
+                        is_hot = bool(cue.Kind)
+                        if (cues == "hot" and not is_hot) or (cues == "memory" and is_hot):
+                            continue
+                        for prefix in ("In", "Out"):
+                            msec = getattr(cue, f"{prefix}Msec")
+                            if msec is None or msec < 0:
+                                continue
+                            if msec + offset_ms < 0 and prefix == "In":
+                                db_clamped[cid] = db_clamped.get(cid, 0) + 1
+                            new_msec = max(msec + offset_ms, 0)
+                            setattr(cue, f"{prefix}Msec", new_msec)
+                            setattr(cue, f"{prefix}Frame", int(round(new_msec * CUE_FRAMES_PER_MS)))
+                            for col, rate in mpeg_rates.items():
+                                if rate is not None:
+                                    setattr(cue, f"{prefix}{col}", int(round(new_msec * rate)))
+                        db_cue_count += 1
+
+            if dry_run:
+                self._safe_rollback()
+            else:
+                commit_err = self._safe_commit()
+                if commit_err:
+                    # Put the ANLZ files back so they match the database again
+                    restore_errors = _restore_anlz_originals(originals)
                     return {
                         "success": False,
-                        "error": f"Database corruption detected. The database may be locked by Rekordbox, or a specific record is corrupted. Try closing Rekordbox and try again. Error: {error_msg}"
+                        "error": f"Saving cues to the database failed, ANLZ files were restored: {commit_err}",
+                        "written_ids": written_ids,
+                        "anlz_restore_errors": restore_errors,
+                    }
+                _discard_anlz_originals(originals)
+
+            return {
+                "success": True,
+                "dry_run": dry_run,
+                "track_count": len(written),
+                "anlz_entry_count": sum(r["entry_count"] for r in written.values()),
+                "file_count": sum(r["file_count"] for r in written.values()),
+                "db_cue_count": db_cue_count,
+                "clamped": [
+                    {
+                        "id": cid,
+                        "anlz_entry_count": written[cid]["clamped_count"],
+                        "db_cue_count": db_clamped.get(cid, 0),
                     }
+                    for cid in written_ids
+                    if written[cid]["clamped_count"] or db_clamped.get(cid)
+                ],
+                "errors": errors,
+            }
+        except Exception as e:
+            self._safe_rollback()
+            _restore_anlz_originals([item for r in written.values() for item in r["originals"]])
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to shift cues: {str(e)}"}
+
+    def sync_library_index(self, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Bring the sidecar library index up to date with master.db."""
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            t0 = time.perf_counter()
+            library = LibraryIndex(self._cache_dir())
+            try:
+                stats = library.sync(
+                    self.db, self._content_to_track, self._db_signature(), self._db_file_id()
+                )
+            finally:
+                library.close()
+            return {
+                "success": True,
+                **stats,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to sync library index: {str(e)}"}
+
+    def search_content(self, query: str, limit: int = 100,
+                       db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Ranked prefix search over title, artists, album, genre, key and comments.
+
+        Served from the FTS5 index of the library index; falls back to
+        ``Rekordbox6Database.search_content`` when FTS5 is unavailable.
+        """
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            t0 = time.perf_counter()
+            library = self._library_index()
+            if library is not None and library.fts:
+                ids = library.search(query, limit)
             else:
-                return {
-                    "success": False,
-                    "error": f"Failed to update track path: {error_msg}"
-                }
-    
-    def create_smart_playlist(self, name: str, conditions: List[Dict], logical_operator: int = 1, parent: Optional[str] = None) -> Dict[str, Any]:
-        """Create a smart playlist with specified conditions"""
+                ids = [str(content.ID) for content in self.db.search_content(query)][:limit]
+            return {
+                "success": True,
+                "ids": ids,
+                "count": len(ids),
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to search content: {str(e)}"}
+
+    def find_duplicates(self, db_path: Optional[str] = None, threshold: float = 0.85,
+                        duration_tolerance: float = 3.0) -> Dict[str, Any]:
+        """Find clusters of duplicate tracks, each with a suggested keeper."""
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            t0 = time.perf_counter()
+            library = self._library_index()
+            if library is not None:
+                rows = library.match_rows()
+            else:
+                rows = []
+                for content in self.db.get_content():
+                    rows.append(dict(zip(MATCH_FIELDS, (
+                        str(content.ID), content.Title, content.ArtistName, content.Length,
+                        content.FileSize, content.BitRate, content.Rating,
+                        int(content.DJPlayCount) if content.DJPlayCount else None,
+                        content.created_at.isoformat() if content.created_at else "",
+                        content.FolderPath,
+                    ))))
+
+            clusters = _find_duplicate_clusters(rows, threshold, duration_tolerance)
+            return {
+                "success": True,
+                "clusters": clusters,
+                "cluster_count": len(clusters),
+                "duplicate_count": sum(len(c["tracks"]) - 1 for c in clusters),
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to find duplicates: {str(e)}"}
+
+    def find_duplicate_files(self, db_path: Optional[str] = None, max_workers: Optional[int] = None,
+                             stream: bool = False) -> Dict[str, Any]:
+        """Find groups of byte-identical files among the library's FolderPaths.
+
+        Only files sharing a size are hashed: first a head/tail sample, then the
+        whole file for sample collisions. Reads run in a thread pool and digests
+        are cached by (path, size, mtime), so re-runs only hash changed files.
+        With ``stream`` a ``progress`` event is emitted per hashed file.
+        """
+        cache = None
         try:
-            # Open database if not already open
             if not self.db:
-                result = self.open_database()
+                result = self.open_database(db_path)
                 if not result["success"]:
                     return result
 
-            # Create SmartList object
-            smart = SmartList(logical_operator=logical_operator)
+            cache = DigestCache(self._cache_dir())
+            cached = cache.get_all()
 
-            # Add conditions
-            for condition in conditions:
-                property_name = condition.get("property")
-                operator_value = condition.get("operator")
-                value_left = condition.get("value_left")
-                value_right = condition.get("value_right")
+            content_ids: Dict[str, List[str]] = {}
+            for cid, folder_path in self.db.query(DjmdContent.ID, DjmdContent.FolderPath):
+                if folder_path:
+                    content_ids.setdefault(folder_path, []).append(str(cid))
+            paths = list(content_ids)
 
-                # Map string property names to Property enum
-                property_enum = getattr(Property, property_name, None)
-                if not property_enum:
-                    return {
-                        "success": False,
-                        "error": f"Unknown property: {property_name}"
-                    }
-
-                # Map string operators to Operator enum
-                operator_enum = getattr(Operator, operator_value, None)
-                if operator_enum is None:
-                    return {
-                        "success": False,
-                        "error": f"Unknown operator: {operator_value}"
-                    }
+            workers = max_workers or 8
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                stats = dict(zip(paths, executor.map(_stat_file, paths)))
+                missing = [p for p, st in stats.items() if st is None]
 
-                # Add condition to smart list
-                if value_right:
-                    smart.add_condition(property_enum, operator_enum, value_left, value_right)
-                else:
-                    smart.add_condition(property_enum, operator_enum, value_left)
+                # Entry per existing file: [size, mtime_ns, sample, full]
+                entries: Dict[str, List[Any]] = {}
+                for path, st in stats.items():
+                    if st is None:
+                        continue
+                    previous = cached.get(path)
+                    if previous is not None and tuple(previous[:2]) == st:
+                        entries[path] = list(previous)
+                    else:
+                        entries[path] = [st[0], st[1], None, None]
 
-            # Find parent if specified
-            parent_playlist = None
-            if parent:
-                try:
-                    parent_playlist = self.db.get_playlist(Name=parent).one_or_none()
-                except:
-                    pass
+                errors: List[Dict[str, str]] = []
+                hashed_bytes = 0
+                done = 0
 
-            # Create the smart playlist
-            playlist = self.db.create_smart_playlist(name, smart, parent=parent_playlist)
-            
-            # Commit the changes so the playlist is immediately queryable
-            try:
-                self.db.commit()
-                print(f"✓ Smart playlist '{name}' created and committed (ID: {playlist.ID})", file=sys.stderr)
-            except Exception as commit_error:
-                # If commit fails, try without autoincrement
-                error_str = str(commit_error)
-                if "malformed" in error_str.lower() or "corrupt" in error_str.lower() or "database disk image" in error_str.lower():
-                    print(f"Warning: Commit failed due to corruption, retrying without USN updates...", file=sys.stderr)
-                    try:
-                        self.db.rollback()
-                        # Recreate the playlist since we rolled back
-                        playlist = self.db.create_smart_playlist(name, smart, parent=parent_playlist)
-                        self.db.commit(autoinc=False)
-                        print(f"✓ Smart playlist '{name}' created and committed without USN updates (ID: {playlist.ID})", file=sys.stderr)
-                    except Exception as retry_error:
-                        # Rollback again if retry fails
+                def run_stage(stage: str, jobs: List[str], slot: int, func) -> None:
+                    nonlocal hashed_bytes, done
+                    futures = {executor.submit(func, path): path for path in jobs}
+                    for future in as_completed(futures):
+                        path = futures[future]
+                        done += 1
                         try:
-                            self.db.rollback()
-                        except:
-                            pass
-                        return {
-                            "success": False,
-                            "error": f"Failed to commit smart playlist: {str(retry_error)}"
-                        }
-                else:
-                    # Rollback on other errors
-                    try:
-                        self.db.rollback()
-                    except:
-                        pass
-                    return {
-                        "success": False,
-                        "error": f"Failed to commit smart playlist: {error_str}"
-                    }
+                            entries[path][slot] = future.result()
+                            hashed_bytes += (
+                                min(entries[path][0], 2 * DIGEST_SAMPLE_SIZE) if slot == 2
+                                else entries[path][0]
+                            )
+                        except OSError as e:
+                            errors.append({"path": path, "error": str(e)})
+                            entries.pop(path)
+                        if stream:
+                            _emit_event({"event": "progress", "stage": stage, "path": path, "done": done})
+
+                by_size: Dict[int, List[str]] = {}
+                for path, entry in entries.items():
+                    by_size.setdefault(entry[0], []).append(path)
+                candidates = [p for group in by_size.values() if len(group) > 1 for p in group]
+                run_stage(
+                    "sample",
+                    [p for p in candidates if entries[p][2] is None],
+                    2,
+                    lambda p: _sample_digest(p, entries[p][0]),
+                )
+
+                by_sample: Dict[Tuple[int, str], List[str]] = {}
+                for path in candidates:
+                    entry = entries.get(path)
+                    if entry is not None:
+                        by_sample.setdefault((entry[0], entry[2]), []).append(path)
+                collisions = [p for group in by_sample.values() if len(group) > 1 for p in group]
+                for path in collisions:
+                    if entries[path][0] <= 2 * DIGEST_SAMPLE_SIZE:
+                        entries[path][3] = entries[path][2]
+                run_stage("full", [p for p in collisions if entries[p][3] is None], 3, _full_digest)
+
+            by_digest: Dict[str, List[str]] = {}
+            for path in collisions:
+                entry = entries.get(path)
+                if entry is not None:
+                    by_digest.setdefault(entry[3], []).append(path)
+
+            groups = []
+            for digest, group in by_digest.items():
+                if len(group) < 2:
+                    continue
+                size = entries[group[0]][0]
+                groups.append({
+                    "digest": digest,
+                    "size": size,
+                    "wasted_bytes": size * (len(group) - 1),
+                    "files": [{"path": p, "content_ids": content_ids[p]} for p in sorted(group)],
+                })
+            groups.sort(key=lambda g: -g["wasted_bytes"])
+
+            cache.replace_all([(path, *entry) for path, entry in entries.items()])
+            print(f"✓ Found {len(groups)} groups of identical files ({hashed_bytes} bytes hashed)", file=sys.stderr)
 
             return {
                 "success": True,
-                "playlist_id": str(playlist.ID),
-                "playlist_name": playlist.Name,
-                "message": f"Smart playlist '{name}' created successfully"
+                "groups": groups,
+                "group_count": len(groups),
+                "duplicate_file_count": sum(len(g["files"]) - 1 for g in groups),
+                "wasted_bytes": sum(g["wasted_bytes"] for g in groups),
+                "file_count": len(paths),
+                "missing_count": len(missing),
+                "hashed_bytes": hashed_bytes,
+                "errors": errors,
             }
-
         except Exception as e:
             import traceback
             traceback.print_exc(file=sys.stderr)
-            return {
-                "success": False,
-                "error": f"Failed to create smart playlist: {str(e)}"
-            }
+            return {"success": False, "error": f"Failed to find duplicate files: {str(e)}"}
+        finally:
+            if cache:
+                cache.close()
 
-    def get_anlz_data(self, track_path: str, db_path: Optional[str] = None) -> Dict[str, Any]:
-        """Get waveform preview and cues from Rekordbox ANLZ analysis for a track."""
+    def scan_missing(self, db_path: Optional[str] = None, max_workers: Optional[int] = None,
+                     stream: bool = False) -> Dict[str, Any]:
+        """Find tracks whose FolderPath no longer exists, grouped by parent folder.
+
+        Each parent directory is listed once (concurrently, in a thread pool) instead
+        of statting every file; listings are cached per directory mtime, so re-runs
+        cost one stat per directory. With ``stream`` a ``progress`` event is emitted
+        per scanned directory.
+        """
+        cache = None
         try:
             if not self.db:
                 result = self.open_database(db_path)
                 if not result["success"]:
                     return result
 
-            normalized = str(track_path).replace("\\", "/")
-            for prefix in ("file://localhost", "file://"):
-                if normalized.lower().startswith(prefix.lower()):
-                    normalized = normalized[len(prefix):].lstrip("/")
-                    break
-            normalized = normalized.strip()
-
-            content = self.db.get_content(FolderPath=normalized).one_or_none()
-            if not content:
-                for c in self.db.get_content():
-                    if not c.FolderPath:
-                        continue
-                    p = str(c.FolderPath).replace("\\", "/")
-                    if p.lower() == normalized.lower():
-                        content = c
-                        break
-            if not content:
-                return {"success": True, "waveform": None, "cues": [], "duration_ms": None}
+            cache = DirectoryListingCache(self._cache_dir())
+            cached_mtimes = cache.mtimes()
 
-            duration_ms = None
-            if content.Length is not None:
-                duration_ms = int(content.Length * 1000)
+            by_dir: Dict[str, List[Tuple[str, str, str]]] = {}
+            track_count = 0
+            for cid, folder_path, title in self.db.query(
+                DjmdContent.ID, DjmdContent.FolderPath, DjmdContent.Title
+            ):
+                if not folder_path:
+                    continue
+                track_count += 1
+                directory = os.path.dirname(folder_path)
+                by_dir.setdefault(directory, []).append((str(cid), folder_path, title or ""))
 
-            waveform = None
-            cues: List[Dict[str, Any]] = []
-
-            try:
-                anlz_files = self.db.read_anlz_files(content)
-            except Exception as e:
-                return {
-                    "success": True,
-                    "waveform": None,
-                    "cues": [],
-                    "duration_ms": duration_ms,
-                    "error": str(e),
+            folders = []
+            fresh: List[Tuple[str, int, List[str]]] = []
+            missing_count = 0
+            done = 0
+            workers = max_workers or 16
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(_list_directory, d, cached_mtimes.get(d)): d for d in by_dir
                 }
+                for future in as_completed(futures):
+                    directory = futures[future]
+                    listing = future.result()
+                    tracks = by_dir[directory]
+                    if listing is None:
+                        missing = tracks
+                    else:
+                        mtime_ns, names = listing
+                        if names is None:
+                            names = cache.names(directory)
+                        else:
+                            fresh.append((directory, mtime_ns, names))
+                        present = {_name_key(n) for n in names}
+                        missing = [
+                            t for t in tracks if _name_key(os.path.basename(t[1])) not in present
+                        ]
+                    done += 1
+                    if missing:
+                        missing_count += len(missing)
+                        folders.append({
+                            "folder": directory,
+                            "folder_exists": listing is not None,
+                            "tracks": [
+                                {"id": cid, "path": path, "title": title} for cid, path, title in missing
+                            ],
+                        })
+                    if stream:
+                        _emit_event({
+                            "event": "progress", "folder": directory, "done": done,
+                            "total": len(by_dir), "missing": len(missing),
+                        })
 
-            for fpath, anlz_file in anlz_files.items():
-                try:
-                    if "PWAV" in anlz_file and waveform is None:
-                        tag = anlz_file.get_tag("PWAV")
-                        h, _ = tag.get()
-                        waveform = {"preview": [int(x) for x in h.tolist()]}
-                    if "PWV4" in anlz_file and waveform is None:
-                        tag = anlz_file.get_tag("PWV4")
-                        heights, _, _ = tag.get()
-                        n = int(heights.shape[0])
-                        wf = [int(heights[i, 0]) for i in range(n)]
-                        waveform = {"preview": wf}
-
-                    for tag in anlz_file.getall_tags("PCOB"):
-                        for ent in tag.struct.entries:
-                            cues.append({
-                                "time_ms": int(ent.time),
-                                "loop_end_ms": int(ent.loop_time) if getattr(ent, "loop_time", None) is not None and int(ent.loop_time) >= 0 else None,
-                                "hot_cue": int(ent.hot_cue),
-                                "type": "loop" if "loop" in str(getattr(ent, "type", "")).lower() else "cue",
-                            })
-                except Exception as e:
-                    pass
+            cache.put_many(fresh)
+            folders.sort(key=lambda f: (-len(f["tracks"]), f["folder"]))
+            print(f"✓ Scanned {len(by_dir)} folders: {missing_count} missing tracks", file=sys.stderr)
 
             return {
                 "success": True,
-                "waveform": waveform,
-                "cues": cues,
-                "duration_ms": duration_ms,
+                "track_count": track_count,
+                "folder_count": len(by_dir),
+                "missing_count": missing_count,
+                "folders": folders,
             }
         except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to scan for missing files: {str(e)}"}
+        finally:
+            if cache:
+                cache.close()
+
+    def preview_smart_playlist(self, conditions: List[Dict], logical_operator: int = 1,
+                               db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Evaluate smart playlist conditions in memory without writing a playlist.
+
+        The conditions are compiled to a NumPy predicate and applied to a columnar
+        snapshot of ``DjmdContent``, so previews don't round-trip through SQL.
+        """
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            smart, error = self._build_smart_list(conditions, logical_operator)
+            if error:
+                return {"success": False, "error": error}
+
+            t0 = time.perf_counter()
+            predicate = smart.compile()
+            usn = self.db.get_local_usn()
+            library = self._library_index()
+            signature = self._db_signature()
+            snapshot = library.get_snapshot(usn, signature) if library is not None else None
+            if snapshot is None:
+                snapshot = self.db.get_content_snapshot()
+                if library is not None:
+                    library.put_snapshot(usn, snapshot, signature)
+            ids = snapshot["ID"][predicate(snapshot)]
             return {
-                "success": False,
-                "error": str(e),
-                "waveform": None,
-                "cues": [],
-                "duration_ms": None,
+                "success": True,
+                "ids": [str(i) for i in ids],
+                "count": int(len(ids)),
+                "total": int(len(snapshot["ID"])),
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
             }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to preview smart playlist: {str(e)}"}
 
     def get_smart_playlist_contents(self, playlist_id: str) -> Dict[str, Any]:
         """Get the contents of a smart playlist"""
@@ -2217,7 +6076,7 @@ class RekordboxBridge:
 
             # Get the playlist
             try:
-                playlist = self.db.get_playlist(ID=int(playlist_id)).one_or_none()
+                playlist = self.db.get_playlist(ID=playlist_id)
             except:
                 return {
                     "success": False,
@@ -2230,6 +6089,19 @@ class RekordboxBridge:
                     "error": f"Playlist not found: {playlist_id}"
                 }
 
+            cache = self._smart_playlist_cache() if playlist.SmartList else None
+            if cache is not None:
+                xml_hash = cache.key_for(playlist.SmartList)
+                usn = self.db.get_local_usn()
+                tracks = cache.get_tracks(xml_hash, usn)
+                if tracks is not None:
+                    return {
+                        "success": True,
+                        "tracks": tracks,
+                        "track_count": len(tracks),
+                        "playlist_name": playlist.Name
+                    }
+
             # Get playlist contents
             contents = list(self.db.get_playlist_contents(playlist))
 
@@ -2279,6 +6151,12 @@ class RekordboxBridge:
                 }
                 tracks.append(track)
 
+            if cache is not None:
+                cache.put(
+                    xml_hash, usn, cache.date_bucket(playlist.SmartList),
+                    [track["TrackID"] for track in tracks], tracks,
+                )
+
             return {
                 "success": True,
                 "tracks": tracks,
@@ -2294,6 +6172,88 @@ class RekordboxBridge:
                 "error": f"Failed to get smart playlist contents: {str(e)}"
             }
 
+    def _linked_names(self) -> Dict[str, Dict[Any, str]]:
+        """Map ID -> Name for the artist, album, genre and label tables."""
+        tables = {'Artist': DjmdArtist, 'Album': DjmdAlbum, 'Genre': DjmdGenre, 'Label': DjmdLabel}
+        return {field: dict(self.db.query(table.ID, table.Name)) for field, table in tables.items()}
+
+    def _smart_fix_rows(self, track_ids: List[str]) -> List[Dict[str, str]]:
+        """Read the fields smart fixes operate on, as plain dicts in request order."""
+        names_by_id = self._linked_names()
+        wanted = list(dict.fromkeys(str(track_id) for track_id in track_ids))
+        found = {}
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            query = self.db.query(
+                DjmdContent.ID, DjmdContent.Title, DjmdContent.Commnt, DjmdContent.ArtistID,
+                DjmdContent.AlbumID, DjmdContent.GenreID, DjmdContent.LabelID,
+            ).filter(DjmdContent.ID.in_(chunk))
+            for cid, title, comment, artist_id, album_id, genre_id, label_id in query:
+                found[str(cid)] = {
+                    'TrackID': str(cid),
+                    'Name': title or '',
+                    'Artist': names_by_id['Artist'].get(artist_id) or '',
+                    'Album': names_by_id['Album'].get(album_id) or '',
+                    'Genre': names_by_id['Genre'].get(genre_id) or '',
+                    'Comments': comment or '',
+                    'Label': names_by_id['Label'].get(label_id) or '',
+                    'Remixer': '',
+                }
+        return [found[track_id] for track_id in wanted if track_id in found]
+
+    def preview_smart_fixes(self, track_ids: List[str], fixes: Dict[str, Any],
+                            max_workers: Optional[int] = None, stream: bool = False,
+                            db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Show what ``apply_smart_fixes`` would change without writing anything.
+
+        The selected tracks are read once into plain dicts and the compiled fixes
+        run over chunks of them in a process pool. With ``stream`` a ``diffs``
+        event is emitted as each chunk finishes.
+        """
+        try:
+            if not self.db:
+                result = self.open_database(db_path)
+                if not result["success"]:
+                    return result
+
+            rows = self._smart_fix_rows(track_ids)
+            if not rows:
+                return {"success": False, "error": "No tracks found to process"}
+
+            size = SMART_FIX_PREVIEW_CHUNK
+            chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+            diffs: List[Dict[str, Any]] = []
+            done = 0
+
+            def finish(chunk_diffs: List[Dict[str, Any]], count: int) -> None:
+                nonlocal done
+                done += count
+                diffs.extend(chunk_diffs)
+                if stream:
+                    _emit_event({"event": "diffs", "diffs": chunk_diffs, "done": done, "total": len(rows)})
+
+            if len(chunks) <= 2:
+                for chunk in chunks:
+                    finish(_preview_smart_fixes(fixes, chunk), len(chunk))
+            else:
+                workers = max_workers or min(len(chunks), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(_preview_smart_fixes, fixes, c): len(c) for c in chunks}
+                    for future in as_completed(futures):
+                        finish(future.result(), futures[future])
+
+            print(f"✓ Previewed smart fixes: {len(diffs)} of {len(rows)} tracks would change", file=sys.stderr)
+            return {
+                "success": True,
+                "track_count": len(rows),
+                "changed_count": len(diffs),
+                "diffs": diffs,
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            return {"success": False, "error": f"Failed to preview smart fixes: {str(e)}"}
+
     def apply_smart_fixes(self, track_ids: List[str], fixes: Dict[str, Any]) -> Dict[str, Any]:
         """Apply smart fixes to tracks"""
         try:
@@ -2303,13 +6263,14 @@ class RekordboxBridge:
                 if not result["success"]:
                     return result
 
-            # Get tracks to process
-            tracks_to_update = []
-            track_id_set = set(track_ids)
-
-            for content in self.db.get_content():
-                if str(content.ID) in track_id_set:
-                    tracks_to_update.append(content)
+            # Fetch only the requested tracks, in request order
+            wanted = list(dict.fromkeys(str(track_id) for track_id in track_ids))
+            found = {}
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start:start + 500]
+                for content in self.db.query(DjmdContent).filter(DjmdContent.ID.in_(chunk)):
+                    found[str(content.ID)] = content
+            tracks_to_update = [found[track_id] for track_id in wanted if track_id in found]
 
             if not tracks_to_update:
                 return {
@@ -2317,6 +6278,29 @@ class RekordboxBridge:
                     "error": "No tracks found to process"
                 }
 
+            apply_fixes = _compile_smart_fixes(fixes)
+
+            # Resolve linked names from in-memory maps instead of per-track lookups
+            linked = {
+                'Artist': ('ArtistID', lambda name: self.db.add_artist(name=name, search_str=name.upper())),
+                'Album': ('AlbumID', lambda name: self.db.add_album(name=name)),
+                'Genre': ('GenreID', lambda name: self.db.add_genre(name=name)),
+                'Label': ('LabelID', lambda name: self.db.add_label(name=name)),
+            }
+            names_by_id = self._linked_names()
+            ids_by_name = {}
+            for field, names in names_by_id.items():
+                ids_by_name[field] = {}
+                for entity_id, name in names.items():
+                    ids_by_name[field].setdefault(name, entity_id)
+
+            def find_or_create(field: str, name: str) -> Any:
+                entity_id = ids_by_name[field].get(name)
+                if entity_id is None:
+                    entity_id = linked[field][1](name).ID
+                    ids_by_name[field][name] = entity_id
+                return entity_id
+
             updated_count = 0
             updates = []
 
@@ -2324,222 +6308,41 @@ class RekordboxBridge:
                 original_data = {
                     'TrackID': str(content.ID),
                     'Name': content.Title or '',
-                    'Artist': content.ArtistName or '',
-                    'Album': content.AlbumName or '',
-                    'Genre': content.GenreName or '',
+                    'Artist': names_by_id['Artist'].get(content.ArtistID) or '',
+                    'Album': names_by_id['Album'].get(content.AlbumID) or '',
+                    'Genre': names_by_id['Genre'].get(content.GenreID) or '',
                     'Comments': content.Commnt or '',
-                    'Label': content.LabelName or '',
+                    'Label': names_by_id['Label'].get(content.LabelID) or '',
                     'Remixer': ''  # Will be populated if we extract it
                 }
 
                 updated_data = original_data.copy()
-                track_changed = False
-
-                # Extract Artist From Title
-                if fixes.get('extractArtistEnabled'):
-                    separator = fixes.get('extractArtistSeparator', ' - ')
-                    result_number = fixes.get('extractArtistResultNumber', 1) - 1  # Convert to 0-based
-
-                    if updated_data['Name'] and separator in updated_data['Name']:
-                        parts = updated_data['Name'].split(separator)
-                        if 0 <= result_number < len(parts):
-                            extracted_artist = parts[result_number].strip()
-                            if extracted_artist and not updated_data['Artist']:
-                                updated_data['Artist'] = extracted_artist
-                                # Remove the extracted part from title
-                                parts.pop(result_number)
-                                updated_data['Name'] = separator.join(parts).strip()
-                                track_changed = True
-
-                # Replace Characters With Space
-                if fixes.get('replaceCharsEnabled'):
-                    chars_to_replace = fixes.get('replaceCharsList', '_')
-                    for char in chars_to_replace:
-                        for field in ['Name', 'Artist', 'Album', 'Genre', 'Comments', 'Label']:
-                            if updated_data[field]:
-                                updated_data[field] = updated_data[field].replace(char, ' ')
-                                track_changed = True
-
-                # Remove Garbage Characters
-                if fixes.get('removeGarbageEnabled'):
-                    fields_to_clean = fixes.get('removeGarbageFields', [])
-                    garbage_chars = r'^[\s\[\]\|\-]+|[\s\[\]\|\-]+$'
-
-                    for field in fields_to_clean:
-                        if field in updated_data and updated_data[field]:
-                            # Remove multiple spaces
-                            updated_data[field] = re.sub(r'\s+', ' ', updated_data[field])
-                            # Remove leading/trailing special chars
-                            updated_data[field] = re.sub(garbage_chars, '', updated_data[field])
-                            track_changed = True
-
-                # Add (Re)mix Parenthesis
-                if fixes.get('addRemixParenthesisEnabled'):
-                    fields_to_process = fixes.get('addRemixParenthesisFields', [])
-                    remix_pattern = r'\s*-\s*(.*?)(?:mix|remix|version|edit)$'
-
-                    for field in fields_to_process:
-                        if field in updated_data and updated_data[field]:
-                            match = re.search(remix_pattern, updated_data[field], re.IGNORECASE)
-                            if match and '(' not in updated_data[field]:
-                                remix_text = match.group(1).strip()
-                                # Remove the remix part from the field
-                                updated_data[field] = re.sub(remix_pattern, '', updated_data[field], flags=re.IGNORECASE).strip()
-                                # Add it in parentheses
-                                updated_data[field] += f' ({remix_text})'
-                                track_changed = True
-
-                # Extract Remixer
-                if fixes.get('extractRemixerEnabled'):
-                    if updated_data['Name']:
-                        # Look for patterns like (Artist Remix) or (Artist Extended Remix)
-                        remix_patterns = [
-                            r'\(([^)]+?)(?:extended|club|dance|radio)?\s*(?:remix|mix|version|edit)\)',
-                            r'\(([^)]+?)\s+(?:extended|club|dance|radio)?\s*(?:remix|mix|version|edit)\)'
-                        ]
-
-                        for pattern in remix_patterns:
-                            match = re.search(pattern, updated_data['Name'], re.IGNORECASE)
-                            if match:
-                                remixer = match.group(1).strip()
-                                # Filter out generic terms
-                                filter_words = ['original', 'radio', 'club', 'dance', 'extended']
-                                if not any(word in remixer.lower() for word in filter_words):
-                                    updated_data['Remixer'] = remixer
-                                    # Remove the remix info from title
-                                    updated_data['Name'] = re.sub(pattern, '', updated_data['Name'], flags=re.IGNORECASE).strip()
-                                    # Clean up extra parentheses
-                                    updated_data['Name'] = re.sub(r'\(\s*\)', '', updated_data['Name'])
-                                    updated_data['Name'] = re.sub(r'\s+', ' ', updated_data['Name']).strip()
-                                    track_changed = True
-                                    break
-
-                # Remove URLs
-                if fixes.get('removeUrlsEnabled'):
-                    fields_to_process = fixes.get('removeUrlsFields', [])
-                    url_pattern = r'https?://[^\s]+'
-
-                    for field in fields_to_process:
-                        if field in updated_data and updated_data[field]:
-                            if fixes.get('removeUrlsDeleteAll'):
-                                # Delete entire field if it contains a URL
-                                if re.search(url_pattern, updated_data[field]):
-                                    updated_data[field] = ''
-                                    track_changed = True
-                            else:
-                                # Just remove URLs
-                                original = updated_data[field]
-                                updated_data[field] = re.sub(url_pattern, '', updated_data[field]).strip()
-                                if original != updated_data[field]:
-                                    track_changed = True
-
-                # Fix Casing
-                if fixes.get('fixCasingEnabled'):
-                    fields_to_process = fixes.get('fixCasingFields', [])
-
-                    for field in fields_to_process:
-                        if field in updated_data and updated_data[field]:
-                            text = updated_data[field]
-                            # Check if it's ALL UPPERCASE or all lowercase
-                            if text.isupper() or text.islower():
-                                # Convert to title case
-                                updated_data[field] = text.title()
-                                track_changed = True
-
-                # Remove Number Prefix
-                if fixes.get('removeNumberPrefixEnabled'):
-                    fields_to_process = fixes.get('removeNumberPrefixFields', [])
-                    prefix_patterns = [
-                        r'^\d+\.\s*',  # 01.
-                        r'^\(\d+\)\s*',  # (01)
-                        r'^\d+\s*-\s*',  # 01 -
-                        r'^\[\d+\]\s*'   # [01]
-                    ]
-
-                    for field in fields_to_process:
-                        if field in updated_data and updated_data[field]:
-                            for pattern in prefix_patterns:
-                                updated_data[field] = re.sub(pattern, '', updated_data[field])
-                                track_changed = True
 
                 # Apply changes to the database
-                if track_changed:
+                if apply_fixes(updated_data):
                     try:
                         # Ensure data is clean before updating
-                        if updated_data['Name']:
-                            updated_data['Name'] = updated_data['Name'].strip()
-                        if updated_data['Artist']:
-                            updated_data['Artist'] = updated_data['Artist'].strip()
-                        if updated_data['Album']:
-                            updated_data['Album'] = updated_data['Album'].strip()
-                        if updated_data['Genre']:
-                            updated_data['Genre'] = updated_data['Genre'].strip()
-                        if updated_data['Comments']:
-                            updated_data['Comments'] = updated_data['Comments'].strip()
-                        if updated_data['Label']:
-                            updated_data['Label'] = updated_data['Label'].strip()
+                        _strip_smart_fix_fields(updated_data)
 
                         # Update the database content
                         if updated_data['Name'] != original_data['Name']:
                             content.Title = updated_data['Name'] or None
 
-                        if updated_data['Artist'] != original_data['Artist']:
-                            # Find or create artist
-                            if updated_data['Artist'] and updated_data['Artist'].strip():
-                                try:
-                                    artist = self.db.get_artist(Name=updated_data['Artist']).one_or_none()
-                                    if not artist:
-                                        artist = self.db.add_artist(name=updated_data['Artist'], search_str=updated_data['Artist'].upper())
-                                    if artist and artist.ID:
-                                        content.ArtistID = artist.ID
-                                except Exception as e:
-                                    print(f"Error updating artist for track {content.ID}: {e}", file=sys.stderr)
-
-                        if updated_data['Album'] != original_data['Album']:
-                            # Find or create album
-                            if updated_data['Album'] and updated_data['Album'].strip():
-                                try:
-                                    album = self.db.get_album(Name=updated_data['Album']).one_or_none()
-                                    if not album:
-                                        album = self.db.add_album(name=updated_data['Album'])
-                                    if album and album.ID:
-                                        content.AlbumID = album.ID
-                                except Exception as e:
-                                    print(f"Error updating album for track {content.ID}: {e}", file=sys.stderr)
-
-                        if updated_data['Genre'] != original_data['Genre']:
-                            # Find or create genre
-                            if updated_data['Genre'] and updated_data['Genre'].strip():
-                                try:
-                                    genre = self.db.get_genre(Name=updated_data['Genre']).one_or_none()
-                                    if not genre:
-                                        genre = self.db.add_genre(name=updated_data['Genre'])
-                                    if genre and genre.ID:
-                                        content.GenreID = genre.ID
-                                except Exception as e:
-                                    print(f"Error updating genre for track {content.ID}: {e}", file=sys.stderr)
-
                         if updated_data['Comments'] != original_data['Comments']:
                             content.Commnt = updated_data['Comments'] or None
 
-                        if updated_data['Label'] != original_data['Label']:
-                            # Update Label - use LabelID, not LabelName (which is an association_proxy)
-                            if updated_data['Label'] and updated_data['Label'].strip():
+                        for field, (id_column, _) in linked.items():
+                            if updated_data[field] == original_data[field]:
+                                continue
+                            if updated_data[field]:
+                                # Find or create the entity and link it by ID
                                 try:
-                                    label = self.db.get_label(Name=updated_data['Label']).one_or_none()
-                                    if not label:
-                                        label = self.db.add_label(name=updated_data['Label'])
-                                    if label and label.ID:
-                                        content.LabelID = label.ID
-                                except ValueError:
-                                    # Label already exists, get it
-                                    label = self.db.get_label(Name=updated_data['Label']).one()
-                                    if label and label.ID:
-                                        content.LabelID = label.ID
+                                    setattr(content, id_column, find_or_create(field, updated_data[field]))
                                 except Exception as e:
-                                    print(f"Error updating label for track {content.ID}: {e}", file=sys.stderr)
+                                    print(f"Error updating {field.lower()} for track {content.ID}: {e}", file=sys.stderr)
                             else:
-                                content.LabelID = None
+                                # An emptied field unlinks the entity, as the preview shows
+                                setattr(content, id_column, None)
 
                         updated_count += 1
                         updates.append(updated_data)
@@ -2689,8 +6492,47 @@ def main():
             result = bridge.import_from_database(db_path)
         
         elif command == "backup-database":
+            # backup-database [db_path] [--online] [--keep-last N] [--keep-hourly N] [--keep-daily N] [--keep-weekly N]
+            args = sys.argv[2:]
+            retention = {}
+            for period in ("last", "hourly", "daily", "weekly"):
+                flag = f"--keep-{period}"
+                if flag in args:
+                    i = args.index(flag)
+                    retention[period] = int(args[i + 1])
+                    del args[i:i + 2]
+            online = "--online" in args
+            if online:
+                args.remove("--online")
+            db_path = args[0] if args else None
+            result = bridge.backup_database(db_path, retention, online=online)
+
+        elif command == "backup-online":
+            # @file with output_path, optional key ("" = unencrypted), db_path, stream
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing file argument"}
+            else:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+                result = bridge.backup_online(
+                    data["output_path"],
+                    key=data.get("key"),
+                    db_path=data.get("db_path"),
+                    stream=bool(data.get("stream", False)),
+                )
+
+        elif command == "list-backups":
             db_path = sys.argv[2] if len(sys.argv) > 2 else None
-            result = bridge.backup_database(db_path)
+            result = bridge.list_backups(db_path)
+
+        elif command == "restore-backup":
+            # restore-backup NAME TARGET_PATH [db_path]
+            if len(sys.argv) < 4:
+                result = {"success": False, "error": "Usage: restore-backup NAME TARGET_PATH [db_path]"}
+            else:
+                db_path = sys.argv[4] if len(sys.argv) > 4 else None
+                result = bridge.restore_backup(sys.argv[2], sys.argv[3], db_path)
         
         elif command == "export-database":
             if len(sys.argv) < 3:
@@ -2809,21 +6651,53 @@ def main():
                     result = {"success": False, "error": f"Failed to read file or apply fixes: {str(e)}"}
 
         elif command == "check-integrity":
-            db_path = sys.argv[2] if len(sys.argv) > 2 else None
-            # Open database if path provided
-            if db_path:
-                open_result = bridge.open_database(db_path)
-                if not open_result.get("success"):
-                    result = open_result
-                else:
-                    result = bridge.check_database_integrity()
+            # check-integrity [db_path] [--mode quick|full|tables] [--budget SECONDS] [--restart] [--stream]
+            args = sys.argv[2:]
+            options = {}
+            for flag in ("--mode", "--budget"):
+                if flag in args:
+                    i = args.index(flag)
+                    options[flag] = args[i + 1]
+                    del args[i:i + 2]
+            switches = {flag: flag in args for flag in ("--restart", "--stream")}
+            args = [a for a in args if a not in switches]
+            db_path = args[0] if args else None
+            # Open database if path provided, otherwise try auto-detection
+            open_result = bridge.open_database(db_path)
+            if not open_result.get("success"):
+                result = open_result
             else:
-                # Try auto-detection
-                open_result = bridge.open_database()
-                if not open_result.get("success"):
-                    result = open_result
-                else:
-                    result = bridge.check_database_integrity()
+                result = bridge.check_database_integrity(
+                    mode=options.get("--mode", "quick"),
+                    restart=switches["--restart"],
+                    time_budget=float(options["--budget"]) if "--budget" in options else None,
+                    stream=switches["--stream"],
+                )
+
+        elif command == "scan-corruption":
+            # scan-corruption [db_path] [--table NAME ...] [--stream]
+            args = sys.argv[2:]
+            tables = []
+            while "--table" in args:
+                i = args.index("--table")
+                tables.append(args[i + 1])
+                del args[i:i + 2]
+            stream = "--stream" in args
+            args = [a for a in args if a != "--stream"]
+            result = bridge.scan_corruption(tables or None, args[0] if args else None, stream=stream)
+
+        elif command == "rebuild-table":
+            # rebuild-table TABLE [db_path] [--dry-run] [--stream]
+            args = sys.argv[2:]
+            flags = {flag: flag in args for flag in ("--dry-run", "--stream")}
+            args = [a for a in args if a not in flags]
+            if not args:
+                result = {"success": False, "error": "Usage: rebuild-table TABLE [db_path] [--dry-run]"}
+            else:
+                result = bridge.rebuild_table(
+                    args[0], args[1] if len(args) > 1 else None,
+                    dry_run=flags["--dry-run"], stream=flags["--stream"],
+                )
 
         elif command == "repair-database":
             db_path = sys.argv[2] if len(sys.argv) > 2 else None
@@ -2852,10 +6726,186 @@ def main():
                         data = json.load(f)
                     track_path = data.get("track_path", "")
                     db_path = data.get("db_path")
+                    encoding = data.get("encoding", "json")
                 else:
                     track_path = arg
                     db_path = sys.argv[3] if len(sys.argv) > 3 else None
-                result = bridge.get_anlz_data(track_path, db_path)
+                    encoding = sys.argv[4] if len(sys.argv) > 4 else "json"
+                result = bridge.get_anlz_data(track_path, db_path, encoding)
+
+        elif command == "get-anlz-data-batch":
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing file argument"}
+            else:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+                result = bridge.get_anlz_data_batch(
+                    data.get("track_paths", []),
+                    data.get("db_path"),
+                    stream=bool(data.get("stream", False)),
+                    max_workers=data.get("workers"),
+                    encoding=data.get("encoding", "json"),
+                )
+
+        elif command == "index-anlz":
+            db_path = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] else None
+            workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+            result = bridge.index_anlz(db_path, workers)
+
+        elif command == "analyze-beatgrids":
+            data = {}
+            if len(sys.argv) > 2:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+            result = bridge.analyze_beatgrids(
+                data.get("db_path"),
+                stream=bool(data.get("stream", False)),
+                max_workers=data.get("workers"),
+            )
+
+        elif command == "query-beatgrids":
+            data = {}
+            if len(sys.argv) > 2:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+            result = bridge.query_beatgrids(
+                min_bpm_mismatch=data.get("min_bpm_mismatch"),
+                min_drift_ms=data.get("min_drift_ms"),
+                variable_bpm=data.get("variable_bpm"),
+                order_by=data.get("order_by", "bpm_mismatch"),
+                limit=data.get("limit"),
+                db_path=data.get("db_path"),
+            )
+
+        elif command == "get-waveform-slice":
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing file argument"}
+            else:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+                result = bridge.get_waveform_slice(
+                    data.get("track_path", ""),
+                    px_per_sec=data.get("px_per_sec"),
+                    start_ms=data.get("start_ms"),
+                    end_ms=data.get("end_ms"),
+                    db_path=data.get("db_path"),
+                    encoding=data.get("encoding", "json"),
+                )
+
+        elif command == "shift-cues":
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing file argument"}
+            else:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+                result = bridge.shift_cues(
+                    data.get("edits", []),
+                    dry_run=bool(data.get("dry_run", False)),
+                    max_workers=data.get("workers"),
+                    db_path=data.get("db_path"),
+                )
+
+        elif command == "sync-index":
+            db_path = sys.argv[2] if len(sys.argv) > 2 else None
+            result = bridge.sync_library_index(db_path)
+
+        elif command == "search-content":
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing argument: query required"}
+            else:
+                limit = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+                db_path = sys.argv[4] if len(sys.argv) > 4 else None
+                result = bridge.search_content(sys.argv[2], limit=limit, db_path=db_path)
+
+        elif command == "find-duplicates":
+            db_path = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] else None
+            threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.85
+            result = bridge.find_duplicates(db_path, threshold=threshold)
+
+        elif command == "find-duplicate-files":
+            data = {}
+            if len(sys.argv) > 2:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+            result = bridge.find_duplicate_files(
+                data.get("db_path"),
+                max_workers=data.get("workers"),
+                stream=bool(data.get("stream", False)),
+            )
+
+        elif command == "scan-missing":
+            data = {}
+            if len(sys.argv) > 2:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+            result = bridge.scan_missing(
+                data.get("db_path"),
+                max_workers=data.get("workers"),
+                stream=bool(data.get("stream", False)),
+            )
+
+        elif command == "relocate-prefix":
+            if len(sys.argv) < 4:
+                result = {"success": False, "error": "Missing arguments: old and new prefix required"}
+            else:
+                flags = sys.argv[4:]
+                result = bridge.relocate_prefix(
+                    sys.argv[2],
+                    sys.argv[3],
+                    dry_run="--dry-run" in flags,
+                    verify="--no-verify" not in flags,
+                    db_path=next((f for f in flags if not f.startswith("--")), None),
+                )
+
+        elif command == "relocate-auto":
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing file argument"}
+            else:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+                result = bridge.relocate_auto(
+                    data.get("roots", []),
+                    dry_run=bool(data.get("dry_run", False)),
+                    check_duration=bool(data.get("check_duration", False)),
+                    max_workers=data.get("workers"),
+                    db_path=data.get("db_path"),
+                )
+
+        elif command == "preview-smart-fixes":
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing file argument"}
+            else:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+                result = bridge.preview_smart_fixes(
+                    data.get("trackIds", []),
+                    data.get("fixes", {}),
+                    max_workers=data.get("workers"),
+                    stream=bool(data.get("stream", False)),
+                    db_path=data.get("db_path"),
+                )
+
+        elif command == "preview-smart-playlist":
+            if len(sys.argv) < 3:
+                result = {"success": False, "error": "Missing file argument"}
+            else:
+                arg = sys.argv[2]
+                with open(arg[1:] if arg.startswith("@") else arg, "r") as f:
+                    data = json.load(f)
+                result = bridge.preview_smart_playlist(
+                    data.get("conditions", []),
+                    logical_operator=int(data.get("logical_operator", 1)),
+                    db_path=data.get("db_path"),
+                )
 
         else:
             result = {"success": False, "error": f"Unknown command: {command}"}
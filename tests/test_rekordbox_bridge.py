@@ -0,0 +1,1038 @@
+# -*- coding: utf-8 -*-
+"""Tests for the Electron bridge, run against a copy of the pyrekordbox test database."""
+
+import glob
+import os
+import shutil
+import sqlite3
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import rekordbox_bridge  # noqa: E402
+from rekordbox_bridge import RekordboxBridge, _read_rows_skipping  # noqa: E402
+from pyrekordbox import AnlzFile, Rekordbox6Database  # noqa: E402
+from pyrekordbox.anlz.file import splice_tags  # noqa: E402
+from pyrekordbox.db6.tables import DjmdCue  # noqa: E402
+
+TEST_ROOT = os.path.join(os.path.dirname(__file__), "..", "pyrekordbox-0.4.4", ".testdata", "rekordbox 6")
+UNLOCKED = os.path.join(TEST_ROOT, "master_unlocked.db")
+EXPORT_ANLZ = os.path.join(TEST_ROOT, "..", "export", "PIONEER", "USBANLZ")
+
+
+@pytest.fixture
+def bridge(tmp_path):
+    """Return a bridge on a private copy of the unlocked test database."""
+    db_path = tmp_path / "master.db"
+    shutil.copy(UNLOCKED, db_path)
+    bridge = RekordboxBridge()
+    bridge.db = Rekordbox6Database(db_path, unlock=False)
+    yield bridge
+    bridge.close_database()
+
+
+@pytest.fixture
+def anlz_library(bridge):
+    """Copy the exported test ANLZ files to the AnalysisDataPath of the matching track.
+
+    Returns a dict of content ID -> ANLZ directory.
+    """
+    exported = {}
+    for anlz_dir in glob.glob(os.path.join(EXPORT_ANLZ, "*", "*")):
+        ppth = AnlzFile.parse_file(os.path.join(anlz_dir, "ANLZ0000.DAT")).get_tag("PPTH").path
+        exported[ppth.rsplit("/", 1)[-1]] = anlz_dir
+    dirs = {}
+    for content in bridge.db.get_content():
+        target = bridge._anlz_dir_for(content.AnalysisDataPath)
+        shutil.copytree(exported[content.FolderPath.rsplit("/", 1)[-1]], target)
+        dirs[str(content.ID)] = target
+    return dirs
+
+
+def _ppth(anlz_dir, kind="DAT"):
+    return AnlzFile.parse_file(os.path.join(anlz_dir, f"ANLZ0000.{kind}")).get_tag("PPTH").path
+
+
+def test_preview_smart_playlist_in_last(bridge):
+    total = bridge.db.get_content().count()
+    conditions = [
+        {"property": "DATE_CREATED", "operator": "IN_LAST", "value_left": "100", "unit": "year"},
+    ]
+    result = bridge.preview_smart_playlist(conditions)
+    assert result["success"], result.get("error")
+    assert result["count"] == total
+
+    conditions[0]["operator"] = "NOT_IN_LAST"
+    result = bridge.preview_smart_playlist(conditions)
+    assert result["success"], result.get("error")
+    assert result["count"] == 0
+
+
+def test_build_smart_list_keeps_unit():
+    smart, error = RekordboxBridge._build_smart_list(
+        [{"property": "DATE_CREATED", "operator": "IN_LAST", "value_left": "2", "unit": "week"}]
+    )
+    assert error is None
+    assert smart.conditions[0].unit == "week"
+
+
+class _FlakyCursor:
+    """Cursor over rowids 1-10 that fails every read touching ``bad_rowid``."""
+
+    def __init__(self, error, bad_rowid=5):
+        self.error = error
+        self.bad_rowid = bad_rowid
+        self.rows = []
+
+    def execute(self, sql, params):
+        first, last = params
+        if first <= self.bad_rowid <= last:
+            raise self.error
+        self.rows = [(rowid, f"id{rowid}") for rowid in range(first, last + 1)]
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_read_rows_skipping_corrupt_row():
+    skipped = []
+    cursor = _FlakyCursor(sqlite3.DatabaseError("database disk image is malformed"))
+    rows = _read_rows_skipping(cursor, "djmdContent", 1, 10, skipped)
+    assert [row[0] for row in rows] == [1, 2, 3, 4, 6, 7, 8, 9, 10]
+    assert [rowid for rowid, _ in skipped] == [5]
+
+
+def test_read_rows_skipping_reraises_transient_errors():
+    skipped = []
+    cursor = _FlakyCursor(sqlite3.OperationalError("database is locked"))
+    with pytest.raises(sqlite3.OperationalError):
+        _read_rows_skipping(cursor, "djmdContent", 1, 10, skipped)
+    assert skipped == []
+
+
+def test_rebuild_table(bridge):
+    n_content = bridge.db.get_content().count()
+    result = bridge.rebuild_table("djmdContent")
+    assert result["success"], result.get("error")
+    assert result["rows_copied"] == n_content
+    assert result["rows_skipped"] == 0
+    assert bridge.db.get_content().count() == n_content
+
+
+def test_library_snapshot_roundtrip(bridge):
+    library = bridge._library_index()
+    snapshot = bridge.db.get_content_snapshot()
+    usn = bridge.db.get_local_usn()
+    library.put_snapshot(usn, snapshot, "sig")
+    assert library.get_snapshot(usn, "other") is None
+    cached = library.get_snapshot(usn, "sig")
+    assert set(cached) == set(snapshot)
+    for name, values in snapshot.items():
+        assert cached[name].dtype == values.dtype
+        if values.dtype.kind == "f":
+            np.testing.assert_array_equal(cached[name], values)
+        else:
+            assert cached[name].tolist() == values.tolist()
+
+
+def test_library_index_detects_replaced_database(bridge):
+    library = bridge._library_index()
+    library.sync(bridge.db, bridge._content_to_track, "sig", "file-a")
+    # Same USN and signature: nothing to do
+    stats = library.sync(bridge.db, bridge._content_to_track, "sig", "file-a")
+    assert stats["updated"] == 0
+    # Another file, even with the same or a higher USN, is indexed from scratch
+    stats = library.sync(bridge.db, bridge._content_to_track, "sig2", "file-b")
+    assert stats["full"]
+    assert len(library.tracks()) == bridge.db.get_content().count()
+
+
+def test_backup_online_unencrypted_source(bridge, tmp_path):
+    result = bridge.backup_online(str(tmp_path / "copy.db"))
+    assert result["success"], result.get("error")
+    assert result["encrypted"] is False
+
+
+def _add_cue(db, cue_id, content_id, msec, mpeg_frame=0, mpeg_abs=0):
+    db.session.add(DjmdCue(
+        ID=cue_id, ContentID=content_id, InMsec=msec, InFrame=int(msec * 0.15),
+        InMpegFrame=mpeg_frame, InMpegAbs=mpeg_abs, OutMsec=-1, OutFrame=0, OutMpegFrame=0,
+        OutMpegAbs=0, Kind=0, Color=-1, UUID=cue_id,
+    ))
+
+
+@pytest.fixture
+def cue_track(bridge, tmp_path, monkeypatch):
+    """A track with a cue at 0 ms and one at 2 s, and a fake ANLZ file per track."""
+    content = bridge.db.get_content().first()
+    cid = str(content.ID)
+    _add_cue(bridge.db, "9001", cid, 0)
+    _add_cue(bridge.db, "9002", cid, 2000, mpeg_frame=150, mpeg_abs=64000)
+    bridge.db.commit()
+
+    anlz_dir = tmp_path / "anlz"
+    anlz_dir.mkdir()
+    (anlz_dir / "ANLZ0000.DAT").write_bytes(b"original")
+
+    def fake_shift(anlz_dir, offset_ms, cues, dry_run):
+        path = os.path.join(anlz_dir, "ANLZ0000.DAT")
+        original = rekordbox_bridge._keep_anlz_original(path)
+        rekordbox_bridge.write_atomic(path, b"shifted")
+        return {"entry_count": 2, "clamped_count": 0, "file_count": 1, "originals": [(path, original)]}
+
+    monkeypatch.setattr(rekordbox_bridge, "_shift_anlz_cues", fake_shift)
+    monkeypatch.setattr(rekordbox_bridge, "get_rekordbox_pid", lambda: None)
+    monkeypatch.setattr(bridge, "_anlz_dir_for", lambda _: str(anlz_dir))
+    return cid, anlz_dir
+
+
+def test_shift_cues_recomputes_frames(bridge, cue_track):
+    cid, anlz_dir = cue_track
+    result = bridge.shift_cues([{"track_id": cid, "offset_ms": 1000}])
+    assert result["success"], result.get("error")
+    cue = bridge.db.query(DjmdCue).filter_by(ID="9001").one()
+    # The cue at 0 ms gets frames matching its new position, not 0
+    assert (cue.InMsec, cue.InFrame) == (1000, 150)
+    assert (cue.InMpegFrame, cue.InMpegAbs) == (75, 32000)
+    cue = bridge.db.query(DjmdCue).filter_by(ID="9002").one()
+    assert (cue.InMsec, cue.InFrame, cue.InMpegFrame) == (3000, 450, 225)
+    assert (anlz_dir / "ANLZ0000.DAT").read_bytes() == b"shifted"
+    assert os.listdir(anlz_dir) == ["ANLZ0000.DAT"]
+
+
+def test_shift_cues_reports_clamped_cues(bridge, cue_track):
+    cid, _ = cue_track
+    result = bridge.shift_cues([{"track_id": cid, "offset_ms": -1000}])
+    assert result["success"], result.get("error")
+    assert result["clamped"] == [{"id": cid, "anlz_entry_count": 0, "db_cue_count": 1}]
+    assert bridge.db.query(DjmdCue).filter_by(ID="9001").one().InMsec == 0
+    assert bridge.db.query(DjmdCue).filter_by(ID="9002").one().InMsec == 1000
+
+
+def test_kept_anlz_original_is_not_an_analysis_file(anlz_library):
+    anlz_dir = next(iter(anlz_library.values()))
+    dat = os.path.join(anlz_dir, "ANLZ0000.DAT")
+    original = rekordbox_bridge._keep_anlz_original(dat)
+    assert set(rekordbox_bridge.get_anlz_paths(anlz_dir)) == {"DAT", "EXT", "2EX"}
+    before = open(original, "rb").read()
+    rekordbox_bridge._rewrite_anlz_path(anlz_dir, "D:/Music/track.mp3")
+    assert open(original, "rb").read() == before
+
+
+def test_shift_cues_restores_anlz_on_failed_commit(bridge, cue_track, monkeypatch):
+    cid, anlz_dir = cue_track
+    monkeypatch.setattr(bridge, "_safe_commit", lambda: "disk I/O error")
+    result = bridge.shift_cues([{"track_id": cid, "offset_ms": 1000}])
+    assert not result["success"]
+    assert (anlz_dir / "ANLZ0000.DAT").read_bytes() == b"original"
+    assert os.listdir(anlz_dir) == ["ANLZ0000.DAT"]
+
+
+def test_smart_playlist_cache_keeps_tracks(tmp_path):
+    cache = rekordbox_bridge.SmartPlaylistCache(str(tmp_path))
+    tracks = [{"TrackID": "1"}, {"TrackID": "2"}]
+    cache.put("hash", 10, "", ["1", "2"], tracks)
+    # Parsing the playlist stores only the IDs again
+    cache.put("hash", 10, "", ["1", "2"])
+    assert cache.get_tracks("hash", 10) == tracks
+    # A new USN drops the old tracks
+    cache.put("hash", 11, "", ["1"])
+    assert cache.get_ids("hash", 11) == ["1"]
+    assert cache.get_tracks("hash", 11) is None
+    cache.close()
+
+
+def test_apply_smart_fixes_clears_emptied_links(bridge):
+    content = next(c for c in bridge.db.get_content() if c.ArtistID)
+    cid = str(content.ID)
+    artist = bridge.db.get_artist(ID=content.ArtistID)
+    artist.Name = "https://example.com"
+    bridge.db.commit()
+    fixes = {"removeUrlsEnabled": True, "removeUrlsDeleteAll": True, "removeUrlsFields": ["Artist"]}
+    preview = rekordbox_bridge._preview_smart_fixes(fixes, bridge._smart_fix_rows([cid]))
+    assert preview[0]["changes"]["Artist"]["after"] == ""
+    result = bridge.apply_smart_fixes([cid], fixes)
+    assert result["success"], result.get("error")
+    assert result["updates"][0]["Artist"] == ""
+    assert bridge.db.get_content(ID=cid).ArtistID is None
+
+
+def _dup_row(track_id, title, artist, date_added="", file_size=0, length=200):
+    return {
+        "id": track_id, "title": title, "artist": artist, "length": length,
+        "file_size": file_size, "bit_rate": 320, "rating": 0, "play_count": 0,
+        "date_added": date_added,
+    }
+
+
+def test_pick_keeper_prefers_dated_track():
+    tracks = [_dup_row("1", "Song", "A"), _dup_row("2", "Song", "A", "2020-01-01")]
+    assert rekordbox_bridge._pick_keeper(tracks)["id"] == "2"
+
+
+def test_duplicates_need_more_than_title():
+    rows = [_dup_row("1", "Intro", ""), _dup_row("2", "Intro", "Someone")]
+    assert rekordbox_bridge._find_duplicate_clusters(rows) == []
+    rows = [_dup_row("1", "Intro", "Someone"), _dup_row("2", "Intro", "Someone", length=201)]
+    assert len(rekordbox_bridge._find_duplicate_clusters(rows)) == 1
+
+
+def test_array_encoding_validated_up_front(bridge):
+    result = bridge.get_anlz_data_batch(["/missing.mp3"], encoding="xml")
+    assert not result["success"]
+    assert "Invalid encoding" in result["error"]
+
+
+def test_array_file_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(rekordbox_bridge, "ARRAY_FILE_ROOT", str(tmp_path))
+    stale = tmp_path / "call_old"
+    stale.mkdir()
+    os.utime(stale, (0, 0))
+    directory = rekordbox_bridge._array_file_dir("file")
+    assert not stale.exists()
+    descriptor = rekordbox_bridge._encode_array(np.arange(4, dtype=np.uint8), "file", directory)
+    assert os.path.dirname(descriptor["path"]) == directory
+    rekordbox_bridge._release_array_file_dir(directory)
+    assert os.path.exists(descriptor["path"])
+    assert rekordbox_bridge._array_file_dir("json") is None
+
+
+def test_batch_file_encoding_leaves_no_directory(bridge, tmp_path, monkeypatch):
+    monkeypatch.setattr(rekordbox_bridge, "ARRAY_FILE_ROOT", str(tmp_path / "arrays"))
+    result = bridge.get_anlz_data_batch(["/missing.mp3"], encoding="file")
+    assert result["success"], result.get("error")
+    assert os.listdir(tmp_path / "arrays") == []
+
+
+def test_relocate_auto_leaves_shared_target_for_review(bridge, tmp_path, monkeypatch):
+    first, second, third = bridge.db.get_content().limit(3).all()
+    for content, folder in ((first, "a"), (second, "b")):
+        content.FolderPath = f"/gone/{folder}/song.mp3"
+        content.FileSize = 10
+    third.FolderPath = None
+    third.FileNameL = None
+    bridge.db.commit()
+    root = tmp_path / "music"
+    root.mkdir()
+    (root / "song.mp3").write_bytes(b"0123456789")
+    ids = [str(c.ID) for c in (first, second, third)]
+    monkeypatch.setattr(bridge, "scan_missing", lambda **_: {
+        "success": True, "folders": [{"tracks": [{"id": cid} for cid in ids]}],
+    })
+    result = bridge.relocate_auto([str(root)], dry_run=True)
+    assert result["success"], result.get("error")
+    assert result["matched_count"] == 0
+    assert sorted(a["id"] for a in result["ambiguous"]) == sorted(ids[:2])
+    assert result["unmatched_count"] == 1
+
+
+def test_anlz_index_keys_match_analysis_paths(tmp_path):
+    anlz_dir = tmp_path / "share" / "PIONEER" / "USBANLZ" / "735" / "e8b81"
+    anlz_dir.mkdir(parents=True)
+    (anlz_dir / "ANLZ0000.DAT").write_bytes(b"")
+    index = rekordbox_bridge.AnlzIndex(str(tmp_path / "cache"))
+    assert index.rebuild(str(tmp_path / "share")) == 1
+    key = rekordbox_bridge.AnlzIndex.key_for("/PIONEER/USBANLZ/735/e8b81/ANLZ0000.DAT")
+    assert key == "/PIONEER/USBANLZ/735/e8b81"
+    assert index.analysis_dirs() == {key}
+    index.close()
+
+
+def test_backup_keeps_newest_snapshot_under_zero_policy(bridge):
+    zero = {"last": 0, "hourly": 0, "daily": 0, "weekly": 0}
+    for _ in range(2):
+        result = bridge.backup_database(bridge._db_file_path(), retention=zero)
+        assert result["success"], result.get("error")
+        assert os.path.exists(result["backup_path"])
+    assert rekordbox_bridge._retained_snapshots({"a": 1.0, "b": 2.0}, zero) == {"b"}
+
+
+def test_relocate_skips_tracks_whose_anlz_rewrite_failed(bridge, anlz_library, monkeypatch):
+    folder = "C:/Users/dylan/Music/PioneerDJ/Demo Tracks"
+    tracks = {c.FolderPath.rsplit("/", 1)[-1]: str(c.ID) for c in bridge.db.get_content()
+              if c.FolderPath.startswith(folder + "/")}
+    good, bad = tracks["Demo Track 1.mp3"], tracks["Demo Track 2.mp3"]
+    bad_dir = anlz_library[bad]
+    before = {name: open(os.path.join(bad_dir, name), "rb").read() for name in os.listdir(bad_dir)}
+
+    real_write = rekordbox_bridge.write_atomic
+
+    def failing_write(path, data):
+        # The DAT of the bad track is written, then its EXT fails
+        if str(path).startswith(bad_dir) and str(path).endswith(".EXT"):
+            raise OSError("disk full")
+        real_write(path, data)
+
+    monkeypatch.setattr(rekordbox_bridge, "write_atomic", failing_write)
+    result = bridge.relocate_prefix(folder, "D:/Music", verify=False)
+    assert result["success"], result.get("error")
+    assert result["relocated_count"] == 1
+    assert [e["id"] for e in result["errors"]] == [bad]
+
+    assert bridge.db.get_content(ID=good).FolderPath == "D:/Music/Demo Track 1.mp3"
+    assert _ppth(anlz_library[good]) == "D:/Music/Demo Track 1.mp3"
+    assert bridge.db.get_content(ID=bad).FolderPath == folder + "/Demo Track 2.mp3"
+    # The DAT written before the failure is restored and no originals are left behind
+    after = {name: open(os.path.join(bad_dir, name), "rb").read() for name in os.listdir(bad_dir)}
+    assert after == before
+    assert sorted(os.listdir(anlz_library[good])) == sorted(before)
+
+
+def test_relocate_restores_anlz_on_failed_commit(bridge, anlz_library, monkeypatch):
+    folder = "C:/Users/dylan/Music/PioneerDJ/Demo Tracks"
+    old_paths = {cid: _ppth(d) for cid, d in anlz_library.items()}
+    monkeypatch.setattr(bridge, "_safe_commit", lambda: "disk I/O error")
+    result = bridge.relocate_prefix(folder, "D:/Music", verify=False)
+    assert not result["success"]
+    assert result["anlz_restore_errors"] == []
+    assert {cid: _ppth(d) for cid, d in anlz_library.items()} == old_paths
+    for anlz_dir in anlz_library.values():
+        assert sorted(os.listdir(anlz_dir)) == ["ANLZ0000.2EX", "ANLZ0000.DAT", "ANLZ0000.EXT"]
+
+
+def test_relocate_prefix_in_process_pool(bridge, anlz_library):
+    result = bridge.relocate_prefix("C:/Users/dylan/Music/PioneerDJ", "D:/Music", verify=False)
+    assert result["success"], result.get("error")
+    assert result["relocated_count"] == len(anlz_library) == 6
+    for cid, anlz_dir in anlz_library.items():
+        path = bridge.db.get_content(ID=cid).FolderPath
+        assert path.startswith("D:/Music/")
+        assert _ppth(anlz_dir) == _ppth(anlz_dir, "EXT") == path
+        assert len(os.listdir(anlz_dir)) == 3
+
+
+@pytest.fixture
+def backup_store(tmp_path):
+    data = os.urandom(3 * rekordbox_bridge.BACKUP_CHUNK_SIZE + 100)
+    source = tmp_path / "master.db"
+    source.write_bytes(data)
+    return rekordbox_bridge.BackupStore(str(tmp_path / "backups")), source, data
+
+
+def test_backup_store_roundtrip_and_dedup(backup_store, tmp_path):
+    store, source, data = backup_store
+    first, new_bytes = store.create(str(source))
+    assert new_bytes == len(data)
+    second, new_bytes = store.create(str(source))
+    assert new_bytes == 0
+    assert second["chunks"] == first["chunks"]
+    target = tmp_path / "restored.db"
+    store.restore(first["name"], str(target))
+    assert target.read_bytes() == data
+
+
+def test_backup_store_detects_damaged_chunk(backup_store, tmp_path):
+    store, source, _ = backup_store
+    manifest, _ = store.create(str(source))
+    chunk_path = store._chunk_path(manifest["chunks"][1])
+    with open(chunk_path, "r+b") as f:
+        f.write(b"\x00\x01")
+    target = tmp_path / "restored.db"
+    with pytest.raises(ValueError, match="damaged"):
+        store.restore(manifest["name"], str(target))
+    assert not target.exists()
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(".tmp")]
+
+
+def test_backup_prune_keeps_chunks_of_unreadable_manifests(backup_store, tmp_path):
+    store, source, data = backup_store
+    other = tmp_path / "other.db"
+    other.write_bytes(os.urandom(len(data)))
+    kept, _ = store.create(str(other))
+    with open(store.manifest_path(kept["name"]), "w") as f:
+        f.write("{truncated")
+    store.create(str(source))
+    source.write_bytes(os.urandom(len(data)))
+    store.create(str(source))
+    deleted, freed = store.prune("master.db", {"last": 1})
+    assert len(deleted) == 1
+    assert freed == 0
+    assert all(os.path.exists(store._chunk_path(d)) for d in kept["chunks"])
+    # Without the damaged manifest its chunks and those of both older snapshots go
+    os.remove(store.manifest_path(kept["name"]))
+    source.write_bytes(os.urandom(len(data)))
+    store.create(str(source))
+    deleted, freed = store.prune("master.db", {"last": 1})
+    assert freed == 3 * len(data)
+
+
+def test_index_anlz_matches_library(bridge, anlz_library):
+    result = bridge.index_anlz()
+    assert result["success"], result.get("error")
+    assert (result["dir_count"], result["missing_analysis"], result["orphaned_dir_count"]) == (6, [], 0)
+    cid, anlz_dir = next(iter(anlz_library.items()))
+    shutil.move(anlz_dir, anlz_dir + "-moved")
+    result = bridge.index_anlz()
+    assert result["missing_analysis"] == [cid]
+    assert result["orphaned_dir_count"] == 1
+
+
+def test_anlz_cache_roundtrip(anlz_library, tmp_path):
+    anlz_dir = next(iter(anlz_library.values()))
+    decoded = rekordbox_bridge._decode_anlz_dir(anlz_dir)
+    signature = rekordbox_bridge._anlz_dir_signature(anlz_dir)
+    cache = rekordbox_bridge.AnlzCache(str(tmp_path / "cache"))
+    cache.put(anlz_dir, signature, decoded)
+    cached = cache.get(anlz_dir, signature)
+    np.testing.assert_array_equal(cached["waveform"], decoded["waveform"])
+    np.testing.assert_array_equal(cached["cues"], decoded["cues"])
+    assert cache.get(anlz_dir, signature + "x") is None
+    cache.close()
+
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    """Count the ANLZ directories decoded (inline, not in worker processes)."""
+    calls = []
+    real_decode = rekordbox_bridge._decode_anlz_dir
+
+    def counting_decode(anlz_dir):
+        calls.append(anlz_dir)
+        return real_decode(anlz_dir)
+
+    monkeypatch.setattr(rekordbox_bridge, "_decode_anlz_dir", counting_decode)
+    return calls
+
+
+def _track_path(bridge, name):
+    return next(c.FolderPath for c in bridge.db.get_content() if c.FolderPath.endswith("/" + name))
+
+
+@pytest.mark.parametrize("change", ["mtime", "size"])
+def test_get_anlz_data_cache_invalidated_on_reanalysis(bridge, anlz_library, decode_calls, change):
+    track_path = _track_path(bridge, "Demo Track 1.mp3")
+    first = bridge.get_anlz_data(track_path)
+    assert first["success"] and first["waveform"] is not None
+    assert bridge.get_anlz_data(track_path) == first
+    assert len(decode_calls) == 1
+
+    # Rekordbox rewrites the files of a re-analysed track
+    dat = os.path.join(decode_calls[0], "ANLZ0000.DAT")
+    if change == "mtime":
+        st = os.stat(dat)
+        os.utime(dat, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    else:
+        with open(dat, "ab") as f:
+            f.write(b"\x00")
+    assert bridge.get_anlz_data(track_path)["waveform"] == first["waveform"]
+    assert len(decode_calls) == 2
+
+
+def test_anlz_data_batch_case_folded_paths(bridge, anlz_library):
+    track_path = _track_path(bridge, "Demo Track 2.mp3")
+    expected = bridge.get_anlz_data(track_path)
+    requested = track_path.upper().replace("/", "\\")
+    result = bridge.get_anlz_data_batch([requested, "C:/not/in/library.mp3"])
+    assert result["success"], result.get("error")
+    data = result["tracks"][requested]
+    assert data == {k: expected[k] for k in ("waveform", "cues", "duration_ms")}
+    assert result["tracks"]["C:/not/in/library.mp3"]["waveform"] is None
+
+
+class _NoCache:
+    def __init__(self, *_):
+        raise OSError("no cache")
+
+
+def test_anlz_data_batch_streams_from_process_pool(bridge, anlz_library, monkeypatch):
+    track_paths = [c.FolderPath for c in bridge.db.get_content()]
+    # Decode each track on its own first, without populating the cache
+    monkeypatch.setattr(rekordbox_bridge, "AnlzCache", _NoCache)
+    expected = {path: bridge.get_anlz_data(path, encoding="base64") for path in track_paths}
+    monkeypatch.undo()
+
+    events = []
+    monkeypatch.setattr(rekordbox_bridge, "_emit_event", events.append)
+    result = bridge.get_anlz_data_batch(track_paths, stream=True, max_workers=2, encoding="base64")
+    assert result["success"], result.get("error")
+    assert (result["parsed_count"], result["cached_count"]) == (len(track_paths), 0)
+    assert "tracks" not in result
+    streamed = {e.pop("track_path"): e for e in events if e.pop("event") == "anlz"}
+    assert set(streamed) == set(track_paths)
+    for path, data in streamed.items():
+        assert data == {k: expected[path][k] for k in ("waveform", "cues", "duration_ms")}
+
+    # A second batch is served from the cache
+    result = bridge.get_anlz_data_batch(track_paths)
+    assert (result["parsed_count"], result["cached_count"]) == (0, len(track_paths))
+
+
+def _write_grid(anlz_dir, bpms, times_ms, first_beat_number=1):
+    """Replace the PQTZ grid of the DAT file with the given per-beat tempos and times."""
+    dat = os.path.join(anlz_dir, "ANLZ0000.DAT")
+    with open(dat, "rb") as f:
+        data = f.read()
+    tag = AnlzFile.parse(data).get_tag("PQTZ")
+    # Set the raw entries: PQTZAnlzTag.set truncates the times to whole ms
+    for i, (entry, bpm, time_ms) in enumerate(zip(tag.content.entries, bpms, times_ms)):
+        entry.beat = (i + first_beat_number - 1) % 4 + 1
+        entry.tempo = int(round(bpm * 100))
+        entry.time = int(time_ms)
+    rekordbox_bridge.write_atomic(dat, splice_tags(data, {"PQTZ": [tag.build()]}))
+
+
+@pytest.fixture
+def grid_dir(bridge, anlz_library):
+    """ANLZ directory of Demo Track 1 (database BPM 128) and its beat count."""
+    content = next(c for c in bridge.db.get_content() if c.FolderPath.endswith("Demo Track 1.mp3"))
+    anlz_dir = anlz_library[str(content.ID)]
+    return anlz_dir, len(AnlzFile.parse_file(os.path.join(anlz_dir, "ANLZ0000.DAT")).get_tag("PQTZ").content.entries)
+
+
+def test_beatgrid_stats_constant_grid(grid_dir):
+    anlz_dir, n = grid_dir
+    # 120 BPM from 250 ms, starting on beat 3: the first downbeat is two beats later
+    _write_grid(anlz_dir, [120.0] * n, 250 + 500 * np.arange(n), first_beat_number=3)
+    stats = rekordbox_bridge._beatgrid_stats(anlz_dir)
+    assert stats["source"] == "PQTZ"
+    assert stats["beat_count"] == n
+    assert (stats["bpm_avg"], stats["bpm_min"], stats["bpm_max"]) == (120.0, 120.0, 120.0)
+    assert (stats["tempo_changes"], stats["variable_bpm"]) == (0, False)
+    assert stats["drift_ms"] == pytest.approx(0, abs=1e-6)
+    assert stats["grid_error_ms"] == pytest.approx(0, abs=1e-6)
+    assert (stats["first_beat_ms"], stats["first_downbeat_ms"]) == (250.0, 1250.0)
+
+
+def test_beatgrid_stats_variable_tempo(grid_dir):
+    anlz_dir, n = grid_dir
+    half = n // 2
+    bpms = [120.0] * half + [125.0] * (n - half)
+    times = np.concatenate([500 * np.arange(half), 500 * half + 480 * np.arange(n - half)])
+    _write_grid(anlz_dir, bpms, times)
+    stats = rekordbox_bridge._beatgrid_stats(anlz_dir)
+    assert (stats["tempo_changes"], stats["variable_bpm"]) == (1, True)
+    assert (stats["bpm_min"], stats["bpm_max"]) == (120.0, 125.0)
+    # The beats follow their tempos, but bend away from a single straight grid
+    assert stats["grid_error_ms"] == pytest.approx(0, abs=1e-6)
+    assert stats["drift_ms"] > 500
+    assert stats["first_downbeat_ms"] == 0.0
+
+
+def test_beatgrid_stats_drifting_beat(grid_dir):
+    anlz_dir, n = grid_dir
+    times = 500 * np.arange(n)
+    times[n // 2:] += 20
+    _write_grid(anlz_dir, [120.0] * n, times)
+    stats = rekordbox_bridge._beatgrid_stats(anlz_dir)
+    assert stats["grid_error_ms"] == pytest.approx(20)
+    assert 5 < stats["drift_ms"] < 20
+
+
+def test_analyze_beatgrids_bpm_mismatch(bridge, grid_dir):
+    anlz_dir, n = grid_dir
+    _write_grid(anlz_dir, [120.0] * n, 500 * np.arange(n))
+    result = bridge.analyze_beatgrids()
+    assert result["success"], result.get("error")
+    assert result["analysed_count"] == 2
+    assert result["no_grid_count"] == 4
+
+    tracks = bridge.query_beatgrids(min_bpm_mismatch=1)["tracks"]
+    assert [(t["anlz_dir"], t["db_bpm"], t["bpm_mismatch"]) for t in tracks] == [(anlz_dir, 128.0, 8.0)]
+    # Unchanged grids are not decoded again
+    assert bridge.analyze_beatgrids()["analysed_count"] == 0
+
+
+def test_waveform_pyramid_buckets():
+    rng = np.random.default_rng(0)
+    heights = rng.integers(0, 32, 1000).astype(np.uint8)
+    colors = rng.integers(0, 8, (1000, 3)).astype(np.uint8)
+    levels = rekordbox_bridge._waveform_pyramid(heights, colors)
+    assert len(levels) == len(rekordbox_bridge.WAVEFORM_BUCKET_SIZES)
+    for size, buckets in zip(rekordbox_bridge.WAVEFORM_BUCKET_SIZES, levels):
+        assert len(buckets) == -(-len(heights) // size)
+        for i, bucket in enumerate(buckets):
+            h = heights[i * size:(i + 1) * size].astype(np.float64)
+            c = colors[i * size:(i + 1) * size].astype(np.float64)
+            assert (bucket["min"], bucket["max"]) == (h.min(), h.max())
+            assert bucket["rms"] == np.rint(np.sqrt(np.mean(h * h)))
+            assert [bucket["r"], bucket["g"], bucket["b"]] == np.rint(c.mean(axis=0)).tolist()
+
+
+def test_decode_detail_waveform_pwv5_and_pwv3(anlz_library, tmp_path):
+    anlz_dir = next(iter(anlz_library.values()))
+    ext = AnlzFile.parse_file(os.path.join(anlz_dir, "ANLZ0000.EXT"))
+    source, heights, colors = rekordbox_bridge._decode_detail_waveform(anlz_dir)
+    assert source == "PWV5"
+    raw_heights, _ = ext.get_tag("PWV5").get()
+    np.testing.assert_array_equal(heights, np.rint(raw_heights * 31))
+    x = np.asarray(ext.get_tag("PWV5").content.entries, dtype=np.int64)
+    np.testing.assert_array_equal(colors, np.stack([x >> 13 & 7, x >> 10 & 7, x >> 7 & 7], axis=1))
+
+    # Without PWV5 the monochrome PWV3 detail is used
+    pwv3_dir = tmp_path / "pwv3"
+    pwv3_dir.mkdir()
+    with open(os.path.join(anlz_dir, "ANLZ0000.EXT"), "rb") as f:
+        (pwv3_dir / "ANLZ0000.EXT").write_bytes(f.read().replace(b"PWV5", b"PWVX", 1))
+    source, heights, colors = rekordbox_bridge._decode_detail_waveform(str(pwv3_dir))
+    assert source == "PWV3"
+    raw_heights, whiteness = ext.get_tag("PWV3").get()
+    np.testing.assert_array_equal(heights, raw_heights)
+    np.testing.assert_array_equal(colors, np.repeat(whiteness[:, None], 3, axis=1))
+
+
+@pytest.fixture
+def slice_track(bridge, anlz_library):
+    """Demo Track 1 and its raw detail heights."""
+    track_path = _track_path(bridge, "Demo Track 1.mp3")
+    cid = next(str(c.ID) for c in bridge.db.get_content() if c.FolderPath == track_path)
+    _, heights, _ = rekordbox_bridge._decode_detail_waveform(anlz_library[cid])
+    return track_path, heights
+
+
+@pytest.mark.parametrize("px_per_sec,level", [(None, 0), (1000, 0), (150, 0), (40, 1), (12, 2), (0.5, 6)])
+def test_waveform_slice_level_selection(bridge, slice_track, px_per_sec, level):
+    track_path, heights = slice_track
+    waveform = bridge.get_waveform_slice(track_path, px_per_sec=px_per_sec)["waveform"]
+    size = rekordbox_bridge.WAVEFORM_BUCKET_SIZES[level]
+    assert waveform["level"] == level
+    assert waveform["px_per_sec"] == 150 / size
+    assert waveform["bucket_count"] == len(waveform["min"]) == -(-len(heights) // size)
+
+
+def test_waveform_slice_values_and_bounds(bridge, slice_track):
+    track_path, heights = slice_track
+    result = bridge.get_waveform_slice(track_path, start_ms=1000, end_ms=2000)
+    assert result["success"], result.get("error")
+    waveform = result["waveform"]
+    assert (waveform["start_index"], waveform["start_ms"]) == (150, 1000.0)
+    assert waveform["min"] == waveform["max"] == waveform["rms"] == heights[150:300].tolist()
+
+    # Out-of-range requests are clamped to the track
+    waveform = bridge.get_waveform_slice(track_path, start_ms=-500, end_ms=10**9)["waveform"]
+    assert waveform["start_index"] == 0
+    assert len(waveform["min"]) == len(heights)
+    waveform = bridge.get_waveform_slice(track_path, start_ms=10**9)["waveform"]
+    assert (waveform["start_index"], waveform["min"]) == (len(heights), [])
+    waveform = bridge.get_waveform_slice(track_path, start_ms=2000, end_ms=1000)["waveform"]
+    assert (waveform["start_index"], waveform["min"]) == (300, [])
+
+
+def _reference_smart_fixes(data, fixes):
+    """The per-track regex chain apply_smart_fixes used before the fixes were compiled."""
+    import re
+
+    track_changed = False
+    if fixes.get('extractArtistEnabled'):
+        separator = fixes.get('extractArtistSeparator', ' - ')
+        result_number = fixes.get('extractArtistResultNumber', 1) - 1
+        if data['Name'] and separator in data['Name']:
+            parts = data['Name'].split(separator)
+            if 0 <= result_number < len(parts):
+                extracted_artist = parts[result_number].strip()
+                if extracted_artist and not data['Artist']:
+                    data['Artist'] = extracted_artist
+                    parts.pop(result_number)
+                    data['Name'] = separator.join(parts).strip()
+                    track_changed = True
+    if fixes.get('replaceCharsEnabled'):
+        for char in fixes.get('replaceCharsList', '_'):
+            for field in ['Name', 'Artist', 'Album', 'Genre', 'Comments', 'Label']:
+                if data[field]:
+                    data[field] = data[field].replace(char, ' ')
+                    track_changed = True
+    if fixes.get('removeGarbageEnabled'):
+        for field in fixes.get('removeGarbageFields', []):
+            if field in data and data[field]:
+                data[field] = re.sub(r'\s+', ' ', data[field])
+                data[field] = re.sub(r'^[\s\[\]\|\-]+|[\s\[\]\|\-]+$', '', data[field])
+                track_changed = True
+    if fixes.get('addRemixParenthesisEnabled'):
+        remix_pattern = r'\s*-\s*(.*?)(?:mix|remix|version|edit)$'
+        for field in fixes.get('addRemixParenthesisFields', []):
+            if field in data and data[field]:
+                match = re.search(remix_pattern, data[field], re.IGNORECASE)
+                if match and '(' not in data[field]:
+                    remix_text = match.group(1).strip()
+                    data[field] = re.sub(remix_pattern, '', data[field], flags=re.IGNORECASE).strip()
+                    data[field] += f' ({remix_text})'
+                    track_changed = True
+    if fixes.get('extractRemixerEnabled') and data['Name']:
+        for pattern in [
+            r'\(([^)]+?)(?:extended|club|dance|radio)?\s*(?:remix|mix|version|edit)\)',
+            r'\(([^)]+?)\s+(?:extended|club|dance|radio)?\s*(?:remix|mix|version|edit)\)',
+        ]:
+            match = re.search(pattern, data['Name'], re.IGNORECASE)
+            if match:
+                remixer = match.group(1).strip()
+                if not any(w in remixer.lower() for w in ['original', 'radio', 'club', 'dance', 'extended']):
+                    data['Remixer'] = remixer
+                    data['Name'] = re.sub(pattern, '', data['Name'], flags=re.IGNORECASE).strip()
+                    data['Name'] = re.sub(r'\(\s*\)', '', data['Name'])
+                    data['Name'] = re.sub(r'\s+', ' ', data['Name']).strip()
+                    track_changed = True
+                    break
+    if fixes.get('removeUrlsEnabled'):
+        url_pattern = r'https?://[^\s]+'
+        for field in fixes.get('removeUrlsFields', []):
+            if field in data and data[field]:
+                if fixes.get('removeUrlsDeleteAll'):
+                    if re.search(url_pattern, data[field]):
+                        data[field] = ''
+                        track_changed = True
+                else:
+                    original = data[field]
+                    data[field] = re.sub(url_pattern, '', data[field]).strip()
+                    if original != data[field]:
+                        track_changed = True
+    if fixes.get('fixCasingEnabled'):
+        for field in fixes.get('fixCasingFields', []):
+            if field in data and data[field]:
+                if data[field].isupper() or data[field].islower():
+                    data[field] = data[field].title()
+                    track_changed = True
+    if fixes.get('removeNumberPrefixEnabled'):
+        for field in fixes.get('removeNumberPrefixFields', []):
+            if field in data and data[field]:
+                for pattern in [r'^\d+\.\s*', r'^\(\d+\)\s*', r'^\d+\s*-\s*', r'^\[\d+\]\s*']:
+                    data[field] = re.sub(pattern, '', data[field])
+                    track_changed = True
+    return track_changed
+
+
+_SMART_FIX_TRACKS = [
+    ("01. Some_Title - Extended Mix", "", "BEST_OF", "house", "see http://example.com now", "[label] |"),
+    ("Artist One - Track (Someone Remix)", "", "", "", "", ""),
+    ("(03) track name (Original Mix)", "DJ X", "album - radio edit", "", "https://a.b", ""),
+    ("[12] Tune (Club Remix) ()", "dj y", "", "TECHNO", "", "  - Label -  "),
+    ("Plain Title", "Artist", "Album", "Genre", "", "Label"),
+    ("", "", "", "", "", ""),
+]
+_ALL_FIELDS = ["Name", "Artist", "Album", "Genre", "Comments", "Label"]
+
+
+@pytest.mark.parametrize("fixes", [
+    {"extractArtistEnabled": True},
+    {"extractArtistEnabled": True, "extractArtistSeparator": " - ", "extractArtistResultNumber": 2},
+    {"replaceCharsEnabled": True},
+    {"replaceCharsEnabled": True, "replaceCharsList": "_|"},
+    {"removeGarbageEnabled": True, "removeGarbageFields": _ALL_FIELDS},
+    {"addRemixParenthesisEnabled": True, "addRemixParenthesisFields": ["Name", "Album"]},
+    {"extractRemixerEnabled": True},
+    {"removeUrlsEnabled": True, "removeUrlsFields": ["Comments", "Label"]},
+    {"removeUrlsEnabled": True, "removeUrlsDeleteAll": True, "removeUrlsFields": ["Comments"]},
+    {"fixCasingEnabled": True, "fixCasingFields": _ALL_FIELDS},
+    {"removeNumberPrefixEnabled": True, "removeNumberPrefixFields": ["Name"]},
+    {
+        "extractArtistEnabled": True, "replaceCharsEnabled": True,
+        "removeGarbageEnabled": True, "removeGarbageFields": _ALL_FIELDS,
+        "addRemixParenthesisEnabled": True, "addRemixParenthesisFields": ["Name"],
+        "extractRemixerEnabled": True,
+        "removeUrlsEnabled": True, "removeUrlsFields": ["Comments"],
+        "fixCasingEnabled": True, "fixCasingFields": _ALL_FIELDS,
+        "removeNumberPrefixEnabled": True, "removeNumberPrefixFields": ["Name"],
+    },
+])
+def test_compiled_smart_fixes_match_reference(fixes):
+    apply_fixes = rekordbox_bridge._compile_smart_fixes(fixes)
+    for values in _SMART_FIX_TRACKS:
+        track = dict(zip(_ALL_FIELDS, values), TrackID="1", Remixer="")
+        expected = dict(track)
+        expected_changed = _reference_smart_fixes(expected, fixes)
+        assert apply_fixes(track) == expected_changed
+        assert track == expected
+
+
+def test_integrity_quick_check_cached(bridge):
+    result = bridge.check_database_integrity("quick")
+    assert result["success"], result.get("error")
+    assert (result["integrity_ok"], result["complete"], result["message"]) == (True, True, "ok")
+    assert "cached" not in result
+    assert bridge.check_database_integrity("quick")["cached"] is True
+    assert "cached" not in bridge.check_database_integrity("quick", restart=True)
+
+
+def test_integrity_table_scan_resumes_and_restarts(bridge, monkeypatch):
+    monkeypatch.setattr(rekordbox_bridge, "INTEGRITY_RANGE_ROWS", 20)
+    events = []
+    monkeypatch.setattr(rekordbox_bridge, "_emit_event", events.append)
+
+    def run_slice(restart=False):
+        before = len(events)
+        result = bridge.check_database_integrity("tables", restart=restart, time_budget=1e-9, stream=True)
+        assert result["success"], result.get("error")
+        return result, [(e["table"], e["rowid"]) for e in events[before:]]
+
+    # Each slice checks one range and stops
+    result, first = run_slice()
+    assert (result["complete"], result["integrity_ok"]) == (False, None)
+    assert len(first) == 1
+    seen = list(first)
+    slices = 1
+    while not result["complete"]:
+        result, ranges = run_slice()
+        assert len(ranges) <= 1
+        seen.extend(ranges)
+        slices += 1
+    assert slices > 2
+    assert (result["integrity_ok"], result["bad_ranges"]) == (True, [])
+    assert bridge.check_database_integrity("tables")["cached"] is True
+
+    # restart ignores the cached result and the saved progress
+    result, ranges = run_slice(restart=True)
+    assert not result["complete"]
+    assert ranges == first
+
+    # Resuming read every range of an uninterrupted scan exactly once
+    before = len(events)
+    result = bridge.check_database_integrity("tables", restart=True, stream=True)
+    assert result["complete"]
+    assert seen == [(e["table"], e["rowid"]) for e in events[before:]]
+
+
+@pytest.mark.parametrize("query,titles", [
+    ("demo", ["Demo Track 1", "Demo Track 2"]),
+    ("dem tr", ["Demo Track 1", "Demo Track 2"]),
+    ("demo 2", ["Demo Track 2"]),
+    ("track noise", []),
+    ("loopm", ["Demo Track 1", "Demo Track 2"]),
+    ("si", ["SINEWAVE", "SIREN"]),
+    ("!!", []),
+    ("- ...", []),
+    ("demo !!", ["Demo Track 1", "Demo Track 2"]),
+    ('de"mo', []),
+])
+def test_search_content_prefix_and_terms(bridge, query, titles):
+    result = bridge.search_content(query)
+    assert result["success"], result.get("error")
+    found = sorted(bridge.db.get_content(ID=cid).Title for cid in result["ids"])
+    assert found == titles
+
+
+def test_fts_query_quotes_terms():
+    assert rekordbox_bridge.LibraryIndex.fts_query('a "b" !! c*') == '"a"* """b"""* "c*"*'
+    assert rekordbox_bridge.LibraryIndex.fts_query(" ?! ") == ""
+
+
+def _point_tracks_at(bridge, paths):
+    """Set the FolderPath of the test tracks, in ID order, to ``paths`` (None clears it)."""
+    contents = sorted(bridge.db.get_content(), key=lambda c: int(c.ID))
+    for content, path in zip(contents, paths):
+        content.FolderPath = None if path is None else str(path).replace("\\", "/")
+    bridge.db.commit()
+    return [str(c.ID) for c in contents]
+
+
+def test_find_duplicate_files_escalates_sample_collisions(bridge, tmp_path, monkeypatch):
+    sample = rekordbox_bridge.DIGEST_SAMPLE_SIZE
+    head, tail = b"h" * sample, b"t" * sample
+    original = head + b"A" * 1000 + tail
+    files = {name: tmp_path / name for name in ("a.wav", "b.wav", "c.wav", "d.wav")}
+    files["a.wav"].write_bytes(original)
+    files["b.wav"].write_bytes(original)
+    # Same size, head and tail as a.wav: only the full hash tells it apart
+    files["c.wav"].write_bytes(head + b"B" * 1000 + tail)
+    files["d.wav"].write_bytes(original + b"x")
+    ids = _point_tracks_at(bridge, [*files.values(), tmp_path / "gone.wav", None])
+
+    full_hashed = []
+    full_digest = rekordbox_bridge._full_digest
+
+    def counting_full_digest(path):
+        full_hashed.append(os.path.basename(path))
+        return full_digest(path)
+
+    monkeypatch.setattr(rekordbox_bridge, "_full_digest", counting_full_digest)
+
+    result = bridge.find_duplicate_files()
+    assert result["success"], result.get("error")
+    assert sorted(full_hashed) == ["a.wav", "b.wav", "c.wav"]
+    assert result["hashed_bytes"] == 3 * 2 * sample + 3 * len(original)
+    assert result["missing_count"] == 1
+    assert result["group_count"] == 1
+    group = result["groups"][0]
+    assert [f["path"].rsplit("/", 1)[-1] for f in group["files"]] == ["a.wav", "b.wav"]
+    assert [f["content_ids"] for f in group["files"]] == [[ids[0]], [ids[1]]]
+    assert group["wasted_bytes"] == len(original)
+
+    # Unchanged files are served from the digest cache
+    full_hashed.clear()
+    rerun = bridge.find_duplicate_files()
+    assert rerun["success"], rerun.get("error")
+    assert rerun["hashed_bytes"] == 0
+    assert full_hashed == []
+    assert rerun["groups"] == result["groups"]
+
+    # A rewritten file (same size, new mtime) is hashed again; the others stay cached
+    files["c.wav"].write_bytes(original)
+    st = os.stat(files["c.wav"])
+    os.utime(files["c.wav"], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    rerun = bridge.find_duplicate_files()
+    assert rerun["success"], rerun.get("error")
+    assert full_hashed == ["c.wav"]
+    assert rerun["hashed_bytes"] == 2 * sample + len(original)
+    assert [len(g["files"]) for g in rerun["groups"]] == [3]
+
+
+def _age_directory(path, mtime_s):
+    """Set a directory's mtime to a fixed time in the past, old enough to be cached."""
+    os.utime(path, (mtime_s, mtime_s))
+
+
+def test_scan_missing_groups_by_folder(bridge, tmp_path):
+    album, other = tmp_path / "album", tmp_path / "other"
+    album.mkdir()
+    other.mkdir()
+    (album / "one.wav").write_bytes(b"1")
+    (other / "three.wav").write_bytes(b"3")
+    ids = _point_tracks_at(bridge, [
+        album / "one.wav", album / "two.wav", album / "four.wav",
+        other / "three.wav", tmp_path / "gone" / "five.wav", None,
+    ])
+
+    result = bridge.scan_missing()
+    assert result["success"], result.get("error")
+    assert result["track_count"] == 5
+    assert result["folder_count"] == 3
+    assert result["missing_count"] == 3
+    folders = [
+        (f["folder"].rsplit("/", 1)[-1], f["folder_exists"], sorted(t["id"] for t in f["tracks"]))
+        for f in result["folders"]
+    ]
+    assert folders == [
+        ("album", True, sorted([ids[1], ids[2]])),
+        ("gone", False, [ids[4]]),
+    ]
+
+
+def test_scan_missing_relists_directory_when_mtime_changes(bridge, tmp_path):
+    album = tmp_path / "album"
+    album.mkdir()
+    (album / "one.wav").write_bytes(b"1")
+    _point_tracks_at(bridge, [album / "one.wav", album / "two.wav", None, None, None, None])
+    _age_directory(album, 1_000_000)
+
+    def missing_names():
+        result = bridge.scan_missing()
+        assert result["success"], result.get("error")
+        return sorted(t["path"].rsplit("/", 1)[-1] for f in result["folders"] for t in f["tracks"])
+
+    assert missing_names() == ["two.wav"]
+
+    # Same mtime: the cached listing is trusted, so a change behind its back goes unseen
+    (album / "two.wav").write_bytes(b"2")
+    _age_directory(album, 1_000_000)
+    assert missing_names() == ["two.wav"]
+
+    # New mtime: the directory is listed again
+    _age_directory(album, 1_000_100)
+    assert missing_names() == []
+    (album / "one.wav").unlink()
+    _age_directory(album, 1_000_200)
+    assert missing_names() == ["one.wav"]
+
+
+def test_scan_missing_does_not_cache_recent_listings(bridge, tmp_path):
+    album = tmp_path / "album"
+    album.mkdir()
+    _point_tracks_at(bridge, [album / "one.wav", None, None, None, None, None])
+    assert bridge.scan_missing()["missing_count"] == 1
+
+    # The directory was modified just now, so a same-tick change must still be seen
+    mtime_ns = os.stat(album).st_mtime_ns
+    (album / "one.wav").write_bytes(b"1")
+    os.utime(album, ns=(mtime_ns, mtime_ns))
+    assert bridge.scan_missing()["missing_count"] == 0
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark for unmasking garbled (exported) PSSI song structure tags.
+
+Compares the vectorized pyrekordbox unmask against the old per-byte loop.
+Usage: python tools/bench_pssi_unmask.py [len_entries] [repeats]
+"""
+
+import sys
+import os
+import timeit
+
+# Add pyrekordbox to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pyrekordbox-0.4.4'))
+
+import numpy as np
+from construct import Int16ub
+from pyrekordbox.anlz.file import XOR_MASK, unmask_pssi
+
+
+def unmask_pssi_loop(tag_data, len_tag):
+    """Per-byte implementation previously used by AnlzFile._parse"""
+    len_entries = Int16ub.parse(tag_data[16:18])
+    data = bytearray(tag_data[:len_tag])
+    for x in range(len(data) - 18):
+        mask = XOR_MASK[x % len(XOR_MASK)] + len_entries
+        if mask > 255:
+            mask -= 256
+        data[18 + x] ^= mask
+    return bytes(data)
+
+
+def make_tag(len_entries):
+    len_tag = 32 + 24 * len_entries
+    header = b"PSSI" + (32).to_bytes(4, "big") + len_tag.to_bytes(4, "big")
+    header += (24).to_bytes(4, "big") + len_entries.to_bytes(2, "big")
+    body = np.random.default_rng(0).integers(0, 256, len_tag - len(header), dtype=np.uint8)
+    return header + body.tobytes(), len_tag
+
+
+def main():
+    len_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    tag_data, len_tag = make_tag(len_entries)
+    assert unmask_pssi(tag_data, len_tag) == unmask_pssi_loop(tag_data, len_tag)
+
+    t_loop = timeit.timeit(lambda: unmask_pssi_loop(tag_data, len_tag), number=repeats)
+    t_vec = timeit.timeit(lambda: unmask_pssi(tag_data, len_tag), number=repeats)
+    print(f"PSSI tag: {len_entries} entries ({len_tag} bytes), {repeats} repeats")
+    print(f"  per-byte loop: {t_loop / repeats * 1e6:8.1f} us/tag")
+    print(f"  vectorized:    {t_vec / repeats * 1e6:8.1f} us/tag")
+    print(f"  speedup:       {t_loop / t_vec:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()